@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Batch Analytics
+Vectorized classification and per-period reports over measurement arrays
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from classification import (
+    CATEGORIES, DIASTOLIC_CODES, DIASTOLIC_THRESHOLDS, SYSTOLIC_THRESHOLDS
+)
+
+PERIODS = ('day', 'week', 'month')
+
+# Home-monitoring convention: morning readings 04:00-11:59,
+# evening readings 18:00-23:59 (local time)
+MORNING_HOURS = (4, 12)
+EVENING_HOURS = (18, 24)
+
+_SYSTOLIC_THRESHOLDS = np.array(SYSTOLIC_THRESHOLDS)
+_DIASTOLIC_THRESHOLDS = np.array(DIASTOLIC_THRESHOLDS)
+_DIASTOLIC_CODES = np.array(DIASTOLIC_CODES, dtype=np.uint8)
+
+
+def classify_codes(systolic, diastolic):
+    """Category codes (uint8, see classification.CATEGORIES) for whole arrays"""
+    sys_codes = np.searchsorted(_SYSTOLIC_THRESHOLDS, systolic, side='right')
+    dia_codes = _DIASTOLIC_CODES[
+        np.searchsorted(_DIASTOLIC_THRESHOLDS, diastolic, side='right')
+    ]
+    return np.maximum(sys_codes, dia_codes).astype(np.uint8)
+
+
+def category_records(codes):
+    """Shared category records for an array of codes"""
+    return [CATEGORIES[c] for c in codes.tolist()]
+
+
+def load_columns(store, address=None, start=None, end=None):
+    """Columnar arrays (ts, systolic, diastolic, pulse) straight from the store"""
+    rows = store.columns(address, start, end)
+    table = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    return {
+        'ts': table[:, 0],
+        'systolic': table[:, 1],
+        'diastolic': table[:, 2],
+        'pulse': table[:, 3],
+    }
+
+
+def _period_keys(local_ts, period):
+    if period == 'day':
+        return (local_ts // 86400).astype(np.int64)
+    if period == 'week':
+        # 1970-01-01 was a Thursday; shift so weeks start on Monday
+        return ((local_ts // 86400 + 3) // 7).astype(np.int64)
+    if period == 'month':
+        return local_ts.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+
+
+def _period_start(key, period):
+    if period == 'day':
+        return np.datetime64(int(key) * 86400, 's')
+    if period == 'week':
+        return np.datetime64((int(key) * 7 - 3) * 86400, 's')
+    return np.datetime64(int(key), 'M').astype('datetime64[s]')
+
+
+def _grouped_mean(values, groups, n, mask=None):
+    weights = np.ones_like(values) if mask is None else mask.astype(np.float64)
+    counts = np.bincount(groups, weights=weights, minlength=n)
+    sums = np.bincount(groups, weights=values * weights, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts, counts
+
+
+def _grouped_std(values, groups, n, mean, counts):
+    """
+    Sample standard deviation per group, as stats.RollingWindow reports it
+
+    Two passes over deviations from the group mean; E[x²] - E[x]² loses
+    the variance to cancellation when it is small next to the mean.
+    """
+    deviation = values - mean[groups]
+    squares = np.bincount(groups, weights=deviation * deviation, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 1, np.sqrt(squares / (counts - 1)), 0.0)
+
+
+def summarize(ts, systolic, diastolic, pulse, period='day', utc_offset=0):
+    """
+    Per-period aggregates computed from the same columnar arrays
+
+    Each period reports means and standard deviations (variability),
+    separate morning and evening means, and the share of readings in
+    each category.
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    if ts.size == 0:
+        return []
+    systolic = np.asarray(systolic, dtype=np.float64)
+    diastolic = np.asarray(diastolic, dtype=np.float64)
+    pulse = np.asarray(pulse, dtype=np.float64)
+
+    local_ts = ts + utc_offset
+    keys, groups = np.unique(_period_keys(local_ts, period), return_inverse=True)
+    n = len(keys)
+    hours = (local_ts % 86400) // 3600
+    morning = (hours >= MORNING_HOURS[0]) & (hours < MORNING_HOURS[1])
+    evening = (hours >= EVENING_HOURS[0]) & (hours < EVENING_HOURS[1])
+
+    counts = np.bincount(groups, minlength=n)
+    stats = {}
+    for name, values in (('systolic', systolic), ('diastolic', diastolic), ('pulse', pulse)):
+        mean, _ = _grouped_mean(values, groups, n)
+        stats[name] = (mean, _grouped_std(values, groups, n, mean, counts))
+
+    morning_sys, morning_n = _grouped_mean(systolic, groups, n, morning)
+    morning_dia, _ = _grouped_mean(diastolic, groups, n, morning)
+    evening_sys, evening_n = _grouped_mean(systolic, groups, n, evening)
+    evening_dia, _ = _grouped_mean(diastolic, groups, n, evening)
+
+    codes = classify_codes(systolic, diastolic)
+    per_category = np.bincount(
+        groups * len(CATEGORIES) + codes, minlength=n * len(CATEGORIES)
+    ).reshape(n, len(CATEGORIES))
+    shares = per_category / counts[:, None]
+
+    def _round(value):
+        return None if np.isnan(value) else round(float(value), 1)
+
+    report = []
+    for i, key in enumerate(keys):
+        report.append({
+            'period_start': str(_period_start(key, period)),
+            'count': int(counts[i]),
+            **{
+                name: {'mean': _round(mean[i]), 'std': _round(std[i])}
+                for name, (mean, std) in stats.items()
+            },
+            'morning': {
+                'count': int(morning_n[i]),
+                'systolic': _round(morning_sys[i]),
+                'diastolic': _round(morning_dia[i]),
+            },
+            'evening': {
+                'count': int(evening_n[i]),
+                'systolic': _round(evening_sys[i]),
+                'diastolic': _round(evening_dia[i]),
+            },
+            'categories': {
+                CATEGORIES[c]['level']: round(float(shares[i, c]), 3)
+                for c in range(len(CATEGORIES))
+            },
+        })
+    return report
+
+
+def main():
+    """Print a per-period report for the stored history"""
+    from store import MeasurementStore, DEFAULT_DB_PATH
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    parser.add_argument('--address')
+    parser.add_argument('--period', choices=PERIODS, default='week')
+    parser.add_argument('--days', type=float, default=365,
+                        help='how far back to look (default: 365)')
+    args = parser.parse_args()
+
+    store = MeasurementStore(args.db)
+    try:
+        columns = load_columns(store, args.address, time.time() - args.days * 86400)
+    finally:
+        store.close()
+    report = summarize(
+        columns['ts'], columns['systolic'], columns['diastolic'], columns['pulse'],
+        args.period, time.localtime().tm_gmtoff
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
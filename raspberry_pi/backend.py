@@ -4,227 +4,243 @@ Health Pad - Raspberry Pi Backend
 Bluetooth connection to iHealth KN-550BT device
 """
 
+import startup  # first, so the import phase below is timed from here
 import asyncio
+import functools
 import json
 import logging
+import os
+import time
+import zlib
 from datetime import datetime
-from bleak import BleakScanner, BleakClient
+from email.utils import formatdate
+import aiohttp
 from aiohttp import web
 import aiohttp_cors
+import capture
+from decoder import decode
+from broadcaster import Broadcaster
+from classification import CATEGORIES, classify_bp, classify_code
+from devices import DeviceManager
+from gatt_cache import GattCache
+from gatt_uuids import STANDARD_CHAR_UUID
+from history_sync import HistorySync
+from ingest import IngestQueue
+import log_pipeline
+import metrics
+from scanner import AdvertisementScanner
+from stats import StatsEngine
+from store import MeasurementStore
+from supervisor import ConnectionSupervisor
+from shm_ring import ReadingRing
+import static_assets
+from tracing import Tracer
+import transport
+import wire
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+startup.PROFILE.begin('imports', at=startup.IMPORTED)
+startup.PROFILE.expect('backend', 'http')
+startup.PROFILE.done('imports')
+
+# Configure logging: records are written by a background thread
+log_pipeline.setup_logging()
 logger = logging.getLogger(__name__)
+packet_logger = logging.getLogger(log_pipeline.PACKET_LOGGER)
+
+# 'standalone', or this process's part in multi-process mode (multiproc.py)
+ROLE = os.environ.get('HEALTHPAD_ROLE', 'standalone')
 
 # iHealth device configuration
 IHEALTH_DEVICE_NAME = "KN-550BT"
 
-# iHealth KN-550BT uses custom UUIDs (not standard BLE)
-# Service UUID: com.jiuan.dev (custom UUID)
-IHEALTH_SERVICE_UUID = "6d6f2e6a-6975-616e-2e64-657600000000"  # Custom iHealth service
+class HealthPadBackend:
+    def __init__(self):
+        self.gatt_cache = GattCache()
+        self.scanner = AdvertisementScanner()
+        self.devices = DeviceManager(
+            self.measurement_callback, self.gatt_cache, self.scanner.ble_device
+        )
+        self.supervisor = ConnectionSupervisor(self.devices, self.scanner)
+        self.store = MeasurementStore()
+        self.last_measurement = self.store.latest()
+        if self.last_measurement:
+            self.last_measurement['classification'] = self.classify_bp(
+                self.last_measurement['systolic'],
+                self.last_measurement['diastolic']
+            )
+        # Catches up with the store in the background once started
+        self.stats = StatsEngine(store=self.store)
+        self.history = HistorySync(self.store, classify=self.classify_bp, stats=self.stats)
+        # Syncs started on connect; held so they are neither collected
+        # mid-download nor left writing once the store is closed
+        self.history_tasks = set()
+        self.devices.add_listener(self._on_device_event)
+        self.broadcaster = Broadcaster()
+        self.tracer = Tracer()
+        self.ingest = IngestQueue(self.process_notification)
+        # HEALTHPAD_CAPTURE=<file>: raw notifications for capture.py replay
+        self.capture = capture.from_env()
+        # Acquisition process: readings also go to the web workers
+        self.ring = ReadingRing.attach(os.environ['HEALTHPAD_RING']) if ROLE == 'acquisition' else None
+        metrics.CONNECTED_DEVICES.source = lambda: self.devices.connected_count
+        metrics.WEBSOCKET_CLIENTS.source = lambda: len(self.broadcaster)
+        metrics.INGEST_BACKLOG.source = lambda: len(self.ingest)
 
-# Characteristic UUIDs
-IHEALTH_SEND_CHAR = "7365642e-6a69-7561-6e2e-646576000000"      # sed.* (send to phone)
-IHEALTH_RECEIVE_CHAR = "7265632e-6a69-7561-6e2e-646576000000"    # rec.* (receive from phone)
+    async def scan_devices(self, include_all=False):
+        """iHealth devices from the background scanner's advertisement index"""
+        started = time.perf_counter()
+        if not self.scanner.running:
+            # No background scan (e.g. adapter was busy at start-up): try
+            # to start it now and give it a moment to collect advertisements
+            if await self.scanner.start():
+                startup.PROFILE.done('ble.adapter')
+                await asyncio.sleep(2.0)
+        devices = self.scanner.devices(None if include_all else IHEALTH_DEVICE_NAME)
+        metrics.SCAN_SECONDS.observe(time.perf_counter() - started)
+        return devices
 
-# Fallback to standard BLE UUIDs (for compatibility)
-STANDARD_SERVICE_UUID = "00001810-0000-1000-8000-00805f9b34fb"   # Blood Pressure Service
-STANDARD_CHAR_UUID = "00002a35-0000-1000-8000-00805f9b34fb"      # Blood Pressure Measurement
+    def _on_device_event(self, event, session):
+        # Pull anything the cuff stored while we were not connected
+        if event == 'connected' and session.write_char:
+            task = asyncio.create_task(self.history.sync(session))
+            self.history_tasks.add(task)
+            task.add_done_callback(self.history_tasks.discard)
 
-class HealthPadBackend:
-    def __init__(self):
-        self.device = None
-        self.client = None
-        self.connected = False
-        self.last_measurement = None
-        self.websocket_clients = set()
-
-    async def scan_devices(self):
-        """Scan for iHealth devices with detailed information"""
-        logger.info("Scanning for iHealth devices...")
-        logger.info("=" * 60)
-        devices = await BleakScanner.discover(timeout=10.0)
-        
-        ihealth_devices = []
-        logger.info(f"Found {len(devices)} total BLE devices:")
-        
-        for device in devices:
-            device_info = {
-                'name': device.name or 'Unknown',
-                'address': device.address,
-                'rssi': device.rssi,
-            }
-            
-            # Log all devices for debugging
-            logger.info(f"  - {device.name} ({device.address}) RSSI: {device.rssi}")
-            
-            # Check if it's an iHealth device
-            if device.name and IHEALTH_DEVICE_NAME in device.name:
-                logger.info(f"✓ Found iHealth: {device.name} ({device.address})")
-                
-                # Try to get more details
-                try:
-                    # Attempt to read characteristics if connected
-                    async with BleakClient(device.address) as client:
-                        services = await client.get_services()
-                        device_info['services'] = []
-                        
-                        for service in services:
-                            service_info = {
-                                'uuid': str(service.uuid),
-                                'characteristics': []
-                            }
-                            
-                            for char in service.characteristics:
-                                char_info = {
-                                    'uuid': str(char.uuid),
-                                    'properties': char.properties
-                                }
-                                service_info['characteristics'].append(char_info)
-                            
-                            device_info['services'].append(service_info)
-                        
-                        logger.info(f"  Services found: {len(services)}")
-                        for svc in services:
-                            logger.info(f"    - {svc.uuid}")
-                except Exception as e:
-                    logger.warning(f"  Could not scan services: {e}")
-                
-                ihealth_devices.append(device_info)
-        
-        logger.info("=" * 60)
-        return ihealth_devices
+    async def stop_history(self):
+        """Cancel history syncs started on connect and wait for them"""
+        tasks = list(self.history_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def connected(self):
+        """True while at least one device session is connected"""
+        return self.devices.connected_count > 0
 
     async def connect_device(self, address):
-        """Connect to iHealth device"""
-        try:
-            logger.info(f"Connecting to {address}...")
-            self.client = BleakClient(address)
-            await self.client.connect()
-            self.connected = True
-            logger.info("✓ Connected successfully!")
-            
-            # Get services and characteristics
-            logger.info("=" * 60)
-            logger.info("Device Services and Characteristics:")
-            logger.info("=" * 60)
-            
-            services = await self.client.get_services()
-            logger.info(f"Total services: {len(services)}")
-            
-            found_measurement_char = False
-            
-            for service in services:
-                logger.info(f"\nService: {service.uuid}")
-                
-                for char in service.characteristics:
-                    logger.info(f"  ├─ Characteristic: {char.uuid}")
-                    logger.info(f"  │  Properties: {char.properties}")
-                    
-                    # Try to find measurement characteristic
-                    # Check if this matches our iHealth UUIDs
-                    if 'read' in char.properties or 'notify' in char.properties:
-                        logger.info(f"  │  ✓ Can read/notify")
-                        
-                        # Check if it matches known measurement characteristics
-                        uuid_str = str(char.uuid).lower()
-                        if ('sed' in uuid_str or 'rec' in uuid_str or 
-                            '2a35' in uuid_str or 'pressure' in char.properties):
-                            logger.info(f"  │  ⭐ Possible measurement characteristic")
-                            found_measurement_char = True
-                            
-                            # Subscribe to notifications if notify is supported
-                            if 'notify' in char.properties:
-                                try:
-                                    await self.client.start_notify(
-                                        char.uuid,
-                                        self.measurement_callback
-                                    )
-                                    logger.info(f"  │  ✓ Subscribed to notifications")
-                                except Exception as e:
-                                    logger.warning(f"  │  Could not subscribe: {e}")
-            
-            logger.info("=" * 60)
-            
-            if found_measurement_char:
-                logger.info("✓ Found potential measurement characteristic")
-            else:
-                logger.warning("⚠ No measurement characteristic found, trying fallback...")
-                # Try standard UUIDs as fallback
-                try:
-                    await self.client.start_notify(
-                        STANDARD_CHAR_UUID,
-                        self.measurement_callback
-                    )
-                    logger.info("✓ Subscribed to standard BLE measurement characteristic")
-                except Exception as e:
-                    logger.warning(f"Fallback subscription failed: {e}")
-            
-            return True
-        except Exception as e:
-            logger.error(f"Connection failed: {e}")
-            self.connected = False
-            return False
-
-    async def disconnect_device(self):
-        """Disconnect from device"""
-        if self.client:
-            await self.client.disconnect()
-            self.connected = False
-            logger.info("Disconnected from device")
-
-    def measurement_callback(self, sender, data):
-        """Handle incoming measurement data"""
+        """Connect to iHealth device, keeping other sessions alive"""
+        return await self.devices.connect(address)
+
+    async def disconnect_device(self, address=None):
+        """Disconnect one device, or every device when no address is given"""
+        self.supervisor.forget(address)
+        count = await self.devices.disconnect(address)
+        logger.info("Disconnected %d device(s)", count)
+
+    def measurement_callback(self, session, sender, data):
+        """
+        bleak notification callback for every device session
+
+        Only queues the bytes; decoding, storing and broadcasting happen
+        in the ingest consumer (process_notification).
+        """
+        self.ingest.put(session, sender, data)
+
+    def process_notification(self, session, sender, data, ingest):
+        """Reassemble and handle one queued notification, received at ``ingest``"""
+        char_uuid = getattr(sender, 'uuid', None)
+        if self.capture is not None:
+            self.capture.record(session.address, char_uuid, data, ingest)
+        if char_uuid is not None and str(char_uuid).lower() == STANDARD_CHAR_UUID:
+            # 0x2A35 measurements always arrive in a single notification
+            self.handle_frame(session, data, char_uuid, ingest)
+        else:
+            # iHealth frames may be split or merged across notifications
+            for frame in session.reassembler.feed(data):
+                # During a history download, stored records go to the sync
+                if session.history_sink is None or not session.history_sink(frame):
+                    self.handle_frame(session, frame, char_uuid, ingest)
+
+    def handle_frame(self, session, frame, char_uuid=None, ingest=None):
+        """
+        Decode one complete frame and publish the measurement
+
+        ``ingest`` is the time.monotonic() at which the notification
+        completing the frame arrived; it anchors the reading's trace.
+        """
+        started = time.monotonic()
+        trace = self.tracer.begin(session.address, started if ingest is None else ingest)
+        if ingest is not None:
+            # Time spent waiting in the ingest queue
+            trace.span('queue', ingest, started)
+        decoded = decode(frame, char_uuid)
+        decoded_at = time.monotonic()
+        metrics.DECODE_SECONDS.observe(decoded_at - started)
+        trace.span('decode', started, decoded_at)
+        if decoded is None:
+            # Counted in full; the log line goes through the rate-limited
+            # packets logger so a noisy cuff cannot flood the journal
+            metrics.PARSE_FAILURES.inc()
+            packet_logger.warning("[%s] Could not decode frame: %s",
+                                  session.address, log_pipeline.HexDump(frame))
+            self.tracer.finish(trace)
+            return
+        
         try:
-            # Parse blood pressure data (simplified)
-            # Real implementation would parse the full BLE data structure
-            systolic = int.from_bytes(data[1:3], 'little')
-            diastolic = int.from_bytes(data[3:5], 'little')
-            pulse = int.from_bytes(data[14:16], 'little') if len(data) > 15 else 0
+            systolic = decoded['systolic']
+            diastolic = decoded['diastolic']
+            pulse = decoded['pulse']
             
-            self.last_measurement = {
+            now = time.time()
+            code = classify_code(systolic, diastolic)
+            classified_at = time.monotonic()
+            trace.span('classify', decoded_at, classified_at)
+            measurement = {
+                'address': session.address,
                 'systolic': systolic,
                 'diastolic': diastolic,
                 'pulse': pulse,
-                'timestamp': datetime.now().isoformat(),
-                'classification': self.classify_bp(systolic, diastolic)
+                'timestamp': datetime.fromtimestamp(now).isoformat(),
+                'classification': CATEGORIES[code],
+                'trace_id': trace.trace_id,
+                'ingest_monotonic': trace.ingest,
             }
+            if 'measured_at' in decoded:
+                # Lets the store dedup this reading against its history copy
+                measurement['measured_at'] = decoded['measured_at']
+            session.last_measurement = measurement
+            self.last_measurement = measurement
+            stored_at = time.monotonic()
+            self.store.append(measurement)
+            self.stats.update(session.address, now, systolic, diastolic, pulse, code)
+            # Queued for the writer thread: the span covers the hand-off
+            trace.span('store', stored_at, time.monotonic())
             
-            logger.info(f"Measurement: {systolic}/{diastolic} mmHg, HR: {pulse}")
+            logger.info("[%s] Measurement: %s/%s mmHg, HR: %s",
+                        session.address, systolic, diastolic, pulse)
             
             # Broadcast to all WebSocket clients
-            asyncio.create_task(self.broadcast_measurement())
+            published_at = time.monotonic()
+            self.broadcast_measurement(measurement, trace)
+            trace.span('publish', published_at, time.monotonic())
             
         except Exception as e:
-            logger.error(f"Error parsing measurement: {e}")
+            metrics.PARSE_FAILURES.inc()
+            logger.error("Error parsing measurement: %s", e)
+        finally:
+            self.tracer.finish(trace)
 
     def classify_bp(self, systolic, diastolic):
-        """Classify blood pressure"""
-        if systolic >= 180 or diastolic >= 120:
-            return {'level': 'crisis', 'name': 'Hypertensive Crisis', 'color': '#B71C1C'}
-        elif systolic >= 140 or diastolic >= 90:
-            return {'level': 'high2', 'name': 'High Blood Pressure Stage 2', 'color': '#F44336'}
-        elif systolic >= 130 or diastolic >= 80:
-            return {'level': 'high1', 'name': 'High Blood Pressure Stage 1', 'color': '#FF9800'}
-        elif systolic >= 120 and diastolic < 80:
-            return {'level': 'elevated', 'name': 'Elevated', 'color': '#FFC107'}
-        else:
-            return {'level': 'normal', 'name': 'Normal', 'color': '#00C853'}
-
-    async def broadcast_measurement(self):
-        """Broadcast measurement to all WebSocket clients"""
-        if self.websocket_clients and self.last_measurement:
-            message = json.dumps({
-                'type': 'measurement',
-                'data': self.last_measurement
-            })
-            
-            for ws in self.websocket_clients.copy():
-                try:
-                    await ws.send_str(message)
-                except Exception as e:
-                    logger.error(f"Error sending to WebSocket: {e}")
-                    self.websocket_clients.discard(ws)
+        """Classify blood pressure (returns a shared, read-only record)"""
+        return classify_bp(systolic, diastolic)
+
+    def broadcast_measurement(self, measurement, trace=None):
+        """Queue one device's measurement for every WebSocket client"""
+        if self.ring is not None:
+            self.ring.write(measurement)
+        self.broadcaster.publish({
+            'type': 'measurement',
+            'address': measurement['address'],
+            'data': measurement
+        }, trace)
+
+    async def device_status(self):
+        """Per-device status with connection health"""
+        return [
+            dict(device, health=self.supervisor.snapshot(device['address']))
+            for device in self.devices.status()
+        ]
 
     async def start_measurement(self):
         """Trigger measurement on device"""
@@ -240,62 +256,446 @@ class HealthPadBackend:
             return {'success': False, 'error': str(e)}
 
 
-# Create backend instance
-backend = HealthPadBackend()
+# Create backend instance (a multi-process web worker gets the ring-fed
+# stand-in; it never touches BLE)
+with startup.PROFILE.phase('backend'):
+    if ROLE == 'worker':
+        from multiproc import WorkerBackend
+        backend = WorkerBackend()
+    else:
+        backend = HealthPadBackend()
 
 # HTTP API handlers
+def _require_ble():
+    """503 while fast start is still importing the BLE stack"""
+    if transport.name is None:
+        raise web.HTTPServiceUnavailable(
+            text='Bluetooth is still starting', headers={'Retry-After': '2'}
+        )
+
 async def handle_scan(request):
-    """Scan for devices"""
-    devices = await backend.scan_devices()
-    return web.json_response({'devices': devices})
+    """
+    List nearby devices from the advertisement index
+    
+    ?all=1 includes non-iHealth devices. ?since=<version>&wait=<seconds>
+    long-polls until the index changes from that version.
+    """
+    _require_ble()
+    include_all = request.query.get('all') == '1'
+    if 'since' in request.query:
+        try:
+            since = int(request.query['since'])
+            wait = min(float(request.query.get('wait', 30)), 120.0)
+        except ValueError:
+            raise web.HTTPBadRequest(text='since and wait must be numbers')
+        await backend.scanner.wait_for_change(since, wait)
+    devices = await backend.scan_devices(include_all)
+    return web.json_response({
+        'devices': devices,
+        'version': backend.scanner.version
+    })
 
 async def handle_connect(request):
-    """Connect to device"""
+    """Connect to one device ("address") or several at once ("addresses")"""
+    _require_ble()
     data = await request.json()
+    addresses = data.get('addresses')
+    if addresses:
+        results = await backend.devices.connect_many(addresses)
+        return web.json_response({
+            'success': all(results.values()),
+            'results': results
+        })
     address = data.get('address')
     success = await backend.connect_device(address)
     return web.json_response({'success': success})
 
 async def handle_disconnect(request):
-    """Disconnect from device"""
-    await backend.disconnect_device()
+    """Disconnect one device, or all devices when no address is given"""
+    data = await request.json() if request.can_read_body else {}
+    await backend.disconnect_device(data.get('address'))
     return web.json_response({'success': True})
 
 async def handle_start_measurement(request):
     """Start measurement"""
+    _require_ble()
     result = await backend.start_measurement()
     return web.json_response(result)
 
+async def handle_history_sync(request):
+    """Download stored readings from one device, or every connected device"""
+    _require_ble()
+    data = await request.json() if request.can_read_body else {}
+    address = data.get('address')
+    if address:
+        session = backend.devices.get(address)
+        if session is None:
+            raise web.HTTPNotFound(text=f'Unknown device {address}')
+        sessions = [session]
+    else:
+        sessions = [s for s in backend.devices.sessions.values() if s.connected]
+    results = await asyncio.gather(*(backend.history.sync(s) for s in sessions))
+    return web.json_response({'results': results})
+
+HISTORY_BUCKETS = {'hour': 3600, 'day': 86400}
+HISTORY_MAX_LIMIT = 5000
+HISTORY_STREAM_CHUNK = 1000
+
+# /api/events: EventSource reconnect delay, and the idle keep-alive interval
+SSE_RETRY_MS = 3000
+SSE_KEEPALIVE = 15.0
+LONG_POLL_MAX_WAIT = 60.0
+
+def _parse_time(value):
+    """Epoch seconds from a number or an ISO 8601 string"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+async def handle_history(request):
+    """
+    Measurement history
+    
+    ?address=...           one device
+    ?start=...&end=...     time range (epoch seconds or ISO 8601)
+    ?limit=&cursor=        one page; next_cursor is set while rows remain
+    ?bucket=hour|day       min/max/mean per bucket instead of raw rows
+    ?stream=1              the whole range as a chunked JSON array
+    """
+    query = request.query
+    try:
+        address = query.get('address')
+        start = _parse_time(query.get('start'))
+        end = _parse_time(query.get('end'))
+        limit = max(1, min(int(query.get('limit', 500)), HISTORY_MAX_LIMIT))
+        after = None
+        if query.get('cursor'):
+            ts, row_id = query['cursor'].split(':')
+            after = (float(ts), int(row_id))
+    except ValueError:
+        raise web.HTTPBadRequest(text='Invalid start, end, limit or cursor')
+    bucket = query.get('bucket')
+    if bucket and bucket not in HISTORY_BUCKETS:
+        raise web.HTTPBadRequest(text=f"bucket must be one of {', '.join(HISTORY_BUCKETS)}")
+    
+    # History is append-only, so the newest row id together with the query
+    # identifies the response. max_id() shares the read lock with the
+    # page/aggregate queries, so it waits for them in a worker thread too.
+    store = backend.store
+    loop = asyncio.get_running_loop()
+    max_id = await loop.run_in_executor(None, store.max_id)
+    etag = f'"{max_id:x}-{zlib.crc32(request.query_string.encode()):x}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(store.last_modified, usegmt=True),
+        'Cache-Control': 'no-cache',
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        raise web.HTTPNotModified(headers=headers)
+    if (request.if_modified_since and 'If-None-Match' not in request.headers and
+            int(store.last_modified) <= request.if_modified_since.timestamp()):
+        raise web.HTTPNotModified(headers=headers)
+    
+    if bucket:
+        buckets = await loop.run_in_executor(None, functools.partial(
+            store.aggregate, HISTORY_BUCKETS[bucket], address, start, end,
+            time.localtime().tm_gmtoff
+        ))
+        return web.json_response({'bucket': bucket, 'buckets': buckets}, headers=headers)
+    
+    if query.get('stream') == '1':
+        response = web.StreamResponse(headers=headers)
+        response.content_type = 'application/json'
+        await response.prepare(request)
+        await response.write(b'{"measurements": [')
+        separator = b''
+        while True:
+            rows, after = await loop.run_in_executor(None, functools.partial(
+                store.page, address, start, end, after, HISTORY_STREAM_CHUNK
+            ))
+            if rows:
+                await response.write(separator + json.dumps(rows)[1:-1].encode())
+                separator = b', '
+            if after is None:
+                break
+        await response.write(b']}')
+        await response.write_eof()
+        return response
+    
+    rows, after = await loop.run_in_executor(None, functools.partial(
+        store.page, address, start, end, after, limit
+    ))
+    return web.json_response({
+        'measurements': rows,
+        'next_cursor': f"{after[0]!r}:{after[1]}" if after else None
+    }, headers=headers)
+
+async def handle_stats(request):
+    """Precomputed per-device statistics (?address= for one device)"""
+    address = request.query.get('address')
+    if address:
+        stats = backend.stats.snapshot(address)
+        if stats is None:
+            raise web.HTTPNotFound(text=f'No readings from {address}')
+        return web.json_response({'address': address, 'stats': stats})
+    return web.json_response({'devices': backend.stats.snapshot()})
+
+async def handle_traces(request):
+    """
+    Recent reading traces, newest first
+
+    ?address= limits to one device, ?min_ms= to readings that took at
+    least that long from BLE callback to their last WebSocket send.
+    """
+    try:
+        limit = min(int(request.query.get('limit', 100)), backend.tracer.traces.maxlen)
+        min_ms = float(request.query['min_ms']) if 'min_ms' in request.query else None
+    except ValueError:
+        raise web.HTTPBadRequest(text='limit and min_ms must be numbers')
+    return web.json_response({
+        'traces': backend.tracer.query(request.query.get('address'), min_ms, limit)
+    })
+
 async def handle_status(request):
     """Get connection status"""
     return web.json_response({
         'connected': backend.connected,
-        'last_measurement': backend.last_measurement
+        'last_measurement': backend.last_measurement,
+        'devices': await backend.device_status()
+    })
+
+async def handle_logs(request):
+    """
+    Recent log records from the in-memory ring, oldest first
+
+    ?level= minimum level name, ?logger= subsystem (includes children),
+    ?since=<seq> only newer records, ?limit= at most this many.
+    """
+    level = logging.getLevelName(request.query.get('level', 'NOTSET').upper())
+    if not isinstance(level, int):
+        raise web.HTTPBadRequest(text='unknown level')
+    try:
+        since = int(request.query.get('since', 0))
+        limit = min(int(request.query.get('limit', 200)), 1000)
+    except ValueError:
+        raise web.HTTPBadRequest(text='since and limit must be integers')
+    return web.json_response({
+        'records': log_pipeline.recent(level, request.query.get('logger'), since, limit)
     })
 
+async def handle_metrics(request):
+    """Prometheus scrape endpoint"""
+    return web.Response(
+        text=metrics.REGISTRY.render(),
+        headers={'Content-Type': metrics.CONTENT_TYPE}
+    )
+
+async def handle_healthz(request):
+    """Liveness: answers as soon as the server is up; the body is the startup profile"""
+    return web.json_response(startup.PROFILE.to_dict())
+
+async def handle_readyz(request):
+    """Readiness: 200 once every startup phase is done, 503 until then or after a failure"""
+    report = startup.PROFILE.to_dict()
+    return web.json_response(report, status=200 if report['ready'] else 503)
+
 async def websocket_handler(request):
-    """WebSocket connection for real-time updates"""
+    """
+    WebSocket connection for real-time updates
+
+    ?format=binary selects the compact encoding (see wire.py); JSON is the
+    default. ?resume=<seq>, or a {"type": "resume", "seq": N} message at
+    any time, replays every broadcast after N.
+    """
+    fmt = request.query.get('format', 'json')
+    if fmt not in wire.FORMATS:
+        raise web.HTTPBadRequest(text=f"format must be one of {', '.join(wire.FORMATS)}")
+    try:
+        resume = int(request.query['resume']) if 'resume' in request.query else None
+    except ValueError:
+        raise web.HTTPBadRequest(text='resume must be a sequence number')
+
     ws = web.WebSocketResponse()
     await ws.prepare(request)
+    send = ws.send_bytes if fmt == 'binary' else ws.send_str
     
-    backend.websocket_clients.add(ws)
-    logger.info(f"WebSocket client connected. Total: {len(backend.websocket_clients)}")
+    # Anything published from here on is replayed after the snapshot
+    last_seq = backend.broadcaster.log.last_seq
+    await send(wire.hello(fmt, last_seq).payload(fmt))
+    # Send a per-device snapshot so new screens don't wait for the next reading
+    await send(wire.control({
+        'type': 'status',
+        'last_seq': last_seq,
+        'devices': await backend.device_status()
+    }).payload(fmt))
+    
+    backend.broadcaster.register(ws, fmt, last_seq if resume is None else resume)
+    logger.info("WebSocket client connected (%s). Total: %d", fmt, len(backend.broadcaster))
     
     try:
         async for msg in ws:
             if msg.type == aiohttp.WSMsgType.TEXT:
-                # Handle incoming WebSocket messages if needed
-                pass
+                try:
+                    command = json.loads(msg.data)
+                    if command.get('type') == 'resume':
+                        backend.broadcaster.resume(ws, int(command['seq']))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    logger.warning("Ignoring malformed WebSocket message: %.100s", msg.data)
             elif msg.type == aiohttp.WSMsgType.ERROR:
-                logger.error(f"WebSocket error: {ws.exception()}")
+                logger.error("WebSocket error: %s", ws.exception())
     finally:
-        backend.websocket_clients.discard(ws)
-        logger.info(f"WebSocket client disconnected. Total: {len(backend.websocket_clients)}")
+        await backend.broadcaster.unregister(ws)
+        logger.info("WebSocket client disconnected. Total: %d", len(backend.broadcaster))
     
     return ws
 
+def _event_position(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f'{name} must be a sequence number')
+
+async def handle_events(request):
+    """
+    Server-Sent Events stream of every broadcast
+
+    Reads the same replay log as /ws, so each message is serialized once
+    whichever transports consume it. EventSource reconnects with the
+    Last-Event-ID header and gets what it missed; ?last_event_id= does the
+    same for the first connection. Otherwise the stream starts with a
+    hello event at the current position.
+    """
+    log = backend.broadcaster.log
+    resume = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    position = log.last_seq if resume is None else _event_position(resume, 'last_event_id')
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        # Stop nginx from buffering the stream
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+    await response.write(f"retry: {SSE_RETRY_MS}\n\n".encode())
+    if resume is None:
+        await response.write(wire.hello('json', position).payload('sse'))
+
+    try:
+        while not log.closed:
+            entries = await log.wait(position, SSE_KEEPALIVE)
+            if entries is None:
+                # Missed messages have left the ring: reload over REST
+                position = log.last_seq
+                await response.write(wire.control({'type': 'resync', 'last_seq': position}).payload('sse'))
+            elif entries:
+                position = entries[-1].seq
+                await response.write(b''.join(entry.payload('sse') for entry in entries))
+            else:
+                # Comment line so proxies don't drop an idle stream
+                await response.write(b': keep-alive\n\n')
+    except ConnectionResetError:
+        pass  # the client went away
+    # A cancel (client gone mid-wait, or shutdown) propagates to aiohttp
+    return response
+
+async def handle_events_poll(request):
+    """
+    Long-poll fallback for clients that can't hold a stream open
+
+    ?since=<seq> returns the broadcasts after it, waiting up to ?wait=
+    seconds (default 25) for the first one. Without ?since only the
+    current position is returned. "resync": true means the gap can no
+    longer be filled and the client should reload over REST.
+    """
+    log = backend.broadcaster.log
+    if 'since' not in request.query:
+        return web.json_response({'last_seq': log.last_seq, 'resync': False, 'events': []})
+    since = _event_position(request.query['since'], 'since')
+    try:
+        wait = min(max(float(request.query.get('wait', 25)), 0.0), LONG_POLL_MAX_WAIT)
+    except ValueError:
+        raise web.HTTPBadRequest(text='wait must be a number of seconds')
+
+    entries = await log.wait(since, wait)
+    resync = entries is None
+    # The events array is spliced from each entry's cached JSON payload
+    events = ','.join(entry.payload('json') for entry in entries or ())
+    last_seq = entries[-1].seq if entries else (log.last_seq if resync else since)
+    return web.Response(
+        text=f'{{"last_seq": {last_seq}, "resync": {json.dumps(resync)}, "events": [{events}]}}',
+        content_type='application/json'
+    )
+
+async def start_ble():
+    """Import the BLE stack, start the adapter and reconnect remembered devices"""
+    profile = startup.PROFILE
+    try:
+        with profile.phase('ble.transport'):
+            if transport.name is None:
+                # bleak and dbus-fast take seconds to import on a Pi Zero
+                await asyncio.get_running_loop().run_in_executor(
+                    None, transport.use, transport.DEFAULT
+                )
+    except Exception:
+        profile.fail('ble.adapter', 'no BLE transport')
+        profile.fail('ble.reconnect', 'no BLE transport')
+        return
+    
+    profile.begin('ble.adapter')
+    if await backend.scanner.start():
+        profile.done('ble.adapter')
+    else:
+        # Reconnects go straight to known addresses and still work
+        profile.fail('ble.adapter', 'background scanner could not start')
+    
+    with profile.phase('ble.reconnect'):
+        remembered = backend.supervisor.restore()
+        if remembered:
+            logger.info("Reconnecting to remembered devices: %s", ', '.join(remembered))
+
+def add_backend_hooks(app):
+    """Start and stop the BLE side of the backend with the app"""
+    async def start_stats(app):
+        backend.ingest.start()
+        backend.stats.start()
+        backend.tracer.start()
+    app.on_startup.append(start_stats)
+    
+    async def close_store(app):
+        await backend.stop_history()
+        await backend.ingest.stop()
+        await backend.stats.stop()
+        await backend.tracer.stop()
+        backend.store.close()
+        if backend.capture is not None:
+            backend.capture.close()
+    app.on_cleanup.append(close_store)
+    
+    startup.PROFILE.expect('ble.transport', 'ble.adapter', 'ble.reconnect')
+    background = []
+    
+    async def start_scanner(app):
+        if startup.FAST_START:
+            # Let the server bind first; Bluetooth comes up in the background
+            background.append(asyncio.create_task(start_ble()))
+        else:
+            await start_ble()
+    app.on_startup.append(start_scanner)
+    
+    async def stop_scanner(app):
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await backend.supervisor.stop()
+        await backend.scanner.stop()
+    app.on_cleanup.append(stop_scanner)
+
 async def init_app():
     """Initialize web application"""
+    startup.PROFILE.begin('http')
     app = web.Application()
     
     # Configure CORS
@@ -307,20 +707,60 @@ async def init_app():
         )
     })
     
-    # Add routes
-    app.router.add_get('/api/scan', handle_scan)
-    app.router.add_post('/api/connect', handle_connect)
-    app.router.add_post('/api/disconnect', handle_disconnect)
-    app.router.add_post('/api/measure', handle_start_measurement)
-    app.router.add_get('/api/status', handle_status)
+    # Add routes. A multi-process web worker forwards everything that
+    # involves a device session to the acquisition process, and adds its
+    # own broadcast metrics and client sends to /metrics and /api/traces.
+    control = backend.proxy if ROLE == 'worker' else None
+    app.router.add_get('/api/scan', control or handle_scan)
+    app.router.add_post('/api/connect', control or handle_connect)
+    app.router.add_post('/api/disconnect', control or handle_disconnect)
+    app.router.add_post('/api/measure', control or handle_start_measurement)
+    app.router.add_get('/api/status', control or handle_status)
+    app.router.add_get('/api/history', handle_history)
+    app.router.add_get('/api/stats', control or handle_stats)
+    app.router.add_post('/api/history/sync', control or handle_history_sync)
+    app.router.add_get('/api/traces', backend.traces if control else handle_traces)
+    app.router.add_get('/api/logs', control or handle_logs)
+    app.router.add_get('/metrics', backend.metrics if control else handle_metrics)
     app.router.add_get('/ws', websocket_handler)
+    app.router.add_get('/api/events', handle_events)
+    app.router.add_get('/api/events/poll', handle_events_poll)
+    app.router.add_get('/healthz', handle_healthz)
+    app.router.add_get('/readyz', handle_readyz)
     
     # Configure CORS for all routes
     for route in list(app.router.routes()):
         cors.add(route)
     
-    # Serve static files (preview.html)
-    app.router.add_static('/', path='../web/', name='static')
+    if ROLE == 'worker':
+        app.on_startup.append(backend.start)
+        app.on_cleanup.append(backend.stop)
+    else:
+        add_backend_hooks(app)
+    
+    async def close_websockets(app):
+        await backend.broadcaster.close()
+    app.on_shutdown.append(close_websockets)
+    
+    # Serve static files (preview.html) from memory, precompressed
+    site = static_assets.default_site()
+    if site:
+        assets = static_assets.StaticAssets(*site)
+        app.router.add_get('/{path:.*}', assets.handle, name='static')
+        startup.PROFILE.expect('static')
+        
+        async def start_assets(app):
+            with startup.PROFILE.phase('static'):
+                await assets.start()
+        app.on_startup.append(start_assets)
+        app.on_cleanup.append(assets.stop)
+    else:
+        logger.warning("No dashboard files found (set HEALTHPAD_WEB_ROOT); serving the API only")
+    
+    async def serving(app):
+        # The last startup step: the listening socket opens right after
+        startup.PROFILE.done('http')
+    app.on_startup.append(serving)
     
     return app
 
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Pipeline Benchmarks
+Notification-to-dashboard costs, from decode to WebSocket delivery
+
+Run from raspberry_pi/:
+
+    python3 benchmarks/bench_pipeline.py --save benchmarks/baselines/$(git rev-parse --short HEAD).json
+    python3 benchmarks/bench_pipeline.py --compare benchmarks/baselines/<older>.json
+
+BLE input comes from the simulated transport; the database, stats and
+cache files go to a temporary directory.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+_workdir = tempfile.mkdtemp(prefix='healthpad-bench-')
+os.environ['HEALTHPAD_TRANSPORT'] = 'sim'
+os.environ['HEALTHPAD_SIM_DEVICES'] = '0'
+for _var, _name in (('HEALTHPAD_DB', 'bench.db'), ('HEALTHPAD_STATS', 'stats.json'),
+                    ('HEALTHPAD_GATT_CACHE', 'gatt.json'),
+                    ('HEALTHPAD_REMEMBERED', 'remembered.json')):
+    os.environ[_var] = os.path.join(_workdir, _name)
+
+import logging  # noqa: E402
+
+import aiohttp  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+import simulator  # noqa: E402
+from classification import classify_bp  # noqa: E402
+from decoder import decode, encode_ihealth_frame  # noqa: E402
+from devices import DeviceSession  # noqa: E402
+from gatt_uuids import IHEALTH_SEND_CHAR  # noqa: E402
+from wire import encode_binary  # noqa: E402
+
+# Importing backend builds the global HealthPadBackend used by the app
+import backend as backend_module  # noqa: E402
+from ihealth_receiver import iHealthBP550  # noqa: E402
+
+# Per-reading log lines would dominate the numbers and flood the terminal
+logging.getLogger().setLevel(logging.WARNING)
+
+FAN_OUT_CLIENTS = (10, 100, 1000)
+
+
+class _Char:
+    uuid = IHEALTH_SEND_CHAR
+
+
+def unique_frames(count):
+    """Frames whose (systolic, diastolic, pulse) identify them"""
+    return [
+        encode_ihealth_frame(100 + i % 100, 60 + (i // 100) % 50, 50 + (i // 5000) % 100)
+        for i in range(count)
+    ]
+
+
+def _best_rate(fn, items, repeat):
+    """Items per second for the fastest of ``repeat`` passes over ``items``"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def _percentile(sorted_values, q):
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_decode(frames, repeat):
+    receiver = iHealthBP550()
+    ingest = backend_module.backend.ingest
+    session = DeviceSession('BE:NC:H0:00:00:01', backend_module.backend.measurement_callback)
+    char = _Char()
+
+    def callback(frame):
+        # Queue and process, as the ingest consumer would for a lone notification
+        session.notification_handler(char, bytearray(frame))
+        ingest.drain()
+
+    results = {
+        'decode.frames_per_s': _best_rate(decode, frames, repeat),
+        'parse_data.frames_per_s': _best_rate(receiver.parse_data, frames, repeat),
+        'measurement_callback.frames_per_s': _best_rate(callback, frames, repeat),
+    }
+    backend_module.backend.store.flush()
+    return results
+
+
+def bench_classify_serialize(frames, repeat):
+    readings = [decode(f) for f in frames]
+    measurements = [
+        {'address': 'BE:NC:H0:00:00:01', 'timestamp': '2024-01-01T00:00:00',
+         'classification': classify_bp(r['systolic'], r['diastolic']), **r}
+        for r in readings
+    ]
+    return {
+        'classify_bp.calls_per_s': _best_rate(
+            lambda r: classify_bp(r['systolic'], r['diastolic']), readings, repeat
+        ),
+        'json_dumps.messages_per_s': _best_rate(
+            lambda m: json.dumps({'type': 'measurement', 'address': m['address'], 'data': m}),
+            measurements, repeat
+        ),
+        'encode_binary.messages_per_s': _best_rate(
+            lambda m: encode_binary(1, {'type': 'measurement', 'address': m['address'], 'data': m}),
+            measurements, repeat
+        ),
+    }
+
+
+class _NullSocket:
+    """WebSocket stand-in that accepts every send immediately"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def send_str(self, payload):
+        self.received += 1
+
+    async def close(self):
+        pass
+
+
+async def bench_fan_out(frames, messages):
+    backend = backend_module.backend
+    results = {}
+    measurement = {'address': 'BE:NC:H0:00:00:01', 'timestamp': '2024-01-01T00:00:00',
+                   'classification': classify_bp(120, 80), **decode(frames[0])}
+    for clients in FAN_OUT_CLIENTS:
+        sockets = [_NullSocket() for _ in range(clients)]
+        for ws in sockets:
+            backend.broadcaster.register(ws)
+        await asyncio.sleep(0)
+        channels = [backend.broadcaster.channels[ws] for ws in sockets]
+        start = time.perf_counter()
+        for _ in range(messages):
+            backend.broadcast_measurement(measurement)
+            # Readings are seconds apart: let every writer drain before the next
+            while any(channel.queue for channel in channels):
+                await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        for ws in sockets:
+            await backend.broadcaster.unregister(ws)
+        results[f'broadcast.{clients}_clients.ms_per_message'] = elapsed / messages * 1000
+    return results
+
+
+class TimedPeripheral(simulator.SimulatedPeripheral):
+    """Records when each frame leaves the simulated cuff"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent_at = {}
+
+    async def stream(self, callback, char):
+        def timed(c, data):
+            reading = decode(bytes(data))
+            self.sent_at[(reading['systolic'], reading['diastolic'], reading['pulse'])] = (
+                time.perf_counter()
+            )
+            return callback(c, data)
+        await super().stream(timed, char)
+
+
+async def bench_end_to_end(frames, clients, rate):
+    backend = backend_module.backend
+    # No stored readings on the simulated cuff: end the history sync quickly
+    backend.history.first_record_timeout = 0.05
+    address = 'BE:NC:H0:00:00:02'
+    peripheral = simulator.add_device(TimedPeripheral(address, rate=0, frames=frames))
+
+    app = await backend_module.init_app()
+    server = TestServer(app)
+    await server.start_server()
+    latencies = []
+    try:
+        async with aiohttp.ClientSession() as http:
+            sockets = [await http.ws_connect(server.make_url('/ws')) for _ in range(clients)]
+            for ws in sockets:
+                await ws.receive_json()   # initial status snapshot
+            expected = len(frames)
+
+            async def reader(ws):
+                received = 0
+                while received < expected:
+                    message = await ws.receive_json(timeout=30)
+                    if message.get('type') != 'measurement':
+                        continue
+                    now = time.perf_counter()
+                    data = message['data']
+                    sent = peripheral.sent_at[(data['systolic'], data['diastolic'], data['pulse'])]
+                    latencies.append(now - sent)
+                    received += 1
+
+            readers = [asyncio.create_task(reader(ws)) for ws in sockets]
+            async with http.post(server.make_url('/api/connect'),
+                                 json={'address': address}) as response:
+                response.raise_for_status()
+            while backend.history.running:
+                await asyncio.sleep(0.01)
+            # Stream starts on subscribe; switch it on only once the sync is done
+            peripheral.rate = rate
+            session = backend.devices.get(address)
+            await session.client.stop_notify(IHEALTH_SEND_CHAR)
+            start = time.perf_counter()
+            await session.client.start_notify(IHEALTH_SEND_CHAR, session.notification_handler)
+            await asyncio.gather(*readers)
+            elapsed = time.perf_counter() - start
+            for ws in sockets:
+                await ws.close()
+        await backend.disconnect_device(address)
+    finally:
+        await server.close()
+        simulator.DEVICES.pop(address, None)
+
+    latencies.sort()
+    return {
+        'e2e.clients': clients,
+        'e2e.frames_per_s': len(frames) / elapsed,
+        'e2e.p50_ms': _percentile(latencies, 0.50) * 1000,
+        'e2e.p99_ms': _percentile(latencies, 0.99) * 1000,
+        'e2e.max_ms': latencies[-1] * 1000,
+    }
+
+
+# Metrics where a larger value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = ('_per_s',)
+INFORMATIONAL = ('e2e.clients', 'e2e.frames_per_s')
+
+
+def compare(results, baseline, threshold):
+    """Print the change against ``baseline``; returns the regressed metric names"""
+    regressions = []
+    print(f"{'metric':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, value in results.items():
+        old = baseline.get(name)
+        if old is None or name in INFORMATIONAL or not old:
+            print(f"{name:<45} {'-':>12} {value:>12.3f}")
+            continue
+        change = (value - old) / old
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<45} {old:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+    }
+
+
+async def run(args):
+    frames = unique_frames(args.frames)
+    results = {}
+    results.update(bench_decode(frames, args.repeat))
+    results.update(bench_classify_serialize(frames, args.repeat))
+    results.update(await bench_fan_out(frames, args.messages))
+    results.update(await bench_end_to_end(frames[:args.e2e_frames], args.clients, args.rate))
+    backend_module.backend.store.close()
+    return results
+
+
+def main():
+    """Benchmark the notification-to-dashboard path"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--frames', type=int, default=5000,
+                        help='frames per throughput pass (default: 5000)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='passes per throughput benchmark, best is kept (default: 5)')
+    parser.add_argument('--messages', type=int, default=200,
+                        help='broadcasts per fan-out size (default: 200)')
+    parser.add_argument('--e2e-frames', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=10,
+                        help='WebSocket clients for the end-to-end run (default: 10)')
+    parser.add_argument('--rate', type=float, default=200.0,
+                        help='simulated notifications per second (default: 200)')
+    parser.add_argument('--save', metavar='PATH', help='write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change counted as a regression (default: 0.10)')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report = {'meta': _metadata(), 'results': results}
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Baseline: {args.compare} (commit {baseline['meta'].get('commit')})")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,34 +2,45 @@
 """
 Health Pad - Bluetooth Diagnostic Tool
 Tests Bluetooth connectivity and discovers iHealth KN-550BT devices
+
+    python3 bluetooth_test.py                    interactive, first cuff found
+    python3 bluetooth_test.py --fleet --report fleet.json
+                                                 every cuff in range, in parallel
 """
 
+import argparse
 import asyncio
+import json
+import platform
 import sys
-from bleak import BleakScanner, BleakClient
+import time
+from datetime import datetime
+import transport
+from gatt_uuids import IHEALTH_RECEIVE_CHAR, IHEALTH_SEND_CHAR
 
 # iHealth device info
 IHEALTH_DEVICE_NAME = "KN-550BT"
-IHEALTH_SERVICE_UUID = "6d6f2e6a-6975-616e-2e64-657600000000"
-IHEALTH_SEND_CHAR = "7365642e-6a69-7561-6e2e-646576000000"
-IHEALTH_RECEIVE_CHAR = "7265632e-6a69-7561-6e2e-646576000000"
+
+# Where the print_* helpers write; fleet mode moves them to stderr so
+# stdout carries nothing but the JSON report
+OUTPUT = sys.stdout
 
 def print_header(title):
-    print("\n" + "=" * 70)
-    print(f"  {title}")
-    print("=" * 70)
+    print("\n" + "=" * 70, file=OUTPUT)
+    print(f"  {title}", file=OUTPUT)
+    print("=" * 70, file=OUTPUT)
 
 def print_success(msg):
-    print(f"✓ {msg}")
+    print(f"✓ {msg}", file=OUTPUT)
 
 def print_error(msg):
-    print(f"✗ {msg}")
+    print(f"✗ {msg}", file=OUTPUT)
 
 def print_info(msg):
-    print(f"ℹ {msg}")
+    print(f"ℹ {msg}", file=OUTPUT)
 
 def print_warning(msg):
-    print(f"⚠ {msg}")
+    print(f"⚠ {msg}", file=OUTPUT)
 
 async def scan_devices():
     """Scan for all BLE devices"""
@@ -37,7 +48,7 @@ async def scan_devices():
     
     try:
         print_info("Scanning... (this may take 10 seconds)")
-        devices = await BleakScanner.discover(timeout=10.0)
+        devices = await transport.Scanner.discover(timeout=10.0)
         
         if not devices:
             print_error("No devices found")
@@ -70,58 +81,70 @@ async def scan_devices():
         print_info("Make sure Bluetooth is enabled: sudo systemctl status bluetooth")
         return None
 
+async def get_service_list(client):
+    """The connected client's services as a list"""
+    # Use client.services (newer bleak API) or client.get_services() (older)
+    try:
+        services = client.services
+        return list(services)
+    except (AttributeError, TypeError):
+        services = await client.get_services()
+        return list(services) if hasattr(services, '__iter__') else [services]
+
+def find_measurement_chars(service_list, verbose=True):
+    """Characteristics that look like measurement endpoints (printed when verbose)"""
+    measurement_chars = []
+    
+    for service in service_list:
+        if verbose:
+            print(f"Service: {service.uuid}")
+            print(f"  Description: {service.description or 'N/A'}")
+        
+        for i, char in enumerate(service.characteristics):
+            if verbose:
+                print(f"\n  Characteristic {i+1}: {char.uuid}")
+                print(f"    Properties:  {', '.join(char.properties)}")
+                print(f"    Descriptors: {len(char.descriptors)}")
+            
+            # Check if this looks like a measurement characteristic
+            uuid_str = str(char.uuid).lower()
+            properties = char.properties
+            
+            if ('notify' in properties or 'read' in properties):
+                if (uuid_str in (IHEALTH_SEND_CHAR, IHEALTH_RECEIVE_CHAR) or
+                    '2a35' in uuid_str or  # Standard BP UUID
+                    'sed' in uuid_str or    # iHealth send
+                    'rec' in uuid_str or    # iHealth receive
+                    '8b9b' in uuid_str):    # Other common measurement UUIDs
+                    
+                    if verbose:
+                        print_success("    ⭐ POSSIBLE MEASUREMENT CHARACTERISTIC")
+                    measurement_chars.append({
+                        'uuid': char.uuid,
+                        'properties': char.properties,
+                        'service': service.uuid
+                    })
+        
+        if verbose:
+            print()
+    
+    return measurement_chars
+
 async def connect_and_inspect(device):
     """Connect to device and inspect services"""
     print_header("CONNECTING TO DEVICE")
     
     try:
         print_info(f"Connecting to {device.name} ({device.address})...")
-        async with BleakClient(device.address) as client:
+        async with transport.Client(device.address) as client:
             print_success("Connected!")
             
             print_header("DEVICE SERVICES AND CHARACTERISTICS")
             
-            # Use client.services (newer bleak API) or client.get_services() (older)
-            try:
-                services = client.services
-                service_list = list(services)
-            except (AttributeError, TypeError):
-                services = await client.get_services()
-                service_list = list(services) if hasattr(services, '__iter__') else [services]
-            
+            service_list = await get_service_list(client)
             print_info(f"Total services: {len(service_list)}\n")
             
-            measurement_chars = []
-            
-            for service in service_list:
-                print(f"Service: {service.uuid}")
-                print(f"  Description: {service.description or 'N/A'}")
-                
-                for i, char in enumerate(service.characteristics):
-                    print(f"\n  Characteristic {i+1}: {char.uuid}")
-                    print(f"    Properties:  {', '.join(char.properties)}")
-                    print(f"    Descriptors: {len(char.descriptors)}")
-                    
-                    # Check if this looks like a measurement characteristic
-                    uuid_str = str(char.uuid).lower()
-                    properties = char.properties
-                    
-                    if ('notify' in properties or 'read' in properties):
-                        if ('2a35' in uuid_str or  # Standard BP UUID
-                            'sed' in uuid_str or    # iHealth send
-                            'rec' in uuid_str or    # iHealth receive
-                            '8b9b' in uuid_str):    # Other common measurement UUIDs
-                            
-                            print_success("    ⭐ POSSIBLE MEASUREMENT CHARACTERISTIC")
-                            measurement_chars.append({
-                                'uuid': char.uuid,
-                                'properties': char.properties,
-                                'service': service.uuid
-                            })
-                
-                print()
-            
-            return measurement_chars
+            return find_measurement_chars(service_list)
     
     except Exception as e:
         print_error(f"Connection failed: {e}")
@@ -133,7 +156,7 @@ async def test_notifications(device, char_uuid):
     
     try:
         print_info(f"Connecting to {device.address}...")
-        async with BleakClient(device.address) as client:
+        async with transport.Client(device.address) as client:
             print_success("Connected")
             
             print_info(f"Subscribing to notifications on {char_uuid}...")
@@ -161,6 +184,192 @@ async def test_notifications(device, char_uuid):
     except Exception as e:
         print_error(f"Notification test failed: {e}")
 
+# Fleet mode: every matching cuff, in parallel, no prompts
+
+async def find_devices(name_filter, timeout, addresses=()):
+    """Advertising devices whose name contains ``name_filter`` (or listed by address)"""
+    devices = await transport.Scanner.discover(timeout=timeout)
+    wanted = {a.upper() for a in addresses}
+    matched = [
+        d for d in devices
+        if (d.address.upper() in wanted if wanted else name_filter in (d.name or ''))
+    ]
+    return devices, matched
+
+async def probe_device(device, semaphore, notify_timeout, request_history=False):
+    """
+    One connection per device: connect, discover, wait for a notification
+
+    Returns the device's report entry; never raises.
+    """
+    phases = {}
+    result = {
+        'address': device.address,
+        'name': device.name,
+        'rssi': getattr(device, 'rssi', None),
+        'status': None,
+        'phases': phases,
+        'characteristics': [],
+        'notifications': 0,
+        'first_notification': None,
+    }
+    queued = time.perf_counter()
+    async with semaphore:
+        started = time.perf_counter()
+        phases['wait_s'] = round(started - queued, 3)
+        try:
+            # The BLEDevice from the scan lets bleak connect without rescanning
+            async with transport.Client(device) as client:
+                connected = time.perf_counter()
+                phases['connect_s'] = round(connected - started, 3)
+                
+                service_list = await get_service_list(client)
+                chars = find_measurement_chars(service_list, verbose=False)
+                discovered = time.perf_counter()
+                phases['discovery_s'] = round(discovered - connected, 3)
+                result['characteristics'] = [
+                    {'uuid': str(c['uuid']), 'properties': list(c['properties']),
+                     'service': str(c['service'])}
+                    for c in chars
+                ]
+                notify_chars = [c['uuid'] for c in chars if 'notify' in c['properties']]
+                if not notify_chars:
+                    result['status'] = 'no_measurement_characteristic'
+                    return result
+                if notify_timeout <= 0:
+                    result['status'] = 'ok'
+                    return result
+                
+                first = asyncio.get_running_loop().create_future()
+                
+                def on_notification(sender, data):
+                    result['notifications'] += 1
+                    if not first.done():
+                        first.set_result((time.perf_counter(), bytes(data)))
+                
+                for uuid in notify_chars:
+                    await client.start_notify(uuid, on_notification)
+                subscribed = time.perf_counter()
+                phases['subscribe_s'] = round(subscribed - discovered, 3)
+                if request_history:
+                    # Ask for stored readings so the cuff answers without a measurement
+                    from history_sync import GET_HISTORY_COMMAND
+                    await client.write_gatt_char(IHEALTH_RECEIVE_CHAR, GET_HISTORY_COMMAND, response=False)
+                
+                try:
+                    received, data = await asyncio.wait_for(first, notify_timeout)
+                    phases['first_notification_s'] = round(received - subscribed, 3)
+                    result['first_notification'] = data.hex()
+                    result['status'] = 'ok'
+                except asyncio.TimeoutError:
+                    result['status'] = 'no_notification'
+                for uuid in notify_chars:
+                    try:
+                        await client.stop_notify(uuid)
+                    except Exception:
+                        pass
+        except Exception as e:
+            result['status'] = 'error' if 'connect_s' in phases else 'connect_failed'
+            result['error'] = str(e) or type(e).__name__
+        finally:
+            phases['total_s'] = round(time.perf_counter() - started, 3)
+    return result
+
+async def run_fleet(args):
+    """Scan once, probe every matching device, return the report"""
+    print_header("FLEET DIAGNOSTICS")
+    print_info(f"Scanning for {args.scan_timeout:.0f}s...")
+    started = time.perf_counter()
+    try:
+        seen, matched = await find_devices(args.name, args.scan_timeout, args.address)
+        scan_error = None
+    except Exception as e:
+        seen, matched, scan_error = [], [], str(e)
+        print_error(f"Scan failed: {e}")
+    scan_s = time.perf_counter() - started
+    print_info(f"{len(matched)} of {len(seen)} device(s) match; "
+               f"probing {args.concurrency} at a time")
+    
+    semaphore = asyncio.Semaphore(args.concurrency)
+    
+    async def probe(device):
+        result = await probe_device(device, semaphore, args.notify_timeout, args.request_history)
+        line = f"{result['address']} {result['name'] or ''}: {result['status']}"
+        if result['status'] == 'ok':
+            print_success(line)
+        else:
+            print_error(line + (f" ({result['error']})" if result.get('error') else ''))
+        return result
+    
+    results = await asyncio.gather(*(probe(d) for d in matched))
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return {
+        'created_at': datetime.now().isoformat(),
+        'host': platform.node(),
+        'transport': transport.name,
+        'settings': {
+            'name': args.name,
+            'addresses': args.address,
+            'concurrency': args.concurrency,
+            'scan_timeout_s': args.scan_timeout,
+            'notify_timeout_s': args.notify_timeout,
+            'request_history': args.request_history,
+        },
+        'scan': {
+            'duration_s': round(scan_s, 3),
+            'devices_seen': len(seen),
+            'matched': len(matched),
+            **({'error': scan_error} if scan_error else {}),
+        },
+        'devices': sorted(results, key=lambda r: r['address']),
+        'summary': {
+            'ok': counts.get('ok', 0),
+            'failed': len(results) - counts.get('ok', 0),
+            'by_status': counts,
+            'duration_s': round(time.perf_counter() - started, 3),
+        },
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Health Pad Bluetooth diagnostics')
+    parser.add_argument('--fleet', action='store_true',
+                        help='probe every matching device in parallel, no prompts')
+    parser.add_argument('--name', default=IHEALTH_DEVICE_NAME,
+                        help=f'advertised name to match (default: {IHEALTH_DEVICE_NAME})')
+    parser.add_argument('--address', action='append', default=[],
+                        help='probe this address instead of matching by name (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=3,
+                        help='simultaneous connections (default: 3)')
+    parser.add_argument('--scan-timeout', type=float, default=10.0)
+    parser.add_argument('--notify-timeout', type=float, default=30.0,
+                        help='seconds to wait for a first notification; 0 skips the probe')
+    parser.add_argument('--request-history', action='store_true',
+                        help='send the history command so cuffs answer without a measurement')
+    parser.add_argument('--report', default='-',
+                        help="JSON report path ('-' for stdout, the default); "
+                             "progress goes to stderr")
+    parser.add_argument('--transport', choices=transport.TRANSPORTS,
+                        help='override HEALTHPAD_TRANSPORT')
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    return args
+
+async def fleet_main(args):
+    report = await run_fleet(args)
+    text = json.dumps(report, indent=2)
+    if args.report == '-':
+        print(text)
+    else:
+        with open(args.report, 'w') as f:
+            f.write(text + '\n')
+        print_info(f"Report written to {args.report}")
+    summary = report['summary']
+    print_header(f"FLEET: {summary['ok']} OK, {summary['failed']} FAILED")
+    return 0 if report['devices'] and summary['failed'] == 0 else 1
+
 async def main():
     """Main diagnostic routine"""
     print("\n")
@@ -229,11 +438,18 @@ async def main():
             print(f"     Service: {char['service']}")
 
 if __name__ == '__main__':
+    args = parse_args()
+    if args.transport:
+        transport.use(args.transport)
+    if args.fleet:
+        OUTPUT = sys.stderr
     try:
+        if args.fleet:
+            sys.exit(asyncio.run(fleet_main(args)))
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("\n\nInterrupted by user")
+        print("\n\nInterrupted by user", file=OUTPUT)
         sys.exit(0)
     except Exception as e:
-        print(f"\nFatal error: {e}")
+        print(f"\nFatal error: {e}", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Health Pad - WebSocket Broadcaster
+Concurrent fan-out with a bounded send queue and writer task per client
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+
+from metrics import BROADCAST_SECONDS, COALESCED_MESSAGES, EVICTED_CLIENTS
+from wire import MessageLog, control
+
+logger = logging.getLogger(__name__)
+
+
+class ClientChannel:
+    """Send queue and writer task for one WebSocket client"""
+
+    def __init__(self, ws, queue_size, client_id, fmt='json'):
+        self.ws = ws
+        self.client_id = client_id
+        self.fmt = fmt
+        # A full deque drops its oldest entry, so a slow client coalesces
+        # towards the latest readings instead of falling further behind
+        # (the sequence gap tells it to resume)
+        self.queue = deque(maxlen=queue_size)
+        # Replayed entries for a resume; sent before the queue, never dropped
+        self.backlog = deque()
+        self.last_seq = 0
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self.task = None
+
+    def put(self, message):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            COALESCED_MESSAGES.inc()
+        self.queue.append(message)
+        self.wakeup.set()
+
+    def next_item(self):
+        if self.backlog:
+            return self.backlog.popleft(), None, None
+        return self.queue.popleft()
+
+
+class Broadcaster:
+    """
+    Numbers each message, encodes it at most once per wire format, and
+    hands it to every client's queue
+
+    The last ``replay_size`` messages stay in ``log`` so reconnecting
+    clients can resume from the last sequence number they saw.
+    """
+
+    def __init__(self, queue_size=32, send_timeout=5.0, replay_size=1024):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.channels = {}
+        self.evicted = 0
+        self.log = MessageLog(replay_size)
+        self._client_ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def register(self, ws, fmt='json', resume=None):
+        """
+        Start delivering broadcasts to ``ws`` in ``fmt`` ('json'/'binary')
+
+        With ``resume``, messages published after that sequence number
+        are replayed first.
+        """
+        channel = ClientChannel(ws, self.queue_size, next(self._client_ids), fmt)
+        channel.last_seq = self.log.last_seq
+        channel.task = asyncio.create_task(self._writer(channel))
+        self.channels[ws] = channel
+        if resume is not None:
+            self.resume(ws, resume)
+        return channel
+
+    def resume(self, ws, seq):
+        """
+        Replay what ``ws`` missed after ``seq``
+
+        Returns False, and queues a 'resync' message, when that is no
+        longer possible; the client should then reload its state over REST.
+        """
+        channel = self.channels.get(ws)
+        if channel is None:
+            return False
+        missed = self.log.since(seq)
+        # Everything queued is also in the log, so the replay supersedes it
+        channel.queue.clear()
+        channel.backlog.clear()
+        if missed is None:
+            channel.last_seq = self.log.last_seq
+            channel.backlog.append(control({'type': 'resync', 'last_seq': self.log.last_seq}))
+        else:
+            channel.last_seq = seq
+            channel.backlog.extend(missed)
+        channel.wakeup.set()
+        return missed is not None
+
+    async def unregister(self, ws):
+        """Stop delivering to ``ws`` and wait for its writer to finish"""
+        channel = self.channels.pop(ws, None)
+        if channel and channel.task is not asyncio.current_task():
+            # wait_for() can swallow a cancel that lands as its send completes
+            # (Python < 3.12); the flag makes the writer exit regardless
+            channel.closed = True
+            channel.wakeup.set()
+            channel.task.cancel()
+            try:
+                await channel.task
+            except asyncio.CancelledError:
+                pass
+
+    def publish(self, message, trace=None):
+        """
+        Number ``message`` and queue it for every client; never waits on a socket
+
+        With a ``trace`` (see tracing.py), each client's send is recorded
+        on it once it completes. Returns the log entry.
+        """
+        entry = self.log.append(message)
+        if self.channels:
+            # One (entry, publish time, trace) item shared by every client queue
+            item = (entry, time.monotonic(), trace)
+            for channel in self.channels.values():
+                channel.put(item)
+        return entry
+
+    async def _writer(self, channel):
+        ws = channel.ws
+        send = ws.send_bytes if channel.fmt == 'binary' else ws.send_str
+        try:
+            while not channel.closed:
+                await channel.wakeup.wait()
+                channel.wakeup.clear()
+                while (channel.backlog or channel.queue) and not channel.closed:
+                    entry, published, trace = channel.next_item()
+                    if entry.seq:
+                        if entry.seq <= channel.last_seq:
+                            continue  # already delivered before a resume
+                        channel.last_seq = entry.seq
+                    await asyncio.wait_for(send(entry.payload(channel.fmt)), self.send_timeout)
+                    if published is not None:
+                        sent = time.monotonic()
+                        BROADCAST_SECONDS.observe(sent - published)
+                        if trace is not None:
+                            trace.send(channel.client_id, published, sent)
+                    channel.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning("Evicting WebSocket client stuck for %ss", self.send_timeout)
+            await self._evict(channel)
+        except Exception as e:
+            logger.error("Error sending to WebSocket: %s", e)
+            await self._evict(channel)
+
+    async def _evict(self, channel):
+        self.channels.pop(channel.ws, None)
+        self.evicted += 1
+        EVICTED_CLIENTS.inc()
+        try:
+            await asyncio.wait_for(channel.ws.close(), self.send_timeout)
+        except Exception:
+            pass
+
+    async def close(self):
+        """Close every client connection, including SSE and long-poll waiters"""
+        self.log.close()
+        for ws in list(self.channels):
+            await self.unregister(ws)
+            await ws.close()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Raw Notification Capture
+Records every BLE notification to a compact binary log, and replays a
+log through the parser offline
+
+Recording is switched on with HEALTHPAD_CAPTURE=<file> for backend.py
+and ihealth_receiver.py. Replay:
+
+    python3 capture.py info cuffs.hpcap
+    python3 capture.py replay cuffs.hpcap                    # parse_data, full speed
+    python3 capture.py replay cuffs.hpcap --target backend   # measurement_callback
+    python3 capture.py replay cuffs.hpcap --speed 1          # real time
+
+The file is the magic b'HPCAP001' followed by records:
+
+    record   <B Q H H H   kind, timestamp (monotonic ns), device id,
+                          characteristic id, payload length; then the payload
+    session  payload <d d: wall clock and monotonic time at the start of a
+             recording; device and characteristic ids restart at every session
+    device   payload is the address, which becomes the next device id
+    char     payload is the characteristic UUID, likewise
+    notify   payload is the notification exactly as received
+
+So a notification costs a 15-byte header on top of its payload, and
+addresses and UUIDs are written once per session. Records are buffered
+and flushed at most every ``flush_interval`` seconds; a crash loses at
+most that much, and the reader stops cleanly at a cut-off last record.
+"""
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'HPCAP001'
+
+KIND_SESSION = 0
+KIND_DEVICE = 1
+KIND_CHAR = 2
+KIND_NOTIFY = 3
+
+_RECORD = struct.Struct('<BQHHH')
+_SESSION = struct.Struct('<dd')
+
+
+class CaptureWriter:
+    """Appends notifications to a capture file (one writer per file)"""
+
+    def __init__(self, path, flush_interval=1.0, buffer_size=64 * 1024):
+        self.path = path
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'ab', buffering=buffer_size)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        else:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise ValueError(f"{path} is not a capture file")
+        self._devices = {}
+        self._chars = {}
+        self._flushed = time.monotonic()
+        self.records = 0
+        self._file.write(_RECORD.pack(KIND_SESSION, time.monotonic_ns(), 0, 0, _SESSION.size))
+        self._file.write(_SESSION.pack(time.time(), time.monotonic()))
+        logger.info("Capturing notifications to %s", path)
+
+    def _intern(self, table, kind, name):
+        ident = table.get(name)
+        if ident is None:
+            ident = table[name] = len(table)
+            encoded = name.encode()
+            self._file.write(_RECORD.pack(kind, 0, ident, 0, len(encoded)))
+            self._file.write(encoded)
+        return ident
+
+    def record(self, address, char_uuid, data, t=None):
+        """
+        Append one notification
+
+        ``t`` is the time.monotonic() at which it arrived (now by default).
+        """
+        if self._file is None:
+            return
+        device = self._devices.get(address)
+        if device is None:
+            device = self._intern(self._devices, KIND_DEVICE, address or '')
+        char_uuid = str(char_uuid).lower() if char_uuid is not None else ''
+        char = self._chars.get(char_uuid)
+        if char is None:
+            char = self._intern(self._chars, KIND_CHAR, char_uuid)
+        now = time.monotonic()
+        stamp = int((now if t is None else t) * 1_000_000_000)
+        self._file.write(_RECORD.pack(KIND_NOTIFY, stamp, device, char, len(data)))
+        self._file.write(data)
+        self.records += 1
+        if now - self._flushed >= self.flush_interval:
+            self._file.flush()
+            self._flushed = now
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info("Captured %d notification(s) to %s", self.records, self.path)
+
+
+def from_env():
+    """A CaptureWriter for HEALTHPAD_CAPTURE, or None when it is not set"""
+    path = os.environ.get('HEALTHPAD_CAPTURE')
+    if not path:
+        return None
+    try:
+        return CaptureWriter(path)
+    except (OSError, ValueError) as e:
+        logger.error("Could not open capture file: %s", e)
+        return None
+
+
+class CaptureReader:
+    """
+    Memory-mapped capture file
+
+    Iterating yields (timestamp, address, char_uuid, payload) for every
+    notification, timestamp in monotonic seconds. Headers are unpacked
+    straight from the mapping, so reading costs no per-record syscalls.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a capture file")
+        self.size = size
+        self.sessions = []
+        self.truncated = False
+
+    def __iter__(self):
+        data = self._map
+        size = self.size
+        unpack = _RECORD.unpack_from
+        header = _RECORD.size
+        devices = []
+        chars = []
+        self.sessions = []
+        self.truncated = False
+        offset = len(MAGIC)
+        while offset < size:
+            if offset + header > size:
+                self.truncated = True
+                break
+            kind, stamp, device, char, length = unpack(data, offset)
+            start = offset + header
+            offset = start + length
+            if offset > size:
+                self.truncated = True
+                break
+            if kind == KIND_NOTIFY:
+                yield stamp / 1_000_000_000, devices[device], chars[char], data[start:offset]
+            elif kind == KIND_DEVICE:
+                devices.append(data[start:offset].decode())
+            elif kind == KIND_CHAR:
+                chars.append(data[start:offset].decode())
+            elif kind == KIND_SESSION:
+                devices.clear()
+                chars.clear()
+                self.sessions.append(_SESSION.unpack_from(data, start))
+            else:
+                raise ValueError(f"Unknown record kind {kind} at offset {offset - length - header}")
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Char:
+    """Stands in for the bleak characteristic passed to notification callbacks"""
+
+    __slots__ = ('uuid',)
+
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+def _parse_target():
+    """Runs notifications through iHealthBP550.parse_data, one receiver per device"""
+    from gatt_uuids import STANDARD_CHAR_UUID
+    from ihealth_receiver import iHealthBP550
+
+    receivers = {}
+    counts = {'frames': 0, 'measurements': 0, 'failures': 0}
+
+    def feed(address, char_uuid, payload):
+        receiver = receivers.get(address)
+        if receiver is None:
+            receiver = receivers[address] = iHealthBP550()
+        # As backend.process_notification: 0x2A35 readings are never split
+        if char_uuid == STANDARD_CHAR_UUID:
+            frames = (payload,)
+        else:
+            frames = receiver.reassembler.feed(payload)
+        for frame in frames:
+            counts['frames'] += 1
+            if receiver.parse_data(frame):
+                counts['measurements'] += 1
+            else:
+                counts['failures'] += 1
+
+    return feed, lambda: counts, lambda: None
+
+
+def _backend_target():
+    """Runs notifications through HealthPadBackend.measurement_callback"""
+    # Same isolation as the benchmarks: simulated BLE, scratch database
+    workdir = tempfile.mkdtemp(prefix='healthpad-replay-')
+    os.environ['HEALTHPAD_TRANSPORT'] = 'sim'
+    os.environ['HEALTHPAD_SIM_DEVICES'] = '0'
+    os.environ.pop('HEALTHPAD_CAPTURE', None)
+    for var, name in (('HEALTHPAD_DB', 'replay.db'), ('HEALTHPAD_STATS', 'stats.json'),
+                      ('HEALTHPAD_GATT_CACHE', 'gatt.json'),
+                      ('HEALTHPAD_REMEMBERED', 'remembered.json')):
+        os.environ[var] = os.path.join(workdir, name)
+
+    import backend as backend_module
+    import metrics
+    from devices import DeviceSession
+
+    backend = backend_module.backend
+    sessions = {}
+    chars = {}
+    failures = metrics.PARSE_FAILURES.value
+    first_seq = backend.broadcaster.log.last_seq
+
+    def feed(address, char_uuid, payload):
+        session = sessions.get(address)
+        if session is None:
+            session = sessions[address] = DeviceSession(address, backend.measurement_callback)
+        char = chars.get(char_uuid)
+        if char is None:
+            char = chars[char_uuid] = _Char(char_uuid)
+        session.notification_handler(char, payload)
+        # What the ingest consumer would do for this notification
+        backend.ingest.drain()
+
+    def counts():
+        return {
+            'measurements': backend.broadcaster.log.last_seq - first_seq,
+            'failures': metrics.PARSE_FAILURES.value - failures,
+            'database': backend.store.path,
+        }
+
+    def finish():
+        backend.store.flush()
+        backend.store.close()
+
+    return feed, counts, finish
+
+
+def replay(path, target='parse', speed=0.0, device=None):
+    """
+    Feed a capture through ``target`` ('parse' or 'backend')
+
+    ``speed`` 0 replays as fast as possible; otherwise notifications keep
+    their recorded spacing, scaled by 1/speed (1 = real time). Gaps
+    between recording sessions are skipped. Returns a summary dict.
+    """
+    feed, counts, finish = (_backend_target if target == 'backend' else _parse_target)()
+    notifications = 0
+    payload_bytes = 0
+    started = time.perf_counter()
+    with CaptureReader(path) as reader:
+        origin = None
+        session = None
+        for stamp, address, char_uuid, payload in reader:
+            if device is not None and address != device:
+                continue
+            if speed:
+                if session != len(reader.sessions):
+                    # First record of a recording session: restart the clock
+                    session = len(reader.sessions)
+                    origin = time.perf_counter() - stamp / speed
+                delay = origin + stamp / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            feed(address, char_uuid, payload)
+            notifications += 1
+            payload_bytes += len(payload)
+        truncated = reader.truncated
+        sessions = len(reader.sessions)
+    finish()
+    elapsed = time.perf_counter() - started
+    return {
+        'file': path,
+        'target': target,
+        'sessions': sessions,
+        'notifications': notifications,
+        'payload_bytes': payload_bytes,
+        **counts(),
+        'truncated': truncated,
+        'seconds': round(elapsed, 3),
+        'notifications_per_s': round(notifications / elapsed) if elapsed else None,
+    }
+
+
+def info(path):
+    """Sessions, devices, characteristics and counts in a capture"""
+    devices = {}
+    chars = {}
+    # Per session, since each one may be on a different monotonic clock
+    spans = {}
+    notifications = 0
+    with CaptureReader(path) as reader:
+        for stamp, address, char_uuid, payload in reader:
+            notifications += 1
+            devices[address] = devices.get(address, 0) + 1
+            chars[char_uuid] = chars.get(char_uuid, 0) + 1
+            first, _ = spans.get(len(reader.sessions), (stamp, stamp))
+            spans[len(reader.sessions)] = (first, stamp)
+        return {
+            'file': path,
+            'bytes': reader.size,
+            'sessions': [
+                {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(wall))}
+                for wall, _ in reader.sessions
+            ],
+            'notifications': notifications,
+            'devices': devices,
+            'characteristics': chars,
+            'span_s': round(sum(last - first for first, last in spans.values()), 3),
+            'truncated': reader.truncated,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and replay raw notification captures')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info_parser = commands.add_parser('info', help='summarize a capture file')
+    info_parser.add_argument('file')
+    replay_parser = commands.add_parser('replay', help='run a capture through the parser')
+    replay_parser.add_argument('file')
+    replay_parser.add_argument('--target', choices=('parse', 'backend'), default='parse',
+                               help='iHealthBP550.parse_data (default) or the whole '
+                                    'backend pipeline via measurement_callback')
+    replay_parser.add_argument('--speed', type=float, default=0.0,
+                               help='1 = real time, 10 = ten times faster; 0 (default) = '
+                                    'as fast as possible')
+    replay_parser.add_argument('--device', help='only this address')
+    args = parser.parse_args()
+
+    # Unparsed frames are logged (rate-limited); readings are not
+    from log_pipeline import setup_logging, stop_logging
+    setup_logging(level='WARNING')
+    try:
+        if args.command == 'info':
+            result = info(args.file)
+        else:
+            result = replay(args.file, args.target, args.speed, args.device)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        return 1
+    finally:
+        stop_logging()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
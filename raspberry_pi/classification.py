@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Blood Pressure Classification
+Category codes and the shared records every reading points at
+"""
+
+from bisect import bisect_right
+
+NORMAL, ELEVATED, HIGH1, HIGH2, CRISIS = range(5)
+
+# Indexed by category code. These dicts are shared by every measurement
+# that falls in the category, so treat them as read-only.
+CATEGORIES = (
+    {'level': 'normal', 'name': 'Normal', 'color': '#00C853'},
+    {'level': 'elevated', 'name': 'Elevated', 'color': '#FFC107'},
+    {'level': 'high1', 'name': 'High Blood Pressure Stage 1', 'color': '#FF9800'},
+    {'level': 'high2', 'name': 'High Blood Pressure Stage 2', 'color': '#F44336'},
+    {'level': 'crisis', 'name': 'Hypertensive Crisis', 'color': '#B71C1C'},
+)
+LEVEL_CODES = {c['level']: code for code, c in enumerate(CATEGORIES)}
+
+# The category is the higher of what each value alone would give.
+# Diastolic has no "elevated" band: below 80 it is normal.
+SYSTOLIC_THRESHOLDS = (120, 130, 140, 180)     # -> ELEVATED..CRISIS
+DIASTOLIC_THRESHOLDS = (80, 90, 120)           # -> HIGH1..CRISIS
+DIASTOLIC_CODES = (NORMAL, HIGH1, HIGH2, CRISIS)
+
+
+def classify_code(systolic, diastolic):
+    """Category code for one reading"""
+    return max(
+        bisect_right(SYSTOLIC_THRESHOLDS, systolic),
+        DIASTOLIC_CODES[bisect_right(DIASTOLIC_THRESHOLDS, diastolic)]
+    )
+
+
+def classify_bp(systolic, diastolic):
+    """Shared category record for one reading"""
+    return CATEGORIES[classify_code(systolic, diastolic)]
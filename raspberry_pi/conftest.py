@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+# The gateway modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Tests that import backend get simulated BLE and a scratch database,
+# never the real ~/healthpad files
+_workdir = tempfile.mkdtemp(prefix='healthpad-tests-')
+os.environ.setdefault('HEALTHPAD_TRANSPORT', 'sim')
+os.environ.setdefault('HEALTHPAD_SIM_DEVICES', '0')
+for _var, _name in (('HEALTHPAD_DB', 'test.db'), ('HEALTHPAD_STATS', 'stats.json'),
+                    ('HEALTHPAD_GATT_CACHE', 'gatt.json'),
+                    ('HEALTHPAD_REMEMBERED', 'remembered.json')):
+    os.environ.setdefault(_var, os.path.join(_workdir, _name))
+
+# An interactive diagnostic script, not a test module
+collect_ignore = ['bluetooth_test.py']
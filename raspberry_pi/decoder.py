@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Packet Decoder
+Table-driven decoding of iHealth (0xFD/0xFE) and standard 0x2A35 frames
+"""
+
+import struct
+from datetime import datetime
+
+from gatt_uuids import STANDARD_CHAR_UUID
+
+# iHealth frame (layout from IHEALTH_BLUETOOTH_PROTOCOL.md):
+#   [FD|FE] [SYS lo hi] [DIA lo hi] [PUL] [YY MM DD hh mm] [SUM]
+# YY is years since 2000 and SUM is the low byte of the sum of all
+# preceding bytes. Short frames carrying only the values are still decoded.
+IHEALTH_MARKERS = (0xFD, 0xFE)
+_IHEALTH = struct.Struct('<HHB')
+_IHEALTH_TIME = struct.Struct('<5B')
+IHEALTH_MIN_SIZE = 1 + _IHEALTH.size
+IHEALTH_FRAME_SIZE = IHEALTH_MIN_SIZE + _IHEALTH_TIME.size + 1
+
+# Blood Pressure Measurement (0x2A35): flags, then SYS/DIA/MAP as SFLOAT and
+# optional fields in this order depending on the flag bits
+BPM_FLAG_KPA = 0x01
+BPM_FLAG_TIMESTAMP = 0x02
+BPM_FLAG_PULSE = 0x04
+BPM_FLAG_USER_ID = 0x08
+BPM_FLAG_STATUS = 0x10
+
+_BPM_VALUES = struct.Struct('<HHH')
+_BPM_TIMESTAMP = struct.Struct('<HBBBBB')
+_UINT16 = struct.Struct('<H')
+BPM_MIN_SIZE = 1 + _BPM_VALUES.size
+
+KPA_TO_MMHG = 7.50062
+
+# IEEE-11073 16-bit SFLOAT special values
+_SFLOAT_SPECIAL = frozenset((0x07FF, 0x0800, 0x07FE, 0x0802, 0x0801))
+
+
+def sfloat(raw):
+    """Decode an IEEE-11073 SFLOAT; None for NaN/NRes/INF/reserved"""
+    if raw in _SFLOAT_SPECIAL:
+        return None
+    mantissa = raw & 0x0FFF
+    if mantissa >= 0x0800:
+        mantissa -= 0x1000
+    exponent = raw >> 12
+    if exponent >= 0x8:
+        exponent -= 0x10
+    return mantissa * (10 ** exponent)
+
+
+def ihealth_checksum(buf):
+    """Checksum byte for an iHealth frame (everything but the last byte)"""
+    return sum(buf[:-1]) & 0xFF
+
+
+def encode_ihealth_frame(systolic, diastolic, pulse, measured_at=None, marker=0xFD):
+    """Build a complete iHealth frame (used by the simulator and tools)"""
+    frame = bytearray(IHEALTH_FRAME_SIZE)
+    frame[0] = marker
+    _IHEALTH.pack_into(frame, 1, systolic, diastolic, pulse)
+    if measured_at is not None:
+        _IHEALTH_TIME.pack_into(
+            frame, IHEALTH_MIN_SIZE, measured_at.year - 2000, measured_at.month,
+            measured_at.day, measured_at.hour, measured_at.minute
+        )
+    frame[-1] = ihealth_checksum(frame)
+    return bytes(frame)
+
+
+def _plausible(systolic, diastolic, pulse):
+    return 50 <= systolic <= 250 and 30 <= diastolic <= 150 and 0 <= pulse <= 200
+
+
+def _decode_ihealth(buf):
+    if len(buf) < IHEALTH_MIN_SIZE:
+        return None
+    systolic, diastolic, pulse = _IHEALTH.unpack_from(buf, 1)
+    if not _plausible(systolic, diastolic, pulse):
+        return None
+    result = {
+        'frame': 'ihealth',
+        'systolic': systolic,
+        'diastolic': diastolic,
+        'pulse': pulse,
+    }
+    if len(buf) >= IHEALTH_FRAME_SIZE:
+        year, month, day, hour, minute = _IHEALTH_TIME.unpack_from(buf, IHEALTH_MIN_SIZE)
+        try:
+            result['measured_at'] = datetime(
+                2000 + year, month, day, hour, minute
+            ).isoformat()
+        except ValueError:
+            pass  # live readings may leave the record time zeroed
+    return result
+
+
+def _decode_bpm(buf):
+    if len(buf) < BPM_MIN_SIZE:
+        return None
+    flags = buf[0]
+    raw_sys, raw_dia, raw_map = _BPM_VALUES.unpack_from(buf, 1)
+    systolic, diastolic, mean = sfloat(raw_sys), sfloat(raw_dia), sfloat(raw_map)
+    if systolic is None or diastolic is None:
+        return None
+
+    scale = KPA_TO_MMHG if flags & BPM_FLAG_KPA else 1
+    result = {
+        'frame': 'bpm',
+        'systolic': round(systolic * scale),
+        'diastolic': round(diastolic * scale),
+        'pulse': 0,
+    }
+    if mean is not None:
+        result['map'] = round(mean * scale)
+
+    offset = BPM_MIN_SIZE
+    if flags & BPM_FLAG_TIMESTAMP:
+        if len(buf) < offset + _BPM_TIMESTAMP.size:
+            return None
+        year, month, day, hour, minute, second = _BPM_TIMESTAMP.unpack_from(buf, offset)
+        offset += _BPM_TIMESTAMP.size
+        try:
+            result['measured_at'] = datetime(
+                year, month, day, hour, minute, second
+            ).isoformat()
+        except ValueError:
+            pass  # "unknown" date fields are encoded as zeros
+    if flags & BPM_FLAG_PULSE:
+        if len(buf) < offset + 2:
+            return None
+        pulse = sfloat(_UINT16.unpack_from(buf, offset)[0])
+        offset += 2
+        result['pulse'] = round(pulse) if pulse is not None else 0
+    if flags & BPM_FLAG_USER_ID:
+        if len(buf) < offset + 1:
+            return None
+        result['user_id'] = buf[offset]
+        offset += 1
+    if flags & BPM_FLAG_STATUS:
+        if len(buf) < offset + 2:
+            return None
+        result['status'] = _UINT16.unpack_from(buf, offset)[0]
+
+    if not _plausible(result['systolic'], result['diastolic'], result['pulse']):
+        return None
+    return result
+
+
+# Dispatch on the first byte: iHealth markers, or a 0x2A35 flags byte (only
+# the low five bits are defined, so 0x00-0x1F)
+_DECODERS = [None] * 256
+for _marker in IHEALTH_MARKERS:
+    _DECODERS[_marker] = _decode_ihealth
+for _flags in range(0x20):
+    _DECODERS[_flags] = _decode_bpm
+_DECODERS = tuple(_DECODERS)
+
+
+def decode(data, char_uuid=None):
+    """
+    Decode one notification payload into a measurement dict, or None
+
+    ``data`` may be bytes, bytearray or memoryview; it is never copied.
+    Pass ``char_uuid`` to force 0x2A35 decoding for the standard
+    characteristic.
+    """
+    buf = data if isinstance(data, memoryview) else memoryview(data)
+    if not buf:
+        return None
+    if char_uuid is not None and str(char_uuid).lower() == STANDARD_CHAR_UUID:
+        return _decode_bpm(buf)
+    decoder = _DECODERS[buf[0]]
+    return decoder(buf) if decoder else None
+
+
+def decode_many(buffers, char_uuid=None):
+    """Decode a batch of payloads; results line up with ``buffers``"""
+    force_bpm = (char_uuid is not None and
+                 str(char_uuid).lower() == STANDARD_CHAR_UUID)
+    decoders = _DECODERS
+    results = []
+    append = results.append
+    for data in buffers:
+        buf = data if isinstance(data, memoryview) else memoryview(data)
+        if not buf:
+            append(None)
+        elif force_bpm:
+            append(_decode_bpm(buf))
+        else:
+            decoder = decoders[buf[0]]
+            append(decoder(buf) if decoder else None)
+    return results
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Device Sessions
+Keeps many BleakClient connections alive on one event loop
+"""
+
+import asyncio
+import logging
+import time
+import transport
+from gatt_cache import service_table
+from gatt_uuids import IHEALTH_RECEIVE_CHAR, MEASUREMENT_CHAR_UUIDS
+from metrics import CONNECT_SECONDS
+from reassembler import FrameReassembler
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceSession:
+    """One connected cuff: its client, subscriptions and latest reading"""
+
+    def __init__(self, address, on_notification, gatt_cache=None, on_event=None,
+                 resolve_device=None):
+        self.address = address
+        self.gatt_cache = gatt_cache
+        self.client = None
+        self.connected = False
+        self.last_measurement = None
+        self.notify_chars = []
+        self.write_char = None
+        self.reassembler = FrameReassembler()
+        # Set by HistorySync during a history download; takes stored
+        # records (returns True) and declines live readings
+        self.history_sink = None
+        self._on_notification = on_notification
+        self._on_event = on_event or (lambda event, session: None)
+        self._resolve_device = resolve_device or (lambda address: None)
+
+    def notification_handler(self, sender, data):
+        """Forward a notification together with the session it arrived on"""
+        self._on_notification(self, sender, data)
+
+    async def connect(self):
+        """Connect and subscribe, from the GATT cache when possible"""
+        cached = self.gatt_cache.get(self.address) if self.gatt_cache else None
+        started = time.perf_counter()
+        try:
+            logger.info("Connecting to %s...", self.address)
+            self.reassembler.reset()
+            self.notify_chars = []
+            # A BLEDevice from the background scanner lets bleak connect
+            # without running its own scan to look up the address
+            target = self._resolve_device(self.address) or self.address
+            if cached:
+                # Only resolve the services holding the cached characteristics
+                used = {c['service'] for c in cached['notify']}
+                if cached.get('write'):
+                    used.add(cached['write']['service'])
+                self.client = transport.Client(
+                    target,
+                    disconnected_callback=self._handle_disconnect,
+                    services=sorted(used)
+                )
+            else:
+                self.client = transport.Client(
+                    target,
+                    disconnected_callback=self._handle_disconnect
+                )
+            await self.client.connect()
+            self.connected = True
+            logger.info("✓ Connected to %s", self.address)
+
+            if not (cached and await self._subscribe_cached(cached)):
+                if cached:
+                    self.gatt_cache.invalidate(self.address)
+                    self.notify_chars = []
+                await self._discover_and_subscribe()
+
+            CONNECT_SECONDS.observe(time.perf_counter() - started)
+            self._on_event('connected', self)
+            return True
+        except Exception as e:
+            logger.error("Connection to %s failed: %s", self.address, e)
+            linked, self.connected = self.connected, False
+            if linked:
+                # Setup failed after the link came up: close it, or the cuff
+                # refuses the next attempt as connected to another client
+                try:
+                    await self.client.disconnect()
+                except Exception as e:
+                    logger.debug("Error closing %s after a failed setup: %s", self.address, e)
+            return False
+
+    async def _subscribe_cached(self, cached):
+        """Subscribe to the cached characteristics; False if any fails"""
+        for char in cached['notify']:
+            try:
+                await self.client.start_notify(char['handle'], self.notification_handler)
+            except Exception as e:
+                logger.warning("[%s] Cached subscription to %s failed: %s",
+                               self.address, char['uuid'], e)
+                return False
+            self.notify_chars.append(char['uuid'])
+        self.write_char = cached.get('write')
+        logger.info("[%s] ✓ Subscribed from GATT cache", self.address)
+        return bool(self.notify_chars)
+
+    async def _discover_and_subscribe(self):
+        """Walk the service table, subscribe and refresh the cache"""
+        try:
+            services = self.client.services
+        except AttributeError:
+            services = await self.client.get_services()
+        # The service walk is debug output: at INFO it is a dozen records
+        # per connect. %-style arguments are only formatted if enabled.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s] Total services: %d", self.address, len(list(services)))
+
+        subscribed = []
+        for service in services:
+            logger.debug("[%s] Service: %s", self.address, service.uuid)
+
+            for char in service.characteristics:
+                logger.debug("  ├─ Characteristic: %s %s", char.uuid, char.properties)
+
+                uuid_str = str(char.uuid).lower()
+                if uuid_str == IHEALTH_RECEIVE_CHAR:
+                    self.write_char = {
+                        'uuid': uuid_str,
+                        'handle': char.handle,
+                        'service': str(service.uuid),
+                    }
+                if uuid_str not in MEASUREMENT_CHAR_UUIDS or 'notify' not in char.properties:
+                    continue
+
+                try:
+                    await self.client.start_notify(char, self.notification_handler)
+                    self.notify_chars.append(uuid_str)
+                    subscribed.append({
+                        'uuid': uuid_str,
+                        'handle': char.handle,
+                        'service': str(service.uuid),
+                    })
+                    logger.debug("  │  ✓ Subscribed to notifications")
+                except Exception as e:
+                    logger.warning("[%s] Could not subscribe to %s: %s", self.address, uuid_str, e)
+
+        if not subscribed:
+            logger.warning("[%s] ⚠ No measurement characteristic found", self.address)
+            return
+        logger.info("[%s] ✓ Subscribed to %d measurement characteristic(s)",
+                    self.address, len(subscribed))
+        if self.gatt_cache is not None:
+            self.gatt_cache.put(
+                self.address, service_table(services), subscribed, self.write_char
+            )
+
+    def _handle_disconnect(self, client):
+        """bleak disconnected_callback: the link dropped"""
+        if client is not self.client or not self.connected:
+            return  # stale client, or we already know
+        self.connected = False
+        logger.warning("⚠ Lost connection to %s", self.address)
+        self._on_event('disconnected', self)
+
+    async def disconnect(self):
+        """Disconnect this session"""
+        was_connected = self.connected
+        self.connected = False
+        if self.client:
+            try:
+                await self.client.disconnect()
+            except Exception as e:
+                logger.warning("Error disconnecting %s: %s", self.address, e)
+        self.notify_chars = []
+        logger.info("Disconnected from %s", self.address)
+        if was_connected:
+            self._on_event('disconnected', self)
+
+    def status(self):
+        """Per-device status for the API"""
+        return {
+            'address': self.address,
+            'connected': self.connected,
+            'characteristics': list(self.notify_chars),
+            'last_measurement': self.last_measurement,
+        }
+
+
+class DeviceManager:
+    """All device sessions of this gateway, keyed by address"""
+
+    def __init__(self, on_notification, gatt_cache=None, resolve_device=None):
+        self.sessions = {}
+        self.gatt_cache = gatt_cache
+        self.resolve_device = resolve_device
+        self._on_notification = on_notification
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call ``callback(event, session)`` on 'connected'/'disconnected'"""
+        self._listeners.append(callback)
+
+    def _emit(self, event, session):
+        for callback in self._listeners:
+            try:
+                callback(event, session)
+            except Exception as e:
+                logger.error("Device listener failed: %s", e)
+
+    @property
+    def connected_count(self):
+        return sum(1 for s in self.sessions.values() if s.connected)
+
+    def get(self, address):
+        return self.sessions.get(address)
+
+    async def connect(self, address):
+        """Connect one device, keeping every other session alive"""
+        if not address:
+            logger.warning("Connect requested without an address")
+            return False
+        session = self.sessions.get(address)
+        if session and session.connected:
+            logger.info("%s already connected", address)
+            return True
+
+        created = session is None
+        session = self.session(address)
+        if await session.connect():
+            return True
+        # A first attempt that failed leaves nothing behind in /api/status;
+        # a session the supervisor is reconnecting stays where it is
+        if created and self.sessions.get(address) is session:
+            del self.sessions[address]
+        return False
+
+    def session(self, address):
+        """The session for ``address``, created if needed"""
+        session = self.sessions.get(address)
+        if session is None:
+            session = DeviceSession(
+                address, self._on_notification, self.gatt_cache, self._emit,
+                self.resolve_device
+            )
+            self.sessions[address] = session
+        return session
+
+    async def connect_many(self, addresses):
+        """Connect several devices concurrently"""
+        results = await asyncio.gather(*(self.connect(a) for a in addresses))
+        return dict(zip(addresses, results))
+
+    async def disconnect(self, address=None):
+        """Disconnect one device, or all of them when no address is given"""
+        if address is None:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        else:
+            session = self.sessions.pop(address, None)
+            sessions = [session] if session else []
+
+        await asyncio.gather(*(s.disconnect() for s in sessions))
+        return len(sessions)
+
+    def status(self):
+        return [s.status() for s in self.sessions.values()]
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Health Pad - GATT Cache
+Remembers each device's service table and measurement characteristics
+"""
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'HEALTHPAD_GATT_CACHE',
+    os.path.expanduser('~/healthpad/gatt_cache.json')
+)
+
+
+def service_table(services):
+    """Plain-data copy of a bleak service collection"""
+    return [
+        {
+            'uuid': str(service.uuid),
+            'characteristics': [
+                {
+                    'uuid': str(char.uuid),
+                    'handle': char.handle,
+                    'properties': list(char.properties),
+                }
+                for char in service.characteristics
+            ],
+        }
+        for service in services
+    ]
+
+
+class GattCache:
+    """
+    Persistent map of device address -> resolved GATT layout
+
+    Each entry holds the service table plus the characteristics we
+    subscribed to (``notify``) and write commands to (``write``), so a
+    reconnect can subscribe straight away without walking the table.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable GATT cache %s: %s", path, e)
+
+    def __contains__(self, address):
+        return address in self.entries
+
+    def addresses(self):
+        return list(self.entries)
+
+    def get(self, address):
+        return self.entries.get(address)
+
+    def put(self, address, services, notify, write=None):
+        """Cache the layout of ``address``; ``notify``/``write`` are char dicts"""
+        self.entries[address] = {
+            'services': services,
+            'notify': notify,
+            'write': write,
+            'cached_at': time.time(),
+        }
+        self._save()
+
+    def invalidate(self, address):
+        if self.entries.pop(address, None) is not None:
+            logger.info("GATT cache invalidated for %s", address)
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Could not write GATT cache %s: %s", self.path, e)
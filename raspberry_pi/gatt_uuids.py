@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Health Pad - GATT UUIDs
+The services and characteristics the gateway talks to, defined once
+"""
+
+# iHealth private service "com.jiuan.dev" (some stacks list it byte-swapped,
+# as 6d6f2e6a-6975-616e-2e64-657600000000; see UUID_REFERENCE.md)
+IHEALTH_SERVICE_UUID = "636f6d2e-6a69-7561-6e2e-646576000000"
+
+# iHealth "sed." (notify: cuff to gateway) and "rec." (write: gateway to cuff)
+IHEALTH_SEND_CHAR = "7365642e-6a69-7561-6e2e-646576000000"
+IHEALTH_RECEIVE_CHAR = "7265632e-6a69-7561-6e2e-646576000000"
+
+# Standard BLE Blood Pressure Service and Measurement characteristic
+STANDARD_SERVICE_UUID = "00001810-0000-1000-8000-00805f9b34fb"
+STANDARD_CHAR_UUID = "00002a35-0000-1000-8000-00805f9b34fb"
+
+# Characteristics a session subscribes to for readings
+MEASUREMENT_CHAR_UUIDS = (IHEALTH_SEND_CHAR, STANDARD_CHAR_UUID)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Health Pad - History Sync
+Downloads readings stored on the cuff with the 0x12 "get history" command
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from decoder import decode
+
+logger = logging.getLogger(__name__)
+
+# FD FD FA 05 12 00 - see IHEALTH_BLUETOOTH_PROTOCOL.md
+GET_HISTORY_COMMAND = bytes([0xFD, 0xFD, 0xFA, 0x05, 0x12, 0x00])
+
+
+class HistorySync:
+    """
+    Pulls a device's stored readings in one connection
+
+    While a sync runs, the session offers every reassembled frame to
+    ``session.history_sink``. Stored records (frames carrying a record
+    time older than ``live_window`` seconds) are taken into a queue;
+    anything else is declined and handled as a live reading. Records are
+    written in batches of up to ``batch_size``, and whatever has arrived
+    is written as soon as the line goes quiet. The transfer is complete
+    once no record has arrived for ``idle_timeout`` seconds, and stops
+    after ``max_duration`` seconds regardless. Records at or before the
+    per-device cursor, or already in the store (a live reading's copy),
+    are skipped; new ones are also folded into ``stats``.
+    """
+
+    def __init__(self, store, classify=None, idle_timeout=2.0,
+                 first_record_timeout=5.0, batch_size=64, max_duration=120.0,
+                 live_window=120.0, stats=None):
+        self.store = store
+        self.classify = classify
+        self.stats = stats
+        self.idle_timeout = idle_timeout
+        self.first_record_timeout = first_record_timeout
+        self.batch_size = batch_size
+        self.max_duration = max_duration
+        self.live_window = live_window
+        self.running = {}
+
+    async def sync(self, session):
+        """Run one history download for ``session``; returns a summary dict"""
+        address = session.address
+        if address in self.running:
+            return await asyncio.shield(self.running[address])
+        task = asyncio.ensure_future(self._sync(session))
+        self.running[address] = task
+        try:
+            return await task
+        finally:
+            self.running.pop(address, None)
+
+    async def _sync(self, session):
+        address = session.address
+        summary = {'address': address, 'received': 0, 'stored': 0, 'skipped': 0,
+                   'live': 0, 'undecodable': 0}
+        if not session.connected or not session.write_char:
+            summary['error'] = 'device not connected or has no command characteristic'
+            return summary
+
+        state = self.store.sync_state(address)
+        cursor = state['cursor'] if state else None
+        newest = cursor
+        records = asyncio.Queue()
+        session.history_sink = self._sink(records, summary)
+        started = time.monotonic()
+        deadline = started + self.max_duration
+        try:
+            await session.client.write_gatt_char(
+                session.write_char['handle'], GET_HISTORY_COMMAND, response=False
+            )
+            logger.info("[%s] History requested (cursor: %s)", address, cursor)
+
+            timeout = self.first_record_timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    summary['timed_out'] = True
+                    logger.warning("[%s] History sync stopped after %ss",
+                                   address, self.max_duration)
+                    break
+                try:
+                    batch = [await asyncio.wait_for(records.get(), min(timeout, remaining))]
+                except asyncio.TimeoutError:
+                    if timeout >= remaining:
+                        continue  # the deadline, not the device, ran out
+                    break
+                timeout = self.idle_timeout
+                # Everything that has already arrived, then write: a
+                # batch is full or the line has gone quiet
+                while not records.empty() and len(batch) < self.batch_size:
+                    batch.append(records.get_nowait())
+                newest = await self._store_batch(address, batch, cursor, newest, summary)
+        except Exception as e:
+            logger.error("[%s] History sync failed: %s", address, e)
+            summary['error'] = str(e)
+        finally:
+            session.history_sink = None
+        # Records queued before the sink was removed
+        leftover = []
+        while not records.empty():
+            leftover.append(records.get_nowait())
+        if leftover:
+            newest = await self._store_batch(address, leftover, cursor, newest, summary)
+
+        # An unfinished download may have missed older records: keep the cursor
+        if 'error' not in summary and 'timed_out' not in summary:
+            self.store.set_sync_cursor(address, newest, summary['stored'])
+        summary['cursor'] = newest
+        summary['duration_s'] = round(time.monotonic() - started, 3)
+        logger.info("[%s] History sync: %d received, %d new, %d already synced, "
+                    "%d live frame(s) passed on (%d undecodable)",
+                    address, summary['received'], summary['stored'], summary['skipped'],
+                    summary['live'], summary['undecodable'])
+        return summary
+
+    def _sink(self, records, summary):
+        """session.history_sink: True if ``frame`` was taken as a stored record"""
+        def sink(frame):
+            decoded = decode(frame)
+            if decoded is not None and 'measured_at' in decoded:
+                measured_at = datetime.fromisoformat(decoded['measured_at']).timestamp()
+                if measured_at < time.time() - self.live_window:
+                    decoded['_measured_ts'] = measured_at
+                    records.put_nowait(decoded)
+                    return True
+            # Live readings (and anything unreadable) take the normal path
+            summary['live'] += 1
+            if decoded is None:
+                summary['undecodable'] += 1
+            return False
+        return sink
+
+    async def _store_batch(self, address, batch, cursor, newest, summary):
+        now = datetime.now().isoformat()
+        times = [decoded['_measured_ts'] for decoded in batch]
+        # Copies of readings that were stored live; the store would ignore
+        # them, but stats must not count them twice
+        stored = await asyncio.get_running_loop().run_in_executor(
+            None, self.store.stored_records, address, min(times), max(times)
+        )
+        records = []
+        for decoded in batch:
+            summary['received'] += 1
+            measured_at = decoded.pop('_measured_ts')
+            values = (decoded['systolic'], decoded['diastolic'], decoded['pulse'])
+            if cursor is not None and measured_at <= cursor:
+                summary['skipped'] += 1
+                continue
+            if newest is None or measured_at > newest:
+                newest = measured_at
+            if (measured_at,) + values in stored:
+                summary['skipped'] += 1
+                continue
+            decoded.update(address=address, timestamp=now, source='history')
+            if self.classify:
+                decoded['classification'] = self.classify(*values[:2])
+            records.append(decoded)
+            if self.stats is not None:
+                self.stats.update(address, measured_at, *values)
+        if records:
+            self.store.append_many(records)
+            summary['stored'] += len(records)
+        return newest
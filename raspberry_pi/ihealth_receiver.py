@@ -7,30 +7,48 @@ Receives and parses measurements from iHealth KN-550BT
 import asyncio
 import sys
 import json
+import logging
 from datetime import datetime
-from bleak import BleakScanner, BleakClient
+import capture
+import transport
+from decoder import decode
+from gatt_uuids import IHEALTH_RECEIVE_CHAR, IHEALTH_SEND_CHAR, IHEALTH_SERVICE_UUID
+from history_sync import GET_HISTORY_COMMAND
+from log_pipeline import PACKET_LOGGER, HexDump, setup_logging
+from reassembler import FrameReassembler
+from store import MeasurementStore
+from supervisor import backoff_delay
+
+logger = logging.getLogger(__name__)
+# 每个通知的调试输出 (限速): HEALTHPAD_LOG_LEVELS=packets=DEBUG
+packet_logger = logging.getLogger(PACKET_LOGGER)
 
 class iHealthBP550:
     """iHealth KN-550BT血压计处理类"""
     
     # iHealth 私有协议 UUIDs (根据你提供的信息)
-    SERVICE_UUID = "636f6d2e-6a69-7561-6e2e-646576000000"  # "com.jiuan.dev"
-    NOTIFY_CHAR = "7365642e-6a69-7561-6e2e-646576000000"   # "sed." (接收数据)
-    WRITE_CHAR = "7265632e-6a69-7561-6e2e-646576000000"    # "rec." (发送命令)
+    SERVICE_UUID = IHEALTH_SERVICE_UUID  # "com.jiuan.dev"
+    NOTIFY_CHAR = IHEALTH_SEND_CHAR      # "sed." (接收数据)
+    WRITE_CHAR = IHEALTH_RECEIVE_CHAR    # "rec." (发送命令)
     
     DEVICE_NAME = "KN-550BT"
     
-    def __init__(self):
+    def __init__(self, store=None, capture=None):
         self.device = None
         self.client = None
         self.measurement_data = []
+        self.store = store
+        # 原始通知录制 (HEALTHPAD_CAPTURE)，可用 capture.py replay 离线重放
+        self.capture = capture
+        self.reassembler = FrameReassembler()
+        self.disconnected = asyncio.Event()
     
     async def scan(self, timeout=10):
         """扫描并找到 iHealth 设备"""
         print(f"🔍 扫描蓝牙设备 ({timeout} 秒)...")
         
         try:
-            devices = await BleakScanner.discover(timeout=timeout)
+            devices = await transport.Scanner.discover(timeout=timeout)
             
             for device in devices:
                 if self.DEVICE_NAME in (device.name or ""):
@@ -53,7 +71,12 @@ class iHealthBP550:
         
         try:
             print(f"🔗 正在连接到 {self.device.name}...")
-            self.client = BleakClient(self.device.address)
+            self.disconnected.clear()
+            self.reassembler.reset()
+            self.client = transport.Client(
+                self.device,
+                disconnected_callback=lambda client: self.disconnected.set()
+            )
             await self.client.connect()
             print("✓ 已连接")
             
@@ -82,64 +105,47 @@ class iHealthBP550:
     
     def notification_handler(self, sender, data):
         """处理接收到的数据"""
-        timestamp = datetime.now().isoformat()
+        received_at = datetime.now().isoformat()
+        if self.capture:
+            self.capture.record(self.device.address if self.device else '',
+                                getattr(sender, 'uuid', self.NOTIFY_CHAR), data)
         
-        print(f"\n📩 收到数据:")
-        print(f"   时间: {timestamp}")
-        print(f"   长度: {len(data)} 字节")
-        print(f"   16进制: {data.hex()}")
+        # 日志在后台线程写出，不阻塞通知处理
+        packet_logger.debug("📩 收到数据: %d 字节 %s", len(data), HexDump(data))
         
-        # 尝试解析数据
-        parsed = self.parse_data(data)
-        if parsed:
-            print(f"\n🩺 血压测量:")
-            print(f"   收缩压 (SYS): {parsed['systolic']} mmHg")
-            print(f"   舒张压 (DIA): {parsed['diastolic']} mmHg")
-            print(f"   心率 (PUL): {parsed['pulse']} bpm")
-            
-            # 保存到列表
-            parsed['timestamp'] = timestamp
-            self.measurement_data.append(parsed)
+        # 通知可能只包含半帧或多帧数据，先重组成完整帧再解析
+        frames = self.reassembler.feed(data)
+        if not frames and self.reassembler.pending:
+            packet_logger.debug("   ⋯ 等待后续数据 (已缓存 %d 字节)", self.reassembler.pending)
+        
+        for frame in frames:
+            parsed = self.parse_data(frame)
+            if parsed:
+                logger.info("🩺 血压测量: 收缩压 %s mmHg, 舒张压 %s mmHg, 心率 %s bpm",
+                            parsed['systolic'], parsed['diastolic'], parsed['pulse'])
+                
+                # 保存到列表，并立即写入数据库 (崩溃也不会丢失)
+                # 历史记录使用血压计记录的测量时间，而不是收到的时间
+                parsed['timestamp'] = parsed.get('measured_at') or received_at
+                self.measurement_data.append(parsed)
+                if self.store:
+                    parsed['address'] = self.device.address if self.device else ''
+                    self.store.append(parsed)
     
     def parse_data(self, data):
         """
         解析血压数据
         
         注意: iHealth KN-550BT 使用私有协议，数据格式需要逆向工程
-        这是一个基础的解析模板，实际格式需要根据设备反馈调整
+        解析规则集中在 decoder.py (与 backend.py 共用)
         """
-        try:
-            if len(data) < 6:
-                return None
-            
-            # 最常见的格式尝试
-            # 格式: [标识] [收缩压] [舒张压] [心率] [其他数据...]
-            
-            # 尝试1: 直接字节解析
-            if data[0] == 0xFD or data[0] == 0xFE:
-                import struct
-                
-                # 假设字节顺序为小端
-                systolic = struct.unpack('<H', data[1:3])[0]
-                diastolic = struct.unpack('<H', data[3:5])[0]
-                pulse = data[5]
-                
-                # 合理性检查 (正常血压范围)
-                if 50 <= systolic <= 250 and 30 <= diastolic <= 150 and pulse <= 200:
-                    return {
-                        'systolic': systolic,
-                        'diastolic': diastolic,
-                        'pulse': pulse,
-                        'raw': data.hex()
-                    }
-            
-            # 如果不匹配，打印原始数据供调试
-            print(f"   ℹ 无法自动解析，数据可能需要自定义解析器")
-            print(f"   原始字节: {list(data)}")
-            
-        except Exception as e:
-            print(f"   ✗ 解析错误: {e}")
+        parsed = decode(data)
+        if parsed:
+            parsed['raw'] = data.hex()
+            return parsed
         
+        # 如果不匹配，记录原始数据供调试
+        packet_logger.warning("ℹ 无法自动解析，数据可能需要自定义解析器: %s", HexDump(data))
         return None
     
     async def send_command(self, command_bytes):
@@ -176,12 +182,15 @@ class iHealthBP550:
 
 async def main():
     """主程序"""
+    setup_logging(fmt='%(message)s')
     
     print("\n╔════════════════════════════════════════════════════════╗")
     print("║    iHealth KN-550BT - Bluetooth 血压计接收器          ║")
     print("╚════════════════════════════════════════════════════════╝\n")
     
-    monitor = iHealthBP550()
+    store = MeasurementStore()
+    recorder = capture.from_env()
+    monitor = iHealthBP550(store=store, capture=recorder)
     
     # 扫描设备
     if not await monitor.scan(timeout=10):
@@ -197,22 +206,38 @@ async def main():
         print("\n❌ 连接失败")
         return
     
+    # 请求设备上保存的历史记录 (已保存过的记录会被数据库去重)
+    await monitor.send_command(GET_HISTORY_COMMAND)
+    
     # 等待并接收数据
     print("\n" + "="*60)
     print("✓ 设备已就绪！")
     print("  请在 iHealth KN-550BT 上按 [M] 键开始测量")
     print("  或等待历史数据传输")
     print("  ")
-    print("  按 Ctrl+C 停止")
+    print("  断线后会自动重连，按 Ctrl+C 停止")
     print("="*60)
     
     try:
-        # 保持连接 5 分钟
-        await asyncio.sleep(300)
-    except KeyboardInterrupt:
+        # 一直运行；连接断开后按退避策略自动重连 (不重新扫描)
+        while True:
+            await monitor.disconnected.wait()
+            print("\n⚠ 连接已断开，正在重连...")
+            attempt = 0
+            while not await monitor.connect():
+                delay = backoff_delay(attempt)
+                attempt += 1
+                print(f"   {delay:.1f} 秒后重试 (第 {attempt} 次)")
+                await asyncio.sleep(delay)
+            # 断线期间血压计保存的记录 (数据库会去重)
+            await monitor.send_command(GET_HISTORY_COMMAND)
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("\n\n用户中断")
     finally:
         await monitor.disconnect()
+        store.close()
+        if recorder:
+            recorder.close()
     
     # 显示收集的数据
     measurements = monitor.get_measurements()
@@ -221,8 +246,7 @@ async def main():
         for i, m in enumerate(measurements, 1):
             print(f"   {i}. SYS: {m['systolic']} DIA: {m['diastolic']} PUL: {m['pulse']}")
         
-        # 保存数据
-        monitor.save_measurements("/tmp/ihealth_measurements.json")
+        print(f"✓ 测量数据已保存到 {store.path}")
     else:
         print("\n⚠ 未收到任何测量数据")
 
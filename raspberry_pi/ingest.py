@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Ingest Queue
+Hands BLE notifications from bleak's callbacks to a single consumer task
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from metrics import INGEST_OVERFLOWS
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """
+    Fixed-size ring of (session, sender, data, received) notifications
+
+    put() is all a notification callback does: stamp the time and store
+    four references in a preallocated slot. Called from another thread,
+    it hands the item to the loop with call_soon_threadsafe instead. One
+    consumer task drains the ring in micro-batches of ``batch_size``,
+    yielding to the loop in between, so a burst of history frames
+    neither starts a task per packet nor starves the web handlers.
+    Items are processed strictly in arrival order.
+    """
+
+    def __init__(self, handler, capacity=4096, batch_size=64):
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self.handler = handler
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self._mask = capacity - 1
+        self._slots = [None] * capacity
+        # Absolute positions; the slot index is position & mask
+        self._head = 0
+        self._tail = 0
+        self._wakeup = asyncio.Event()
+        self._loop = None
+        self._loop_thread = None
+        self._task = None
+
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def put(self, session, sender, data):
+        """Queue one notification; safe from any thread"""
+        item = (session, sender, data, time.monotonic())
+        if self._loop is None or threading.get_ident() == self._loop_thread:
+            self._push(item)
+        else:
+            self._loop.call_soon_threadsafe(self._push, item)
+
+    def _push(self, item):
+        self.received += 1
+        if self._tail - self._head == self.capacity:
+            self.dropped += 1
+            INGEST_OVERFLOWS.inc()
+            return
+        self._slots[self._tail & self._mask] = item
+        self._tail += 1
+        self._wakeup.set()
+
+    def drain(self, limit=None):
+        """Process up to ``limit`` queued items (all of them by default)"""
+        end = self._tail if limit is None else min(self._tail, self._head + limit)
+        count = 0
+        while self._head < end:
+            index = self._head & self._mask
+            item = self._slots[index]
+            self._slots[index] = None
+            self._head += 1
+            count += 1
+            try:
+                self.handler(*item)
+            except Exception as e:
+                logger.error("Ingest handler failed: %s", e)
+        self.processed += count
+        return count
+
+    async def _consume(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.drain(self.batch_size):
+                # Let sockets and timers run between micro-batches
+                await asyncio.sleep(0)
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        """Stop the consumer after processing whatever is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.drain()
+        self._loop = None
@@ -55,7 +55,7 @@ source venv/bin/activate
 echo ""
 echo "Step 6: Installing Python packages..."
 pip install --upgrade pip
-pip install bleak aiohttp aiohttp-cors websockets
+pip install bleak aiohttp aiohttp-cors websockets numpy
 
 echo ""
 echo "Step 7: Installing Chromium browser..."
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Logging Pipeline
+Queue-based logging so the event loop never waits on stderr or journald
+
+Records are put on an in-memory queue as-is; a listener thread formats
+them, writes them to stderr and keeps the most recent ones in a ring
+buffer for /api/logs.
+
+HEALTHPAD_LOG_LEVEL sets the default level (INFO) and
+HEALTHPAD_LOG_LEVELS overrides it per subsystem, e.g.
+``devices=DEBUG,packets=DEBUG,aiohttp.access=WARNING``.
+"""
+
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+DEFAULT_FORMAT = '%(asctime)s %(levelname)s:%(name)s:%(message)s'
+
+# Per-notification output goes to this logger, rate limited; enable with
+# HEALTHPAD_LOG_LEVELS=packets=DEBUG
+PACKET_LOGGER = 'packets'
+
+_listener = None
+_ring = None
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue the record untouched
+
+    The stock prepare() formats the message on the caller's thread so the
+    record can be pickled; our queue never leaves the process, so
+    formatting is left to the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last ``capacity`` records as plain dicts"""
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            message = str(record.msg)
+        if record.exc_info and self.formatter:
+            message = f"{message}\n{self.formatter.formatException(record.exc_info)}"
+        self.records.append({
+            'seq': next(self._seq),
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': message,
+        })
+
+    def query(self, level=logging.NOTSET, logger=None, since=0, limit=200):
+        """Oldest-first records at or above ``level``, after seq ``since``"""
+        self.acquire()
+        try:
+            records = list(self.records)
+        finally:
+            self.release()
+        result = [
+            r for r in records
+            if r['seq'] > since
+            and logging.getLevelName(r['level']) >= level
+            and (logger is None or r['logger'] == logger
+                 or r['logger'].startswith(logger + '.'))
+        ]
+        return result[-limit:]
+
+
+class HexDump:
+    """Log argument that only hex-encodes ``data`` if the record is emitted"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return bytes(self.data).hex()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    At most ``burst`` records per ``interval`` seconds
+
+    The first record let through after a quiet spell reports how many
+    were suppressed. Runs on the caller's thread, but only for records
+    that passed the level check, so a disabled debug call stays free.
+    """
+
+    def __init__(self, burst=5, interval=1.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._window_start = 0.0
+        self._count = 0
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.interval:
+                self._window_start = now
+                self._count = 0
+            if self._count >= self.burst:
+                self._suppressed += 1
+                return False
+            self._count += 1
+            suppressed, self._suppressed = self._suppressed, 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in (spec or '').split(','):
+        name, sep, level = item.strip().partition('=')
+        if sep and name:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=None, levels=None, fmt=DEFAULT_FORMAT, ring_size=1000,
+                  packet_burst=5, packet_interval=1.0):
+    """
+    Route every logger through the queue; safe to call more than once
+
+    Returns the ring buffer handler backing /api/logs.
+    """
+    global _listener, _ring
+    if _listener is not None:
+        return _ring
+
+    level = level or os.environ.get('HEALTHPAD_LOG_LEVEL', 'INFO').upper()
+    if levels is None:
+        levels = _parse_levels(os.environ.get('HEALTHPAD_LOG_LEVELS'))
+
+    formatter = logging.Formatter(fmt)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    _ring = RingBufferHandler(ring_size)
+    _ring.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_LazyQueueHandler(log_queue))
+    root.setLevel(level)
+    for name, subsystem_level in levels.items():
+        logging.getLogger(name).setLevel(subsystem_level)
+
+    packets = logging.getLogger(PACKET_LOGGER)
+    if PACKET_LOGGER not in levels:
+        packets.setLevel(logging.INFO)
+    packets.addFilter(RateLimitFilter(packet_burst, packet_interval))
+
+    _listener = logging.handlers.QueueListener(log_queue, console, _ring)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _ring
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def recent(level=logging.NOTSET, logger=None, since=0, limit=200):
+    """Records from the ring buffer (empty before setup_logging())"""
+    if _ring is None:
+        return []
+    return _ring.query(level, logger, since, limit)
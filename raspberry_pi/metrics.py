@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Metrics
+In-process counters, gauges and histograms in Prometheus text format
+"""
+
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; covers sub-millisecond decode up to a slow BLE connect
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _label(sample, extra):
+    if not extra:
+        return sample
+    if sample.endswith('}'):
+        return f'{sample[:-1]},{extra}}}'
+    return f'{sample}{{{extra}}}'
+
+
+class Counter:
+    """Monotonically increasing total"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        yield self.name, self.value
+
+
+class Gauge:
+    """Current value, either set directly or read from ``source()``"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, source=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.source = source
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        yield self.name, self.source() if self.source else self.value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram
+
+    Buckets are chosen up front, so observe() is a bisect and two
+    additions on preallocated state; cumulative counts are only built
+    when the metrics are rendered.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = tuple(sorted(buckets))
+        # One slot per bound plus the +Inf overflow
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        # bisect_left: a value equal to a bound belongs in that bucket (le)
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{_format(bound)}"}}', cumulative
+        yield f'{self.name}_sum', self.sum
+        yield f'{self.name}_count', cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self, names=None, labels=None):
+        """
+        Metrics in the Prometheus text exposition format
+
+        ``names`` limits the output to those metrics; ``labels`` (a dict)
+        is added to every sample.
+        """
+        extra = ','.join(f'{key}="{value}"' for key, value in (labels or {}).items())
+        lines = []
+        for metric in self.metrics.values():
+            if names is not None and metric.name not in names:
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, value in metric.samples():
+                lines.append(f'{_label(name, extra)} {_format(value)}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text):
+    return REGISTRY.register(Counter(name, help_text))
+
+
+def gauge(name, help_text, source=None):
+    return REGISTRY.register(Gauge(name, help_text, source))
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, buckets))
+
+
+SCAN_SECONDS = histogram(
+    'healthpad_scan_duration_seconds', 'Time to answer a device scan request'
+)
+CONNECT_SECONDS = histogram(
+    'healthpad_connect_seconds', 'Time from connect to notifications subscribed'
+)
+DECODE_SECONDS = histogram(
+    'healthpad_decode_seconds', 'Time to decode one measurement frame',
+    (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.01)
+)
+BROADCAST_SECONDS = histogram(
+    'healthpad_broadcast_latency_seconds',
+    'Time from publishing a message to it being sent to one WebSocket client',
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+PARSE_FAILURES = counter(
+    'healthpad_parse_failures_total', 'Complete frames that could not be decoded'
+)
+DROPPED_FRAMES = counter(
+    'healthpad_dropped_frames_total', 'Candidate iHealth frames rejected by checksum'
+)
+SKIPPED_BYTES = counter(
+    'healthpad_skipped_bytes_total', 'Notification bytes discarded while resyncing'
+)
+UNFRAMED_PAYLOADS = counter(
+    'healthpad_unframed_payloads_total',
+    'Whole-notification iHealth readings decoded without a checksummed frame'
+)
+RECONNECTS = counter(
+    'healthpad_reconnects_total', 'Dropped device links that were re-established'
+)
+RECONNECT_ATTEMPTS = counter(
+    'healthpad_reconnect_attempts_total', 'Reconnect attempts, successful or not'
+)
+EVICTED_CLIENTS = counter(
+    'healthpad_evicted_clients_total', 'WebSocket clients dropped for being too slow'
+)
+COALESCED_MESSAGES = counter(
+    'healthpad_coalesced_messages_total',
+    'Queued WebSocket messages replaced by newer ones for a slow client'
+)
+INGEST_OVERFLOWS = counter(
+    'healthpad_ingest_overflows_total',
+    'BLE notifications dropped because the ingest queue was full'
+)
+
+CONNECTED_DEVICES = gauge('healthpad_connected_devices', 'Connected device sessions')
+WEBSOCKET_CLIENTS = gauge('healthpad_websocket_clients', 'Connected WebSocket clients')
+INGEST_BACKLOG = gauge('healthpad_ingest_backlog', 'BLE notifications waiting to be processed')
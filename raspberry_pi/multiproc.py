@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Multi-Process Mode
+One acquisition process owns the BLE sessions; web workers serve HTTP
+
+    python3 multiproc.py --workers 3
+
+The acquisition process runs the usual backend (BLE sessions, decoding,
+SQLite writes, stats) and copies every reading into a shared-memory ring
+(shm_ring.py). Its API is only reachable over a Unix socket.
+
+The web workers share port 8080 (SO_REUSEPORT). Each one fans readings
+from the ring out over /ws and /api/events, answers /api/history from
+the SQLite database directly (WAL allows readers in other processes),
+and forwards every request that involves a device to the acquisition
+process. A burst of dashboard traffic then costs worker CPU instead of
+delaying BLE callbacks.
+
+Broadcast metrics and client sends happen in the workers, so a worker's
+/metrics is the acquisition process's output with the broadcast families
+replaced by its own, labelled worker="web-N", and its /api/traces adds
+its own client sends to the acquisition process's traces.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+import log_pipeline
+import metrics
+import shm_ring
+from broadcaster import Broadcaster
+from classification import CATEGORIES
+from store import MeasurementStore
+from tracing import Trace, Tracer
+
+logger = logging.getLogger(__name__)
+
+# How backend.py learns its part when imported in a child process
+ROLE_ENV = 'HEALTHPAD_ROLE'
+RING_ENV = 'HEALTHPAD_RING'
+CONTROL_SOCKET_ENV = 'HEALTHPAD_CONTROL_SOCKET'
+WORKER_ENV = 'HEALTHPAD_WORKER'
+
+# Metrics only a web worker updates; the acquisition process's are all zero
+_WORKER_METRICS = frozenset(m.name for m in (
+    metrics.WEBSOCKET_CLIENTS, metrics.BROADCAST_SECONDS,
+    metrics.EVICTED_CLIENTS, metrics.COALESCED_MESSAGES,
+))
+
+# Request and response headers passed through by WorkerBackend.proxy
+_PROXY_REQUEST_HEADERS = ('Content-Type', 'Accept', 'If-None-Match', 'If-Modified-Since')
+_PROXY_RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+
+
+def measurement_from_record(record):
+    """A ring record as the measurement dict handle_frame built"""
+    (_, trace_id, timestamp, measured_at, ingest,
+     systolic, diastolic, pulse, code, address) = record
+    measurement = {
+        'address': address,
+        'systolic': systolic,
+        'diastolic': diastolic,
+        'pulse': pulse,
+        'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+        'classification': CATEGORIES[code],
+        'trace_id': trace_id,
+        'ingest_monotonic': ingest,
+    }
+    if not math.isnan(measured_at):
+        measurement['measured_at'] = datetime.fromtimestamp(measured_at).isoformat()
+    return measurement
+
+
+class WorkerBackend:
+    """
+    The part of HealthPadBackend a web worker needs, fed from the ring
+
+    backend.py creates one instead of HealthPadBackend when
+    HEALTHPAD_ROLE=worker. Broadcast sequence numbers are the ring's, so
+    a client can resume on any worker.
+    """
+
+    def __init__(self, ring_name=None, control_socket=None, poll_interval=0.02,
+                 status_ttl=1.0, name=None):
+        self.ring = shm_ring.ReadingRing.attach(ring_name or os.environ[RING_ENV])
+        self.control_socket = control_socket or os.environ[CONTROL_SOCKET_ENV]
+        self.name = name or os.environ.get(WORKER_ENV) or f'pid-{os.getpid()}'
+        self.poll_interval = poll_interval
+        self.status_ttl = status_ttl
+        self.store = MeasurementStore()
+        self.broadcaster = Broadcaster()
+        # Collects this worker's client sends, keyed by the acquisition
+        # process's trace IDs; exported there, not here
+        self.tracer = Tracer(export_path=None)
+        self.position = self.ring.head
+        self.broadcaster.log.restart_at(self.position)
+        self.lapped = 0
+        self._session = None
+        self._task = None
+        self._status = (-math.inf, [])
+        metrics.WEBSOCKET_CLIENTS.source = lambda: len(self.broadcaster)
+
+    async def _follow(self):
+        """Publish ring records to this worker's clients as they appear"""
+        while True:
+            try:
+                records = self.ring.read(self.position)
+            except shm_ring.RingLapped as e:
+                # Clients see the jump in seq and resync over REST
+                logger.warning("Fell behind the reading ring: %s", e)
+                self.lapped += 1
+                self.position = self.ring.head
+                self.broadcaster.log.restart_at(self.position)
+                continue
+            for record in records:
+                self.position = record[0]
+                measurement = measurement_from_record(record)
+                trace = None
+                if measurement['trace_id']:
+                    # time.monotonic() is system-wide, so the acquisition
+                    # process's ingest time anchors this worker's sends
+                    trace = Trace(measurement['trace_id'], measurement['address'],
+                                  measurement['ingest_monotonic'])
+                self.broadcaster.publish({
+                    'type': 'measurement',
+                    'address': measurement['address'],
+                    'data': measurement
+                }, trace)
+                if trace is not None:
+                    self.tracer.finish(trace)
+            if records:
+                # The acquisition process wrote them to the database
+                self.store.last_modified = time.time()
+            await asyncio.sleep(self.poll_interval)
+
+    async def device_status(self):
+        """Per-device status from the acquisition process, cached briefly"""
+        fetched, devices = self._status
+        if time.monotonic() - fetched < self.status_ttl:
+            return devices
+        try:
+            async with self._session.get('http://acquisition/api/status') as response:
+                devices = (await response.json())['devices']
+            self._status = (time.monotonic(), devices)
+        except (aiohttp.ClientError, KeyError, ValueError) as e:
+            logger.warning("Could not fetch device status: %s", e)
+        return devices
+
+    async def proxy(self, request):
+        """Forward a request to the acquisition process"""
+        headers = {
+            name: request.headers[name]
+            for name in _PROXY_REQUEST_HEADERS if name in request.headers
+        }
+        body = await request.read() if request.can_read_body else None
+        try:
+            async with self._session.request(
+                request.method, f'http://acquisition{request.path_qs}',
+                data=body, headers=headers
+            ) as upstream:
+                payload = await upstream.read()
+                return web.Response(body=payload, status=upstream.status, headers={
+                    name: upstream.headers[name]
+                    for name in _PROXY_RESPONSE_HEADERS if name in upstream.headers
+                })
+        except aiohttp.ClientError as e:
+            raise web.HTTPBadGateway(text=f'Acquisition process unavailable: {e}')
+
+    async def _upstream(self, path):
+        try:
+            async with self._session.get(f'http://acquisition{path}') as response:
+                response.raise_for_status()
+                return await response.read()
+        except aiohttp.ClientError as e:
+            raise web.HTTPBadGateway(text=f'Acquisition process unavailable: {e}')
+
+    async def metrics(self, request):
+        """/metrics: the acquisition process's, with this worker's broadcast metrics"""
+        upstream = (await self._upstream('/metrics')).decode()
+        # Drop the acquisition process's (idle) copies of the worker families
+        lines, skipping = [], False
+        for line in upstream.splitlines():
+            if line.startswith('# HELP '):
+                skipping = line.split(' ', 3)[2] in _WORKER_METRICS
+            if not skipping and line:
+                lines.append(line)
+        lines.append(metrics.REGISTRY.render(_WORKER_METRICS, {'worker': self.name}))
+        return web.Response(
+            text='\n'.join(lines), headers={'Content-Type': metrics.CONTENT_TYPE}
+        )
+
+    async def traces(self, request):
+        """/api/traces from the acquisition process, plus this worker's client sends"""
+        try:
+            limit = int(request.query.get('limit', 100))
+            min_ms = float(request.query['min_ms']) if 'min_ms' in request.query else None
+        except ValueError:
+            raise web.HTTPBadRequest(text='limit and min_ms must be numbers')
+        # min_ms is applied here, once the sends that make a trace slow are in
+        query = {'limit': str(self.tracer.traces.maxlen)}
+        if 'address' in request.query:
+            query['address'] = request.query['address']
+        path = request.rel_url.with_query(query).path_qs
+        traces = json.loads(await self._upstream(path))['traces']
+
+        local = {trace.trace_id: trace.to_dict() for trace in self.tracer.traces}
+        result = []
+        for trace in traces:
+            mine = local.get(trace['trace_id'])
+            if mine is not None:
+                trace['sends'] += [
+                    dict(send, client=f"{self.name}/{send['client']}")
+                    for send in mine['sends']
+                ]
+                trace['total_ms'] = max(trace['total_ms'], mine['total_ms'])
+            if min_ms is None or trace['total_ms'] >= min_ms:
+                result.append(trace)
+                if len(result) >= limit:
+                    break
+        return web.json_response({'traces': result})
+
+    async def start(self, app):
+        # No total timeout: /api/scan long-polls and history syncs take a while
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.UnixConnector(path=self.control_socket),
+            timeout=aiohttp.ClientTimeout(total=None)
+        )
+        self._task = asyncio.create_task(self._follow())
+
+    async def stop(self, app):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self._session.close()
+        self.store.close()
+        self.ring.close()
+
+
+def _acquisition(ring_name, control_socket):
+    os.environ.update({ROLE_ENV: 'acquisition', RING_ENV: ring_name})
+    import backend
+    web.run_app(backend.init_app(), path=control_socket, print=None)
+
+
+def _worker(ring_name, control_socket, host, port, name):
+    os.environ.update({
+        ROLE_ENV: 'worker', RING_ENV: ring_name, CONTROL_SOCKET_ENV: control_socket,
+        WORKER_ENV: name,
+    })
+    import backend
+    web.run_app(backend.init_app(), host=host, port=port, reuse_port=True, print=None)
+
+
+def _wait_for_socket(path, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if not process.is_alive() or time.monotonic() > deadline:
+            raise SystemExit(f"Acquisition process did not start (exit code {process.exitcode})")
+        time.sleep(0.1)
+
+
+def _stop(processes, timeout=10.0):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning("%s did not stop; killing it", process.name)
+            process.kill()
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the backend as one acquisition process and several web workers'
+    )
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help='web worker processes (default: one per remaining core)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--ring-size', type=int, default=1024,
+                        help='readings kept in shared memory for the workers')
+    args = parser.parse_args()
+
+    log_pipeline.setup_logging()
+    # SIGTERM (systemd) shuts down like Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    # Fresh interpreters: nothing from this process (event loop, bleak,
+    # SQLite handles) leaks into the children
+    context = multiprocessing.get_context('spawn')
+    ring = shm_ring.ReadingRing.create(args.ring_size)
+    control_socket = os.path.join(tempfile.gettempdir(), f'healthpad-{os.getpid()}.sock')
+    acquisition = context.Process(
+        target=_acquisition, args=(ring.name, control_socket), name='acquisition'
+    )
+    workers = [
+        context.Process(
+            target=_worker, args=(ring.name, control_socket, args.host, args.port, f'web-{i}'),
+            name=f'web-{i}'
+        )
+        for i in range(args.workers)
+    ]
+    try:
+        acquisition.start()
+        _wait_for_socket(control_socket, acquisition)
+        for worker in workers:
+            worker.start()
+        logger.info("Serving on http://%s:%s with %d web worker(s)",
+                    args.host, args.port, len(workers))
+        # Any child exiting takes the whole group down; systemd restarts it
+        processes = [acquisition] + workers
+        multiprocessing.connection.wait([p.sentinel for p in processes])
+        for process in processes:
+            if process.exitcode is not None:
+                logger.error("%s exited with code %s", process.name, process.exitcode)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _stop([w for w in workers if w.pid is not None])
+        _stop([acquisition] if acquisition.pid is not None else [])
+        ring.close()
+        ring.unlink()
+        if os.path.exists(control_socket):
+            os.unlink(control_socket)
+        log_pipeline.stop_logging()
+
+
+if __name__ == '__main__':
+    main()
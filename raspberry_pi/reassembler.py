@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Frame Reassembler
+Rebuilds iHealth frames that BLE notifications split or merge
+
+The 12-byte checksummed frame is this project's reading of the protocol,
+not a documented fact. A notification that starts with a marker and
+decodes on its own, but is not such a frame (the protocol doc's 6-byte
+example, say), is passed through whole when nothing is pending.
+
+The head of a split frame looks just like that, so the fallback is only
+used until the stream shows checksummed frames. If a passed-through
+notification turns out to have been such a head, the rest of its frame
+is dropped quietly (its reading has already gone out) and the stream is
+treated as framed from then on.
+"""
+
+import logging
+import re
+
+from decoder import (
+    IHEALTH_FRAME_SIZE, IHEALTH_MARKERS, IHEALTH_MIN_SIZE, decode, ihealth_checksum
+)
+from log_pipeline import PACKET_LOGGER, HexDump
+from metrics import DROPPED_FRAMES, SKIPPED_BYTES, UNFRAMED_PAYLOADS
+
+# Rate limited (see log_pipeline.setup_logging)
+packet_logger = logging.getLogger(PACKET_LOGGER)
+
+
+class FrameReassembler:
+    """
+    Incremental 0xFD/0xFE frame reassembly over a fixed-size ring buffer
+
+    Every byte is scanned once: junk between frames is skipped with a
+    regex search, a partial frame waits at the head of the ring until
+    enough bytes arrive, and a bad checksum only costs re-scanning the
+    bytes of that one candidate frame.
+    """
+
+    def __init__(self, frame_size=IHEALTH_FRAME_SIZE, capacity=512,
+                 markers=IHEALTH_MARKERS):
+        if capacity & (capacity - 1) or capacity < 2 * frame_size:
+            raise ValueError("capacity must be a power of two >= 2 * frame_size")
+        self.frame_size = frame_size
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._markers = frozenset(markers)
+        self._marker_re = re.compile(b'[' + b''.join(
+            re.escape(bytes([m])) for m in markers) + b']')
+        # Absolute stream positions; the ring index is position & mask
+        self._head = 0
+        self._tail = 0
+
+        # Set once a checksummed frame is seen; kept across reset()
+        self.framed = False
+        # The last notification passed through unframed
+        self._passed = None
+
+        self.frames = 0
+        self.skipped_bytes = 0
+        self.bad_checksums = 0
+        self.unframed = 0
+
+    @property
+    def pending(self):
+        """Bytes buffered but not yet emitted as part of a frame"""
+        return self._tail - self._head
+
+    def reset(self):
+        """Forget any partial frame (e.g. after a reconnect)"""
+        self._head = self._tail = 0
+        self._passed = None
+
+    def feed(self, data):
+        """Append received bytes and return the complete frames they finish"""
+        if not self.framed and self._head == self._tail and self._unframed(data):
+            self.unframed += 1
+            UNFRAMED_PAYLOADS.inc()
+            packet_logger.debug("Unframed payload passed through: %s", HexDump(data))
+            self._passed = bytes(data)
+            return [self._passed]
+        data = memoryview(data)
+        if self._passed is not None:
+            data = data[self._rest_of_passed(data):]
+            self._passed = None
+        frames = []
+        while data:
+            free = self.capacity - (self._tail - self._head)
+            chunk, data = data[:free], data[free:]
+            self._write(chunk)
+            self._extract(frames)
+        return frames
+
+    def _unframed(self, data):
+        """A whole reading holding no checksummed frame (see module docstring)"""
+        size = self.frame_size
+        if len(data) < IHEALTH_MIN_SIZE or data[0] not in self._markers:
+            return False
+        markers = self._markers
+        for start in range(len(data) - size + 1):
+            if data[start] in markers and (
+                    data[start + size - 1] == ihealth_checksum(data[start:start + size])):
+                return False
+        return decode(data) is not None
+
+    def _rest_of_passed(self, data):
+        """
+        Bytes of ``data`` that complete the passed-through notification
+        into a checksummed frame (0 if they don't)
+
+        The record time must be valid or zeroed: a second short reading
+        would put its marker and systolic value there, so two back-to-back
+        short readings are never mistaken for one frame.
+        """
+        need = self.frame_size - len(self._passed)
+        if need <= 0 or len(data) < need:
+            return 0
+        frame = self._passed + bytes(data[:need])
+        if frame[-1] != ihealth_checksum(frame):
+            return 0
+        decoded = decode(frame)
+        if decoded is None or ('measured_at' not in decoded
+                               and any(frame[IHEALTH_MIN_SIZE:-1])):
+            return 0
+        self.framed = True
+        packet_logger.info("Passed-through notification was the head of a frame: %s",
+                           HexDump(frame))
+        return need
+
+    def _skipped(self, count):
+        if packet_logger.isEnabledFor(logging.INFO):
+            packet_logger.info("Skipped %d byte(s) while resyncing: %s",
+                               count, HexDump(self._copy(self._head, count)))
+        self._head += count
+        self.skipped_bytes += count
+        SKIPPED_BYTES.inc(count)
+
+    def _write(self, chunk):
+        start = self._tail & self._mask
+        first = min(len(chunk), self.capacity - start)
+        self._view[start:start + first] = chunk[:first]
+        if first < len(chunk):
+            self._view[:len(chunk) - first] = chunk[first:]
+        self._tail += len(chunk)
+
+    def _copy(self, pos, size):
+        start = pos & self._mask
+        end = start + size
+        if end <= self.capacity:
+            return bytes(self._view[start:end])
+        return bytes(self._view[start:]) + bytes(self._view[:end - self.capacity])
+
+    def _skip_to_marker(self):
+        """Advance head to the next marker byte; False if none is buffered"""
+        while self._head < self._tail:
+            if self._buf[self._head & self._mask] in self._markers:
+                return True
+            start = self._head & self._mask
+            end = min(start + (self._tail - self._head), self.capacity)
+            match = self._marker_re.search(self._buf, start, end)
+            if match:
+                self._skipped(match.start() - start)
+                return True
+            self._skipped(end - start)
+        return False
+
+    def _extract(self, frames):
+        size = self.frame_size
+        while self._skip_to_marker():
+            if self._tail - self._head < size:
+                break  # partial frame: wait for the rest
+            frame = self._copy(self._head, size)
+            if frame[-1] == ihealth_checksum(frame):
+                frames.append(frame)
+                self.frames += 1
+                self.framed = True
+                self._head += size
+            else:
+                # Marker byte inside other data; resync one byte further on
+                self.bad_checksums += 1
+                DROPPED_FRAMES.inc()
+                packet_logger.info("Bad checksum, resyncing: %s", HexDump(frame))
+                self._skipped(1)
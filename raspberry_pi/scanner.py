@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Advertisement Scanner
+Always-on BLE scanning into an in-memory advertisement index
+"""
+
+import asyncio
+import logging
+import time
+import transport
+
+logger = logging.getLogger(__name__)
+
+
+class AdvertisementScanner:
+    """
+    Keeps a BleakScanner running and indexes every advertisement it sees
+
+    Entries expire ``ttl`` seconds after their last advertisement.
+    ``version`` increases whenever a device appears, disappears or changes
+    name, so API clients can long-poll for changes with wait_for_change().
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self.index = {}
+        self.version = 0
+        self._ble_devices = {}
+        self.running = False
+        self._scanner = None
+        self._expiry_task = None
+        self._changed = asyncio.Event()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call ``callback(entry)`` for every advertisement received"""
+        self._listeners.append(callback)
+
+    async def start(self):
+        """Start scanning; returns False if the adapter is unavailable"""
+        if self.running:
+            return True
+        try:
+            self._scanner = transport.Scanner(detection_callback=self._on_detection)
+            await self._scanner.start()
+        except Exception as e:
+            logger.error("Could not start background scanner: %s", e)
+            return False
+        self.running = True
+        self._expiry_task = asyncio.create_task(self._expire_loop())
+        logger.info("✓ Background scanner started (TTL %.0fs)", self.ttl)
+        return True
+
+    async def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._expiry_task.cancel()
+        try:
+            await self._scanner.stop()
+        except Exception as e:
+            logger.warning("Error stopping scanner: %s", e)
+
+    def _on_detection(self, device, advertisement_data):
+        now = time.time()
+        name = advertisement_data.local_name or device.name
+        entry = self.index.get(device.address)
+        if entry is None:
+            entry = {'address': device.address, 'name': name, 'first_seen': now}
+            self.index[device.address] = entry
+            self._bump()
+        elif name and entry['name'] != name:
+            entry['name'] = name
+            self._bump()
+
+        self._ble_devices[device.address] = device
+        entry['rssi'] = advertisement_data.rssi
+        entry['last_seen'] = now
+        if advertisement_data.manufacturer_data:
+            entry['manufacturer_data'] = {
+                str(company): data.hex()
+                for company, data in advertisement_data.manufacturer_data.items()
+            }
+
+        for callback in self._listeners:
+            try:
+                callback(entry)
+            except Exception as e:
+                logger.error("Advertisement listener failed: %s", e)
+
+    def _bump(self):
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _expire_loop(self):
+        interval = max(1.0, self.ttl / 4)
+        while True:
+            await asyncio.sleep(interval)
+            self.expire()
+
+    def expire(self, now=None):
+        """Drop entries not seen within the TTL"""
+        cutoff = (now or time.time()) - self.ttl
+        stale = [a for a, e in self.index.items() if e['last_seen'] < cutoff]
+        for address in stale:
+            del self.index[address]
+            self._ble_devices.pop(address, None)
+        if stale:
+            self._bump()
+
+    def ble_device(self, address):
+        """Latest BLEDevice seen for ``address``, or None"""
+        return self._ble_devices.get(address)
+
+    def devices(self, name_filter=None):
+        """Indexed devices, strongest signal first"""
+        entries = self.index.values()
+        if name_filter:
+            entries = [e for e in entries if e['name'] and name_filter in e['name']]
+        return sorted(
+            (dict(e) for e in entries),
+            key=lambda e: e.get('rssi') or -999,
+            reverse=True
+        )
+
+    async def wait_for_change(self, since, timeout):
+        """Wait until ``version`` differs from ``since``; True if it changed"""
+        if self.version != since:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
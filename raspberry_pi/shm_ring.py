@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Shared-Memory Reading Ring
+Fixed-size measurement records passed from the acquisition process to
+the web workers (see multiproc.py)
+
+One process writes, any number read. The segment starts with a header,
+followed by ``capacity`` slots of one record each:
+
+    header  <4s I Q                  magic, capacity, head (last seq written)
+    record  <Q Q d d d H H B B B 32s  seq, trace id, timestamp, measured_at
+                                     (NaN if unknown), ingest (monotonic),
+                                     systolic, diastolic, pulse, category
+                                     code, address length, address
+
+Record ``seq`` lives in slot (seq - 1) % capacity. The writer zeroes a
+slot's seq before overwriting it and stores the new seq last, so a reader
+that finds the seq it expected both before and after unpacking knows the
+record is whole; anything else means the writer has lapped it.
+"""
+
+import math
+import struct
+from multiprocessing import shared_memory
+
+from classification import LEVEL_CODES
+from store import epoch_seconds
+
+MAGIC = b'HPR1'
+
+_HEADER = struct.Struct('<4sIQ')
+_HEAD_OFFSET = 8
+_RECORD = struct.Struct('<QQdddHHBBB32sx')
+_SEQ = struct.Struct('<Q')
+
+ADDRESS_SIZE = 32
+
+
+class RingLapped(Exception):
+    """The writer overwrote records before the reader got to them"""
+
+
+class ReadingRing:
+    """A shared-memory ring of measurement records"""
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner
+        magic, self.capacity, _ = _HEADER.unpack_from(self.buf)
+        if magic != MAGIC:
+            raise ValueError(f"{shm.name} is not a reading ring")
+
+    @classmethod
+    def create(cls, capacity=1024, name=None):
+        """Allocate a new ring; the creator unlinks it in unlink()"""
+        shm = shared_memory.SharedMemory(
+            name=name, create=True, size=_HEADER.size + capacity * _RECORD.size
+        )
+        _HEADER.pack_into(shm.buf, 0, MAGIC, capacity, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Open a ring created by another process
+
+        Meant for children of the creating process: they share its
+        resource tracker, which would otherwise unlink the segment when
+        the attaching process exits (Python < 3.13).
+        """
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def head(self):
+        """Sequence number of the newest record (0 while empty)"""
+        return _SEQ.unpack_from(self.buf, _HEAD_OFFSET)[0]
+
+    def _offset(self, seq):
+        return _HEADER.size + (seq - 1) % self.capacity * _RECORD.size
+
+    def write(self, measurement):
+        """Append one measurement dict (as built by handle_frame); returns its seq"""
+        seq = self.head + 1
+        offset = self._offset(seq)
+        address = measurement['address'].encode()[:ADDRESS_SIZE]
+        measured_at = measurement.get('measured_at')
+        _SEQ.pack_into(self.buf, offset, 0)
+        _RECORD.pack_into(
+            self.buf, offset, 0, measurement.get('trace_id', 0),
+            epoch_seconds(measurement['timestamp']),
+            math.nan if measured_at is None else epoch_seconds(measured_at),
+            measurement.get('ingest_monotonic', math.nan),
+            measurement['systolic'], measurement['diastolic'], measurement['pulse'],
+            LEVEL_CODES[measurement['classification']['level']],
+            len(address), address
+        )
+        _SEQ.pack_into(self.buf, offset, seq)
+        _SEQ.pack_into(self.buf, _HEAD_OFFSET, seq)
+        return seq
+
+    def read(self, after):
+        """
+        Records after seq ``after``, oldest first, as tuples of
+        (seq, trace id, timestamp, measured_at, ingest, systolic,
+        diastolic, pulse, category code, address)
+
+        Raises RingLapped when some of them have already been overwritten.
+        """
+        head = self.head
+        if head < after:
+            raise RingLapped(f"ring restarted at {head}, reader was at {after}")
+        if head - after > self.capacity:
+            raise RingLapped(f"{head - after - self.capacity} records overwritten")
+        records = []
+        for seq in range(after + 1, head + 1):
+            offset = self._offset(seq)
+            fields = _RECORD.unpack_from(self.buf, offset)
+            if fields[0] != seq or _SEQ.unpack_from(self.buf, offset)[0] != seq:
+                raise RingLapped(f"record {seq} overwritten while reading")
+            length, address = fields[9], fields[10]
+            records.append(fields[:9] + (address[:length].decode(),))
+        return records
+
+    def close(self):
+        # Views into the buffer must be gone before the mapping can close
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Simulated KN-550BT
+Local stand-in for BleakScanner/BleakClient that replays 0xFD/0xFE frames
+
+Select it with HEALTHPAD_TRANSPORT=sim (or transport.use('sim')).
+HEALTHPAD_SIM_DEVICES, HEALTHPAD_SIM_RATE and HEALTHPAD_SIM_FRAMES
+configure the default cuffs; tests and benchmarks can call add_device().
+"""
+
+import asyncio
+import itertools
+import os
+import random
+from datetime import datetime, timedelta
+
+from decoder import encode_ihealth_frame
+from gatt_uuids import IHEALTH_RECEIVE_CHAR, IHEALTH_SEND_CHAR, IHEALTH_SERVICE_UUID
+from history_sync import GET_HISTORY_COMMAND
+
+SERVICE_UUID = IHEALTH_SERVICE_UUID
+NOTIFY_CHAR = IHEALTH_SEND_CHAR
+WRITE_CHAR = IHEALTH_RECEIVE_CHAR
+NOTIFY_HANDLE = 0x0E
+WRITE_HANDLE = 0x11
+
+DEVICES = {}
+
+
+class SimBLEDevice:
+    """Stand-in for bleak's BLEDevice"""
+
+    def __init__(self, address, name, rssi):
+        self.address = address
+        self.name = name
+        self.rssi = rssi
+
+    def __repr__(self):
+        return f"SimBLEDevice({self.address}, {self.name})"
+
+
+class SimAdvertisementData:
+    def __init__(self, local_name, rssi, manufacturer_data=None):
+        self.local_name = local_name
+        self.rssi = rssi
+        self.manufacturer_data = manufacturer_data or {}
+        self.service_uuids = [SERVICE_UUID]
+
+
+class SimCharacteristic:
+    def __init__(self, uuid, handle, properties, description=''):
+        self.uuid = uuid
+        self.handle = handle
+        self.properties = properties
+        self.description = description
+        self.descriptors = []
+
+
+class SimService:
+    def __init__(self, uuid, characteristics, description=''):
+        self.uuid = uuid
+        self.characteristics = characteristics
+        self.description = description
+
+
+def synthetic_frames(rng, measured_at=None):
+    """Endless plausible readings as complete iHealth frames"""
+    while True:
+        systolic = rng.randint(100, 170)
+        diastolic = rng.randint(60, min(110, systolic - 20))
+        yield encode_ihealth_frame(systolic, diastolic, rng.randint(55, 110), measured_at)
+
+
+def load_frames(path):
+    """Frames from a text file with one hex-encoded frame per line"""
+    with open(path) as f:
+        return [bytes.fromhex(line.strip()) for line in f if line.strip()]
+
+
+class SimulatedPeripheral:
+    """
+    One simulated cuff
+
+    rate            frames per second while a client is subscribed
+    jitter          +/- fraction applied to each inter-frame delay
+    fragment        (min, max) bytes per notification, or None for whole frames
+    frames          recorded frames to replay (looped); synthetic if None
+    disconnect_after
+                    mean seconds until the link drops (exponential), or None
+    downtime        seconds the cuff stays unreachable after a drop
+    history         number of stored readings returned for the 0x12 command
+    """
+
+    def __init__(self, address, name='KN-550BT (SIM)', rate=1.0, jitter=0.0,
+                 fragment=None, frames=None, disconnect_after=None, downtime=1.0,
+                 history=0, rssi=-60, seed=None):
+        self.address = address
+        self.name = name
+        self.rate = rate
+        self.jitter = jitter
+        self.fragment = fragment
+        self.disconnect_after = disconnect_after
+        self.downtime = downtime
+        self.rssi = rssi
+        self.rng = random.Random(seed)
+        self.frames = itertools.cycle(frames) if frames else synthetic_frames(self.rng)
+        start = datetime.now().replace(second=0, microsecond=0)
+        self.history = [
+            encode_ihealth_frame(120 + i % 30, 80 - i % 15, 70 + i % 20,
+                                 start - timedelta(hours=history - i))
+            for i in range(history)
+        ]
+        self.available = True
+        self.client = None
+        self.sent_frames = 0
+        self.sent_notifications = 0
+
+    @property
+    def ble_device(self):
+        return SimBLEDevice(self.address, self.name, self.rssi)
+
+    def advertisement(self):
+        rssi = self.rssi + self.rng.randint(-3, 3)
+        return SimAdvertisementData(self.name, rssi, {0x0171: bytes([0x55, 0x0B])})
+
+    def _chunks(self, frame):
+        if not self.fragment:
+            yield frame
+            return
+        low, high = self.fragment
+        offset = 0
+        while offset < len(frame):
+            size = self.rng.randint(low, high)
+            yield frame[offset:offset + size]
+            offset += size
+
+    async def _notify(self, callback, char, frames, delay):
+        for frame in frames:
+            for chunk in self._chunks(frame):
+                result = callback(char, bytearray(chunk))
+                if asyncio.iscoroutine(result):
+                    await result
+                self.sent_notifications += 1
+            self.sent_frames += 1
+            if delay is not None:
+                wait = delay * (1 + self.rng.uniform(-self.jitter, self.jitter))
+                await asyncio.sleep(max(0.0, wait))
+
+    async def stream(self, callback, char):
+        """Live readings at ``rate`` until cancelled"""
+        if self.rate <= 0:
+            return
+        await self._notify(callback, char, self.frames, 1.0 / self.rate)
+
+    async def send_history(self, callback, char):
+        await self._notify(callback, char, list(self.history), None)
+
+    async def link_watchdog(self, client):
+        """Drop the link after a random time, then stay away for ``downtime``"""
+        await asyncio.sleep(self.rng.expovariate(1.0 / self.disconnect_after))
+        self.available = False
+        await client._drop()
+        await asyncio.sleep(self.downtime)
+        self.available = True
+
+
+def add_device(peripheral):
+    DEVICES[peripheral.address] = peripheral
+    return peripheral
+
+
+def reset():
+    DEVICES.clear()
+
+
+def _default_devices():
+    count = int(os.environ.get('HEALTHPAD_SIM_DEVICES', '1'))
+    rate = float(os.environ.get('HEALTHPAD_SIM_RATE', '0.1'))
+    frames_path = os.environ.get('HEALTHPAD_SIM_FRAMES')
+    frames = load_frames(frames_path) if frames_path else None
+    for i in range(count):
+        add_device(SimulatedPeripheral(
+            f"SI:MU:LA:TE:00:{i:02X}", f"KN-550BT SIM{i}", rate=rate,
+            jitter=0.2, frames=frames, history=20, seed=i
+        ))
+
+
+class SimulatedScanner:
+    """Implements the BleakScanner surface used by Health Pad"""
+
+    def __init__(self, detection_callback=None, interval=1.0, **kwargs):
+        self._callback = detection_callback
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._advertise())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _advertise(self):
+        while True:
+            for peripheral in list(DEVICES.values()):
+                if peripheral.available and self._callback:
+                    self._callback(peripheral.ble_device, peripheral.advertisement())
+            await asyncio.sleep(self.interval)
+
+    @classmethod
+    async def discover(cls, timeout=5.0, **kwargs):
+        await asyncio.sleep(min(timeout, 0.1))
+        return [p.ble_device for p in DEVICES.values() if p.available]
+
+    @classmethod
+    async def find_device_by_address(cls, address, timeout=10.0, **kwargs):
+        peripheral = DEVICES.get(address)
+        return peripheral.ble_device if peripheral and peripheral.available else None
+
+
+class SimulatedClient:
+    """Implements the BleakClient surface used by Health Pad"""
+
+    def __init__(self, address_or_ble_device, disconnected_callback=None,
+                 services=None, **kwargs):
+        self.address = getattr(address_or_ble_device, 'address', address_or_ble_device)
+        self._disconnected_callback = disconnected_callback
+        self._peripheral = None
+        self._connected = False
+        self._tasks = {}
+        self._callback = None
+        self._notify_char = SimCharacteristic(NOTIFY_CHAR, NOTIFY_HANDLE, ['notify'], 'sed.')
+        self._write_char = SimCharacteristic(
+            WRITE_CHAR, WRITE_HANDLE, ['write-without-response', 'write'], 'rec.'
+        )
+        self._services = [
+            SimService(SERVICE_UUID, [self._notify_char, self._write_char], 'com.jiuan.dev')
+        ]
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    @property
+    def services(self):
+        return self._services
+
+    async def get_services(self):
+        return self._services
+
+    async def connect(self, **kwargs):
+        peripheral = DEVICES.get(self.address)
+        await asyncio.sleep(0.01)
+        if peripheral is None or not peripheral.available:
+            raise OSError(f"Device with address {self.address} was not found")
+        if peripheral.client is not None and peripheral.client is not self:
+            raise OSError(f"{self.address} is already connected to another client")
+        self._peripheral = peripheral
+        peripheral.client = self
+        self._connected = True
+        if peripheral.disconnect_after:
+            self._tasks['watchdog'] = asyncio.create_task(peripheral.link_watchdog(self))
+        return True
+
+    def _resolve(self, char_specifier):
+        key = getattr(char_specifier, 'handle', char_specifier)
+        for char in (self._notify_char, self._write_char):
+            if key in (char.handle, char.uuid):
+                return char
+        raise ValueError(f"Characteristic {char_specifier} was not found")
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        if not self._connected:
+            raise OSError("Not connected")
+        char = self._resolve(char_specifier)
+        if 'notify' not in char.properties:
+            raise ValueError(f"{char.uuid} does not support notifications")
+        self._callback = callback
+        self._tasks['stream'] = asyncio.create_task(
+            self._peripheral.stream(callback, char)
+        )
+
+    async def stop_notify(self, char_specifier):
+        task = self._tasks.pop('stream', None)
+        if task:
+            task.cancel()
+
+    async def write_gatt_char(self, char_specifier, data, response=False):
+        if not self._connected:
+            raise OSError("Not connected")
+        self._resolve(char_specifier)
+        if bytes(data) == GET_HISTORY_COMMAND and self._callback is not None:
+            self._tasks['history'] = asyncio.create_task(
+                self._peripheral.send_history(self._callback, self._notify_char)
+            )
+
+    async def _drop(self):
+        """Link loss initiated by the peripheral"""
+        current = asyncio.current_task()
+        for key, task in list(self._tasks.items()):
+            if task is not current:
+                task.cancel()
+        self._tasks.clear()
+        self._release()
+
+    def _release(self):
+        was_connected = self._connected
+        self._connected = False
+        if self._peripheral and self._peripheral.client is self:
+            self._peripheral.client = None
+        if was_connected and self._disconnected_callback:
+            self._disconnected_callback(self)
+
+    async def disconnect(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._release()
+        return True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+
+_default_devices()
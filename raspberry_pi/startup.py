@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Startup Profile
+Timed start-up phases, from process creation to ready, for /healthz,
+/readyz and boot-time tracking
+
+backend.py imports this module before anything else, so the 'imports'
+phase covers aiohttp and the rest of the backend. With
+HEALTHPAD_STARTUP_PROFILE=<file>, each completed start-up is appended
+to that file as one JSON line.
+"""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+IMPORTED = time.monotonic()
+
+# HTTP first, Bluetooth in the background (see backend.add_backend_hooks)
+FAST_START = os.environ.get('HEALTHPAD_FAST_START') == '1'
+
+DEFAULT_REPORT_PATH = os.environ.get('HEALTHPAD_STARTUP_PROFILE')
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+def _process_age():
+    """Seconds since this process was created (Linux only), or None"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime, in clock ticks after boot); the command
+            # name in field 2 may contain spaces, so split after it
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+
+
+class Phase:
+    __slots__ = ('name', 'state', 'started', 'finished', 'error')
+
+    def __init__(self, name):
+        self.name = name
+        self.state = PENDING
+        self.started = None
+        self.finished = None
+        self.error = None
+
+
+class StartupProfile:
+    """
+    Start-up phases in the order they were declared
+
+    A phase is expect()ed when it is known to be coming, begin()s and
+    ends done() or fail()ed. The process is ready once every phase is
+    done; the profile is reported once none is pending or running.
+    """
+
+    def __init__(self, report_path=DEFAULT_REPORT_PATH):
+        self.report_path = report_path
+        self.phases = {}
+        self.reported = False
+        age = _process_age()
+        self.origin = IMPORTED - age if age is not None else IMPORTED
+        if age is not None:
+            interpreter = self._phase('interpreter')
+            interpreter.state = DONE
+            interpreter.started, interpreter.finished = self.origin, IMPORTED
+
+    def _phase(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(name)
+        return phase
+
+    def expect(self, *names):
+        for name in names:
+            self._phase(name)
+
+    def begin(self, name, at=None):
+        phase = self._phase(name)
+        phase.state = RUNNING
+        phase.started = time.monotonic() if at is None else at
+        phase.finished = None
+        phase.error = None
+
+    def done(self, name):
+        phase = self._phase(name)
+        if phase.started is None:
+            phase.started = time.monotonic()
+        phase.state = DONE
+        phase.finished = time.monotonic()
+        phase.error = None
+        self._maybe_report()
+
+    def fail(self, name, error):
+        phase = self._phase(name)
+        if phase.started is None:
+            phase.started = time.monotonic()
+        phase.state = FAILED
+        phase.finished = time.monotonic()
+        phase.error = str(error)
+        logger.error("Startup phase %s failed: %s", name, error)
+        self._maybe_report()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block; an exception fails the phase and propagates"""
+        self.begin(name)
+        try:
+            yield
+        except BaseException as e:
+            self.fail(name, str(e) or type(e).__name__)
+            raise
+        self.done(name)
+
+    @property
+    def ready(self):
+        return bool(self.phases) and all(p.state == DONE for p in self.phases.values())
+
+    @property
+    def settled(self):
+        return all(p.state in (DONE, FAILED) for p in self.phases.values())
+
+    def to_dict(self):
+        def ms(t):
+            return None if t is None else round((t - self.origin) * 1000, 1)
+
+        now = time.monotonic()
+        return {
+            'ready': self.ready,
+            'uptime_s': round(now - self.origin, 3),
+            'fast_start': FAST_START,
+            'phases': [
+                {
+                    'name': p.name,
+                    'state': p.state,
+                    'start_ms': ms(p.started),
+                    'end_ms': ms(p.finished),
+                    'duration_ms': (
+                        round(((p.finished or now) - p.started) * 1000, 1)
+                        if p.started is not None else None
+                    ),
+                    **({'error': p.error} if p.error else {}),
+                }
+                for p in self.phases.values()
+            ],
+        }
+
+    def _maybe_report(self):
+        if self.reported or not self.settled:
+            return
+        self.reported = True
+        report = self.to_dict()
+        logger.info("Startup %s after %.0f ms: %s",
+                    'complete' if report['ready'] else 'finished with failures',
+                    max(p['end_ms'] or 0 for p in report['phases']),
+                    ', '.join(f"{p['name']} {p['duration_ms']:.0f} ms" for p in report['phases']))
+        if self.report_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.report_path)), exist_ok=True)
+                with open(self.report_path, 'a') as f:
+                    f.write(json.dumps(dict(report, recorded_at=time.time())) + '\n')
+            except OSError as e:
+                logger.warning("Could not write startup profile: %s", e)
+
+
+PROFILE = StartupProfile()
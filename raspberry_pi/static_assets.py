@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Static Assets
+Serves the dashboard from memory, precompressed, with validators
+
+Every file is read and compressed (gzip, and brotli when the Brotli
+package is installed) once, in a worker thread, at start-up or when it
+changes on disk. A request is then a dict lookup: the best encoding the
+client accepts, a strong ETag per encoding, and 304 when the client's
+copy is current. HTML is revalidated on every load so a screen picks up
+a new dashboard immediately; other assets are cached for ``max_age``.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from email.utils import formatdate
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# A dedicated web directory is served whole; in a checkout only the
+# dashboard itself is, never the sources, database or notes beside it
+WEB_DIR = os.path.join(_HERE, '..', 'web')
+CHECKOUT_DIR = os.path.join(_HERE, '..')
+DASHBOARD_FILES = ('preview.html',)
+
+# Served for "/", first one present
+INDEX_FILES = ('index.html', 'preview.html')
+
+EXTENSIONS = frozenset((
+    '.html', '.css', '.js', '.mjs', '.svg', '.png', '.jpg', '.jpeg', '.gif',
+    '.webp', '.ico', '.woff', '.woff2', '.webmanifest',
+))
+
+# Already-compressed formats are served as they are
+_COMPRESSIBLE = ('text/', 'application/javascript', 'image/svg+xml', 'application/manifest+json')
+
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+mimetypes.add_type('application/javascript', '.mjs')
+
+
+def default_site():
+    """
+    (root, files) to serve, or None
+
+    HEALTHPAD_WEB_ROOT or ../web are served whole (files is None);
+    otherwise the checkout's DASHBOARD_FILES only.
+    """
+    configured = os.environ.get('HEALTHPAD_WEB_ROOT')
+    if configured:
+        return configured, None
+    if os.path.isdir(WEB_DIR) and any(name.endswith('.html') for name in os.listdir(WEB_DIR)):
+        return os.path.normpath(WEB_DIR), None
+    if any(os.path.isfile(os.path.join(CHECKOUT_DIR, name)) for name in DASHBOARD_FILES):
+        return os.path.normpath(CHECKOUT_DIR), DASHBOARD_FILES
+    return None
+
+
+class Asset:
+    """One file and its precompressed variants"""
+
+    __slots__ = ('path', 'mtime', 'size', 'content_type', 'last_modified',
+                 'etag', 'bodies')
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.path = path
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        # encoding -> body, only kept where compression actually helps
+        self.bodies = {'identity': body}
+        if self.content_type.startswith(_COMPRESSIBLE):
+            candidates = {'gzip': gzip.compress(body, 9, mtime=0)}
+            if brotli is not None:
+                candidates['br'] = brotli.compress(body, quality=11)
+            for encoding, compressed in candidates.items():
+                if len(compressed) < len(body):
+                    self.bodies[encoding] = compressed
+
+    def changed(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_mtime != self.mtime or stat.st_size != self.size
+
+
+def _accepted(header):
+    """Encodings from an Accept-Encoding header, minus any refused with q=0"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class StaticAssets:
+    """
+    In-memory dashboard files under ``root``, served by handle()
+
+    ``files`` limits them to those relative paths; without it the whole
+    tree is served. start() loads them and then checks for changes every
+    ``check_interval`` seconds; changed, new and deleted files are picked
+    up without a restart.
+    """
+
+    def __init__(self, root, files=None, max_age=3600, check_interval=2.0,
+                 index=INDEX_FILES):
+        self.root = os.path.abspath(root)
+        self.files = files
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.index = index
+        self.assets = {}
+        self.loads = 0
+        self._task = None
+
+    def _files(self):
+        """Relative URL path -> file path for every servable file"""
+        if self.files is not None:
+            paths = {name: os.path.join(self.root, name) for name in self.files}
+            return {name: path for name, path in paths.items() if os.path.isfile(path)}
+        files = {}
+        for directory, dirnames, filenames in os.walk(self.root):
+            # No dot-directories (.git) and no Python package directories
+            dirnames[:] = [
+                d for d in dirnames
+                if not d.startswith('.') and d not in ('venv', '__pycache__', 'node_modules')
+            ]
+            for name in filenames:
+                if name.startswith('.') or os.path.splitext(name)[1].lower() not in EXTENSIONS:
+                    continue
+                path = os.path.join(directory, name)
+                files[os.path.relpath(path, self.root).replace(os.sep, '/')] = path
+        return files
+
+    def refresh(self):
+        """Load new and changed files, forget deleted ones; returns what changed"""
+        files = self._files()
+        assets = {}
+        changed = []
+        for url, path in files.items():
+            asset = self.assets.get(url)
+            if asset is None or asset.changed():
+                try:
+                    asset = Asset(path)
+                except OSError as e:
+                    logger.warning("Could not load %s: %s", path, e)
+                    continue
+                changed.append(url)
+                self.loads += 1
+            assets[url] = asset
+        changed.extend(url for url in self.assets if url not in files)
+        # One assignment, so a request never sees a half-updated table
+        self.assets = assets
+        return changed
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                changed = await loop.run_in_executor(None, self.refresh)
+            except OSError as e:
+                logger.warning("Could not rescan %s: %s", self.root, e)
+                continue
+            if changed:
+                logger.info("Reloaded static assets: %s", ', '.join(sorted(changed)))
+
+    async def start(self, app=None):
+        # Compression (brotli at quality 11 especially) stays off the loop
+        await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+        total = sum(len(a.bodies['identity']) for a in self.assets.values())
+        logger.info("Serving %d static file(s) (%d bytes) from %s",
+                    len(self.assets), total, self.root)
+        if self.check_interval and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self, app=None):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def handle(self, request):
+        """GET/HEAD /{path}"""
+        url = request.match_info.get('path', '')
+        if not url:
+            url = next((name for name in self.index if name in self.assets), '')
+        asset = self.assets.get(url)
+        if asset is None:
+            raise web.HTTPNotFound()
+
+        accepted = _accepted(request.headers.get('Accept-Encoding', ''))
+        encoding = next(
+            (e for e in ('br', 'gzip') if e in accepted and e in asset.bodies), 'identity'
+        )
+        # Strong validators are per representation, so each encoding gets its own
+        etag = f'"{asset.etag}"' if encoding == 'identity' else f'"{asset.etag}-{encoding}"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': asset.last_modified,
+            'Cache-Control': (
+                'no-cache' if asset.content_type == 'text/html'
+                else f'public, max-age={self.max_age}'
+            ),
+            'Vary': 'Accept-Encoding',
+        }
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = {tag.strip() for tag in if_none_match.split(',')}
+            if '*' in tags or etag in tags:
+                raise web.HTTPNotModified(headers=headers)
+        elif request.if_modified_since and int(asset.mtime) <= request.if_modified_since.timestamp():
+            raise web.HTTPNotModified(headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return web.Response(
+            body=asset.bodies[encoding], content_type=asset.content_type, headers=headers
+        )
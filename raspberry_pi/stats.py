@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Streaming Statistics
+O(1)-update per-device aggregates, checkpointed to disk
+
+The checkpoint holds the aggregates and the store row id they cover.
+The readings inside the rolling windows are not written out; on start
+they are read back from the store, and rows stored after the checkpoint
+(up to a minute's worth after a crash, or the whole store on first
+start) are replayed.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from bisect import bisect_left, bisect_right
+
+from classification import CATEGORIES, classify_code
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = os.environ.get(
+    'HEALTHPAD_STATS',
+    os.path.expanduser('~/healthpad/stats.json')
+)
+
+WINDOWS = {'7d': 7 * 86400, '30d': 30 * 86400}
+METRICS = ('systolic', 'diastolic', 'pulse')
+
+# Time constant of the exponentially weighted trend
+EWMA_TAU = 7 * 86400
+
+
+class RollingWindow:
+    """
+    Mean and variance over the last ``span`` seconds
+
+    Welford updates on add, and the inverse update when a reading falls
+    out of the window. Both are order-independent, so a reading that
+    arrives late (a history download) is inserted in time order and
+    counts the same as if it had arrived on time.
+    """
+
+    def __init__(self, span):
+        self.span = span
+        # Kept sorted by time; ``times`` mirrors it for bisect
+        self.times = []
+        self.readings = []
+        self.n = 0
+        self.mean = [0.0] * len(METRICS)
+        self.m2 = [0.0] * len(METRICS)
+        self.cutoff = -math.inf
+
+    def add(self, ts, values):
+        if ts < self.cutoff:
+            return  # already outside the window
+        if not self.times or ts >= self.times[-1]:
+            self.times.append(ts)
+            self.readings.append(values)
+        else:
+            i = bisect_right(self.times, ts)
+            self.times.insert(i, ts)
+            self.readings.insert(i, values)
+        self.n += 1
+        for i, x in enumerate(values):
+            delta = x - self.mean[i]
+            self.mean[i] += delta / self.n
+            self.m2[i] += delta * (x - self.mean[i])
+
+    def _remove(self, values):
+        self.n -= 1
+        if self.n == 0:
+            self.mean = [0.0] * len(METRICS)
+            self.m2 = [0.0] * len(METRICS)
+            return
+        for i, x in enumerate(values):
+            delta = x - self.mean[i]
+            self.mean[i] -= delta / self.n
+            self.m2[i] = max(0.0, self.m2[i] - delta * (x - self.mean[i]))
+
+    def expire(self, now):
+        cutoff = now - self.span
+        if cutoff <= self.cutoff:
+            return
+        self.cutoff = cutoff
+        count = bisect_left(self.times, cutoff)
+        if count:
+            for values in self.readings[:count]:
+                self._remove(values)
+            del self.times[:count]
+            del self.readings[:count]
+
+    def snapshot(self):
+        result = {'count': self.n}
+        for i, name in enumerate(METRICS):
+            if self.n:
+                variance = self.m2[i] / (self.n - 1) if self.n > 1 else 0.0
+                result[name] = {
+                    'mean': round(self.mean[i], 1),
+                    'std': round(math.sqrt(variance), 1),
+                }
+            else:
+                result[name] = None
+        return result
+
+
+class DeviceStats:
+    """Rolling windows, category counts and EWMA trend for one device"""
+
+    def __init__(self):
+        self.windows = {name: RollingWindow(span) for name, span in WINDOWS.items()}
+        self.categories = [0] * len(CATEGORIES)
+        self.total = 0
+        self.ewma = None
+        self.last_ts = None
+
+    def update(self, ts, systolic, diastolic, pulse, code):
+        values = (systolic, diastolic, pulse)
+        for window in self.windows.values():
+            window.add(ts, values)
+            window.expire(ts)
+        if self.last_ts is None or ts >= self.last_ts:
+            # The trend follows the newest reading; a late one (from a
+            # history download) is left out of it
+            if self.ewma is None:
+                self.ewma = list(values)
+            else:
+                alpha = 1.0 - math.exp(-(ts - self.last_ts) / EWMA_TAU)
+                self.ewma = [e + alpha * (x - e) for e, x in zip(self.ewma, values)]
+            self.last_ts = ts
+        self.categories[code] += 1
+        self.total += 1
+
+    def snapshot(self, now):
+        result = {'count': self.total, 'last_reading': self.last_ts}
+        for name, window in self.windows.items():
+            window.expire(now)
+            result[name] = window.snapshot()
+        result['categories'] = {
+            CATEGORIES[code]['level']: count
+            for code, count in enumerate(self.categories)
+        }
+        result['trend'] = (
+            {name: round(v, 1) for name, v in zip(METRICS, self.ewma)}
+            if self.ewma else None
+        )
+        return result
+
+    def to_dict(self):
+        # Window contents come back from the store (StatsEngine.catch_up)
+        return {
+            'categories': list(self.categories),
+            'total': self.total,
+            'ewma': list(self.ewma) if self.ewma else None,
+            'last_ts': self.last_ts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.categories = list(data['categories'])
+        stats.total = data['total']
+        stats.ewma = data['ewma']
+        stats.last_ts = data['last_ts']
+        return stats
+
+
+class StatsEngine:
+    """
+    Per-device streaming statistics with periodic checkpoints
+
+    start() catches up with ``store`` in the background. Readings folded
+    in while that runs are held back and applied after it, in the order
+    they were stored.
+    """
+
+    # Stored rows folded per event loop turn while catching up
+    CATCH_UP_CHUNK = 1000
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH, checkpoint_interval=60.0, store=None):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.store = store
+        self.devices = {}
+        self.dirty = False
+        # Highest store row id reflected in the aggregates
+        self.last_id = 0
+        # False until caught up; an incomplete catch-up is never saved
+        self.ready = store is None
+        self._pending = None
+        self._task = None
+        self.loaded = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable stats checkpoint %s: %s", self.path, e)
+            return False
+        try:
+            self.devices = {
+                address: DeviceStats.from_dict(state)
+                for address, state in data['devices'].items()
+            }
+            self.last_id = int(data['last_id'])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Ignoring incompatible stats checkpoint %s: %s", self.path, e)
+            self.devices = {}
+            self.last_id = 0
+            return False
+        return True
+
+    def update(self, address, ts, systolic, diastolic, pulse, code=None):
+        """Fold one reading into the device's aggregates"""
+        if self._pending is not None:
+            self._pending.append((address, ts, systolic, diastolic, pulse, code))
+        else:
+            self._fold(address, ts, systolic, diastolic, pulse, code)
+
+    def _device(self, address):
+        stats = self.devices.get(address)
+        if stats is None:
+            stats = self.devices[address] = DeviceStats()
+        return stats
+
+    def _fold(self, address, ts, systolic, diastolic, pulse, code=None):
+        stats = self._device(address)
+        if code is None:
+            code = classify_code(systolic, diastolic)
+        stats.update(ts, systolic, diastolic, pulse, code)
+        self.dirty = True
+
+    def rebuild(self, rows):
+        """Seed from (address, ts, systolic, diastolic, pulse) rows in store order"""
+        self.devices = {}
+        for address, ts, systolic, diastolic, pulse in rows:
+            self.update(address, ts, systolic, diastolic, pulse)
+
+    def _read_store(self, upto):
+        """
+        Worker thread: window contents, and the rows to replay
+
+        Rows are replayed in id order, the order they were folded in
+        live, so late readings are late again and the trend comes out
+        the same as if the process had never stopped.
+        """
+        since = time.time() - max(WINDOWS.values())
+        window_rows = self.store.readings(0, self.last_id, since=since)
+        return window_rows, self.store.readings(self.last_id, upto)
+
+    async def catch_up(self):
+        """Refill the windows from the store and replay rows newer than the checkpoint"""
+        loop = asyncio.get_running_loop()
+        # Live readings from here on are stored after ``upto``; hold them back
+        self._pending = []
+        try:
+            upto = await loop.run_in_executor(None, self.store.max_id)
+            window_rows, replay = await loop.run_in_executor(None, self._read_store, upto)
+            for address, ts, systolic, diastolic, pulse in window_rows:
+                for window in self._device(address).windows.values():
+                    window.add(ts, (systolic, diastolic, pulse))
+            for i in range(0, len(replay), self.CATCH_UP_CHUNK):
+                for row in replay[i:i + self.CATCH_UP_CHUNK]:
+                    self._fold(*row)
+                await asyncio.sleep(0)
+            self.last_id = upto
+            self.ready = True
+        finally:
+            pending, self._pending = self._pending, None
+            for reading in pending:
+                self._fold(*reading)
+        self.dirty = True
+        if replay:
+            logger.info("Stats: replayed %d stored reading(s)", len(replay))
+
+    def snapshot(self, address=None):
+        now = time.time()
+        if address is not None:
+            stats = self.devices.get(address)
+            return stats.snapshot(now) if stats else None
+        return {a: s.snapshot(now) for a, s in self.devices.items()}
+
+    def _write(self, state):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, self.path)
+            return True
+        except OSError as e:
+            logger.warning("Could not write stats checkpoint: %s", e)
+            return False
+
+    async def checkpoint(self):
+        """Write the aggregates to disk (in a worker thread) if anything changed"""
+        if not self.dirty or not self.ready:
+            return
+        state = {
+            'saved_at': time.time(),
+            'devices': {a: s.to_dict() for a, s in self.devices.items()},
+        }
+        self.dirty = False
+        # Every reading folded so far was queued for the store before this
+        # mark, and nothing queued after it is counted as covered
+        mark = self.store.mark() if self.store is not None else None
+        state['last_id'] = await asyncio.wrap_future(mark) if mark else self.last_id
+        if not await asyncio.get_running_loop().run_in_executor(None, self._write, state):
+            self.dirty = True
+
+    async def _run(self):
+        if self.store is not None:
+            try:
+                await self.catch_up()
+            except Exception as e:
+                logger.error("Could not catch up with the measurement store: %s", e)
+        while True:
+            await self.checkpoint()
+            await asyncio.sleep(self.checkpoint_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.checkpoint()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Measurement Store
+Append-only SQLite (WAL) storage indexed by device address and time
+"""
+
+import logging
+import os
+import queue
+from concurrent.futures import Future
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.environ.get(
+    'HEALTHPAD_DB',
+    os.path.expanduser('~/healthpad/measurements.db')
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id          INTEGER PRIMARY KEY,
+    address     TEXT    NOT NULL,
+    ts          REAL    NOT NULL,
+    systolic    INTEGER NOT NULL,
+    diastolic   INTEGER NOT NULL,
+    pulse       INTEGER NOT NULL,
+    level       TEXT,
+    measured_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_measurements_address_ts ON measurements (address, ts);
+CREATE INDEX IF NOT EXISTS idx_measurements_ts ON measurements (ts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    address     TEXT PRIMARY KEY,
+    cursor      REAL,
+    last_sync   REAL,
+    records     INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Created after the column migration below. A record that carries the
+# device's own measurement time is unique per device, so re-downloading
+# history (or a live reading followed by its history copy) is ignored.
+_DEDUP_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_measurements_dedup
+    ON measurements (address, measured_at, systolic, diastolic, pulse)
+    WHERE measured_at IS NOT NULL;
+"""
+
+_INSERT = ("INSERT OR IGNORE INTO measurements "
+           "(address, ts, systolic, diastolic, pulse, level, measured_at) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?)")
+_SET_CURSOR = ("INSERT INTO sync_state (address, cursor, last_sync, records) "
+               "VALUES (?, ?, ?, ?) "
+               "ON CONFLICT (address) DO UPDATE SET "
+               "cursor = COALESCE(MAX(cursor, excluded.cursor), cursor, excluded.cursor), "
+               "last_sync = excluded.last_sync, "
+               "records = records + excluded.records")
+_COLUMNS = "id, address, ts, systolic, diastolic, pulse, level, measured_at"
+
+_STOP = object()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # NORMAL is durable across application crashes in WAL mode and avoids
+    # an fsync per commit, which is what wears out SD cards
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _row_to_measurement(row):
+    return {
+        'id': row[0],
+        'address': row[1],
+        'timestamp': datetime.fromtimestamp(row[2]).isoformat(),
+        'systolic': row[3],
+        'diastolic': row[4],
+        'pulse': row[5],
+        'level': row[6],
+        'measured_at': datetime.fromtimestamp(row[7]).isoformat() if row[7] else None,
+    }
+
+
+def epoch_seconds(value):
+    """Epoch seconds from an ISO string or a number (None passes through)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return datetime.fromisoformat(value).timestamp()
+
+
+class MeasurementStore:
+    """Persistent measurement history with batched background writes"""
+
+    def __init__(self, path=DEFAULT_DB_PATH, batch_size=256):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.last_modified = (
+            os.path.getmtime(path) if os.path.exists(path) else time.time()
+        )
+
+        self._read_conn = _connect(path)
+        self._read_conn.executescript(SCHEMA)
+        columns = {r[1] for r in self._read_conn.execute("PRAGMA table_info(measurements)")}
+        if 'measured_at' not in columns:
+            self._read_conn.execute("ALTER TABLE measurements ADD COLUMN measured_at REAL")
+        self._read_conn.executescript(_DEDUP_INDEX)
+        self._read_lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_loop, name='measurement-store', daemon=True
+        )
+        self._writer.start()
+
+    def append(self, measurement):
+        """Queue a measurement for writing; never blocks the caller"""
+        self._queue.put((_INSERT, self._row(measurement)))
+
+    def append_many(self, measurements):
+        """Queue a batch of measurements to be written in one transaction"""
+        self._queue.put((_INSERT, [self._row(m) for m in measurements]))
+
+    def mark(self):
+        """
+        A Future for the highest row id once everything queued so far is written
+
+        Rows queued after the mark are not included, so a caller that
+        snapshots state derived from the queued rows and then marks knows
+        exactly which rows the snapshot covers.
+        """
+        future = Future()
+        self._queue.put(future)
+        return future
+
+    def set_sync_cursor(self, address, cursor, records):
+        """Record a finished history sync, queued behind its measurements"""
+        self._queue.put((_SET_CURSOR, (address, cursor, time.time(), records)))
+
+    @staticmethod
+    def _row(measurement):
+        measured_at = epoch_seconds(measurement.get('measured_at'))
+        ts = measurement.get('ts')
+        if ts is None:
+            ts = measured_at if measurement.get('source') == 'history' else None
+        if ts is None:
+            ts = epoch_seconds(measurement['timestamp'])
+        classification = measurement.get('classification') or {}
+        return (
+            measurement.get('address', ''),
+            ts,
+            measurement['systolic'],
+            measurement['diastolic'],
+            measurement['pulse'],
+            classification.get('level', measurement.get('level')),
+            measured_at,
+        )
+
+    def _write_loop(self):
+        conn = _connect(self.path)
+        while True:
+            item = self._queue.get()
+            batch = []
+            marks = []
+            stop = item is _STOP
+            if isinstance(item, Future):
+                marks.append(item)
+            elif not stop:
+                batch.append(item)
+            # Drain whatever else is already queued into the same
+            # transaction; a mark ends it, so its row id excludes later rows
+            while not stop and not marks and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, Future):
+                    marks.append(item)
+                else:
+                    batch.append(item)
+
+            if batch:
+                try:
+                    with conn:
+                        for sql, params in batch:
+                            if isinstance(params, list):
+                                conn.executemany(sql, params)
+                            else:
+                                conn.execute(sql, params)
+                    self.last_modified = time.time()
+                except sqlite3.Error as e:
+                    logger.error("Failed to write %d queued write(s): %s", len(batch), e)
+            for mark in marks:
+                mark.set_result(conn.execute("SELECT MAX(id) FROM measurements").fetchone()[0] or 0)
+
+            for _ in range(len(batch) + len(marks) + stop):
+                self._queue.task_done()
+            if stop:
+                conn.close()
+                return
+
+    def flush(self):
+        """Block until every queued measurement has been written"""
+        self._queue.join()
+
+    def _fetch(self, sql, params=()):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def query(self, address=None, start=None, end=None, limit=1000):
+        """Measurements in [start, end) (epoch seconds), oldest first"""
+        clauses, params = self._range(address, start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        rows = self._fetch(
+            f"SELECT {_COLUMNS} FROM measurements {where} ORDER BY ts LIMIT ?",
+            params
+        )
+        return [_row_to_measurement(r) for r in rows]
+
+    def _range(self, address, start, end):
+        clauses, params = [], []
+        if address:
+            clauses.append("address = ?")
+            params.append(address)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        return clauses, params
+
+    def page(self, address=None, start=None, end=None, after=None, limit=500):
+        """
+        One page of measurements ordered by (ts, id)
+
+        ``after`` is the (ts, id) of the last row of the previous page
+        (keyset pagination, so deep pages cost the same as the first).
+        """
+        clauses, params = self._range(address, start, end)
+        if after is not None:
+            clauses.append("(ts > ? OR (ts = ? AND id > ?))")
+            params.extend((after[0], after[0], after[1]))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        rows = self._fetch(
+            f"SELECT {_COLUMNS} FROM measurements {where} ORDER BY ts, id LIMIT ?",
+            params
+        )
+        return [_row_to_measurement(r) for r in rows], (
+            (rows[-1][2], rows[-1][0]) if len(rows) == limit else None
+        )
+
+    def aggregate(self, bucket_seconds, address=None, start=None, end=None,
+                  utc_offset=0):
+        """
+        Min/max/mean per time bucket of ``bucket_seconds``
+
+        ``utc_offset`` shifts bucket boundaries so daily buckets start at
+        local midnight.
+        """
+        clauses, params = self._range(address, start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._fetch(
+            f"SELECT CAST((ts + ?) / ? AS INTEGER) AS bucket, COUNT(*), "
+            f"MIN(systolic), MAX(systolic), AVG(systolic), "
+            f"MIN(diastolic), MAX(diastolic), AVG(diastolic), "
+            f"MIN(pulse), MAX(pulse), AVG(pulse) "
+            f"FROM measurements {where} GROUP BY bucket ORDER BY bucket",
+            [utc_offset, bucket_seconds] + params
+        )
+        return [
+            {
+                'start': datetime.fromtimestamp(r[0] * bucket_seconds - utc_offset).isoformat(),
+                'count': r[1],
+                'systolic': {'min': r[2], 'max': r[3], 'mean': round(r[4], 1)},
+                'diastolic': {'min': r[5], 'max': r[6], 'mean': round(r[7], 1)},
+                'pulse': {'min': r[8], 'max': r[9], 'mean': round(r[10], 1)},
+            }
+            for r in rows
+        ]
+
+    def addresses(self):
+        """Every device address with stored measurements"""
+        return [r[0] for r in self._fetch("SELECT DISTINCT address FROM measurements")]
+
+    def columns(self, address=None, start=None, end=None):
+        """Bare (ts, systolic, diastolic, pulse) tuples for batch analytics"""
+        clauses, params = self._range(address, start, end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._fetch(
+            f"SELECT ts, systolic, diastolic, pulse FROM measurements {where} ORDER BY ts",
+            params
+        )
+
+    def readings(self, after_id=0, upto_id=None, since=None):
+        """
+        Bare (address, ts, systolic, diastolic, pulse) rows in id order
+
+        Rows after ``after_id`` up to ``upto_id``, and from ``since`` on.
+        """
+        clauses, params = ["id > ?"], [after_id]
+        if upto_id is not None:
+            clauses.append("id <= ?")
+            params.append(upto_id)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        return self._fetch(
+            f"SELECT address, ts, systolic, diastolic, pulse FROM measurements "
+            f"WHERE {' AND '.join(clauses)} ORDER BY id",
+            params
+        )
+
+    def stored_records(self, address, start, end):
+        """
+        (measured_at, systolic, diastolic, pulse) of the device records
+        stored for ``address`` with measured_at in [start, end]
+        """
+        return set(self._fetch(
+            "SELECT measured_at, systolic, diastolic, pulse FROM measurements "
+            "WHERE address = ? AND measured_at BETWEEN ? AND ?",
+            (address, start, end)
+        ))
+
+    def max_id(self):
+        """Highest row id; changes whenever a measurement is stored"""
+        return self._fetch("SELECT MAX(id) FROM measurements")[0][0] or 0
+
+    def latest(self, address=None):
+        """Most recent measurement, optionally for one device"""
+        if address:
+            rows = self._fetch(
+                f"SELECT {_COLUMNS} FROM measurements WHERE address = ? "
+                f"ORDER BY ts DESC LIMIT 1", (address,)
+            )
+        else:
+            rows = self._fetch(
+                f"SELECT {_COLUMNS} FROM measurements ORDER BY ts DESC LIMIT 1"
+            )
+        return _row_to_measurement(rows[0]) if rows else None
+
+    def sync_state(self, address):
+        """History sync cursor for ``address``, or None if never synced"""
+        rows = self._fetch(
+            "SELECT cursor, last_sync, records FROM sync_state WHERE address = ?",
+            (address,)
+        )
+        if not rows:
+            return None
+        return {'cursor': rows[0][0], 'last_sync': rows[0][1], 'records': rows[0][2]}
+
+    def count(self, address=None):
+        if address:
+            rows = self._fetch(
+                "SELECT COUNT(*) FROM measurements WHERE address = ?", (address,)
+            )
+        else:
+            rows = self._fetch("SELECT COUNT(*) FROM measurements")
+        return rows[0][0]
+
+    def close(self):
+        """Write out pending measurements and close the database"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        with self._read_lock:
+            self._read_conn.close()
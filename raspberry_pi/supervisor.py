@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Connection Supervisor
+Reconnects dropped devices with jittered exponential backoff
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from metrics import RECONNECT_ATTEMPTS, RECONNECTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REMEMBERED_PATH = os.environ.get(
+    'HEALTHPAD_REMEMBERED',
+    os.path.expanduser('~/healthpad/remembered_devices.json')
+)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with jitter: 50-100% of min(cap, base * 2^attempt)"""
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+class ConnectionSupervisor:
+    """
+    Watches DeviceManager sessions and brings dropped links back
+
+    Reconnects go straight to the last known address (no scan). When the
+    background scanner sees an advertisement from a device we are waiting
+    for, the backoff sleep is cut short: a cuff advertises as soon as it
+    wakes up, which is exactly when it has a fresh reading to send.
+    """
+
+    def __init__(self, manager, scanner=None, path=DEFAULT_REMEMBERED_PATH,
+                 base_delay=1.0, max_delay=60.0):
+        self.manager = manager
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.health = {}
+        self._tasks = {}
+        self._wake = {}
+        self._remembered = set(self._load())
+
+        manager.add_listener(self._on_device_event)
+        if scanner is not None:
+            scanner.add_listener(self._on_advertisement)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable remembered devices %s: %s", self.path, e)
+            return []
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(sorted(self._remembered), f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Could not save remembered devices: %s", e)
+
+    @property
+    def remembered(self):
+        return sorted(self._remembered)
+
+    def _health(self, address):
+        health = self.health.get(address)
+        if health is None:
+            health = self.health[address] = {
+                'connected_since': None,
+                'uptime_s': 0.0,
+                'disconnects': 0,
+                'reconnects': 0,
+                'reconnect_attempts': 0,
+                'last_recovery_s': None,
+                'reconnecting': False,
+                '_up_at': None,
+            }
+        return health
+
+    def _on_device_event(self, event, session):
+        address = session.address
+        health = self._health(address)
+        if event == 'connected':
+            health['connected_since'] = time.time()
+            health['_up_at'] = time.monotonic()
+            if address not in self._remembered:
+                self._remembered.add(address)
+                self._save()
+        elif event == 'disconnected':
+            if health['_up_at'] is not None:
+                health['uptime_s'] += time.monotonic() - health['_up_at']
+            health['_up_at'] = None
+            health['connected_since'] = None
+            health['disconnects'] += 1
+            # Sessions removed through DeviceManager.disconnect() were
+            # dropped on purpose; everything else gets reconnected
+            if self.manager.get(address) is session:
+                self._start(address)
+
+    def _on_advertisement(self, entry):
+        wake = self._wake.get(entry['address'])
+        if wake is not None:
+            wake.set()
+
+    def _start(self, address):
+        if address not in self._tasks:
+            self._tasks[address] = asyncio.create_task(self._reconnect(address))
+
+    async def _reconnect(self, address):
+        health = self._health(address)
+        health['reconnecting'] = True
+        wake = self._wake[address] = asyncio.Event()
+        started = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                session = self.manager.get(address)
+                if session is None or session.connected:
+                    return
+                health['reconnect_attempts'] += 1
+                RECONNECT_ATTEMPTS.inc()
+                if await session.connect():
+                    health['reconnects'] += 1
+                    RECONNECTS.inc()
+                    health['last_recovery_s'] = round(time.monotonic() - started, 3)
+                    logger.info("✓ Reconnected to %s after %ss (%d attempt(s))",
+                                address, health['last_recovery_s'], attempt + 1)
+                    return
+
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                attempt += 1
+                logger.info("Retrying %s in %.1fs", address, delay)
+                try:
+                    await asyncio.wait_for(wake.wait(), delay)
+                    logger.info("%s is advertising, reconnecting now", address)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+        finally:
+            health['reconnecting'] = False
+            self._wake.pop(address, None)
+            self._tasks.pop(address, None)
+
+    def restore(self):
+        """Reconnect every remembered device in the background (warm restart)"""
+        for address in self._remembered:
+            self.manager.session(address)
+            self._start(address)
+        return self.remembered
+
+    def forget(self, address=None):
+        """Stop supervising ``address`` (or every device)"""
+        addresses = [address] if address else list(self._remembered | set(self._tasks))
+        for addr in addresses:
+            task = self._tasks.pop(addr, None)
+            if task:
+                task.cancel()
+            self._remembered.discard(addr)
+        self._save()
+
+    def snapshot(self, address):
+        """Health counters for the API, with uptime including the current link"""
+        health = self.health.get(address)
+        if health is None:
+            return None
+        result = {k: v for k, v in health.items() if not k.startswith('_')}
+        if health['_up_at'] is not None:
+            result['uptime_s'] += time.monotonic() - health['_up_at']
+        result['uptime_s'] = round(result['uptime_s'], 1)
+        return result
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,78 @@
+import itertools
+import random
+import statistics
+
+import numpy as np
+import pytest
+
+from analytics import classify_codes, summarize
+from classification import CATEGORIES, classify_code
+from stats import RollingWindow
+
+DAY = 86400.0
+
+
+def test_classify_codes_matches_scalar():
+    # Every threshold, one either side of it, and the extremes
+    systolic = [0, 300] + [t + d for t in (120, 130, 140, 180) for d in (-1, 0, 1)]
+    diastolic = [0, 200] + [t + d for t in (80, 90, 120) for d in (-1, 0, 1)]
+    pairs = list(itertools.product(systolic, diastolic))
+    codes = classify_codes(np.array([s for s, _ in pairs]), np.array([d for _, d in pairs]))
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [classify_code(s, d) for s, d in pairs]
+
+
+def readings(days=5, per_day=8, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for day in range(days):
+        for _ in range(per_day):
+            rows.append((day * DAY + rng.uniform(0, DAY), rng.randint(100, 170),
+                         rng.randint(60, 100), rng.randint(50, 100)))
+    return rows
+
+
+def test_summarize_per_day():
+    rows = readings()
+    report = summarize(*zip(*rows), period='day')
+    assert len(report) == 5
+    for day, period in enumerate(report):
+        group = [r for r in rows if day * DAY <= r[0] < (day + 1) * DAY]
+        assert period['period_start'] == str(np.datetime64(int(day * DAY), 's'))
+        assert period['count'] == len(group)
+        for i, name in enumerate(('systolic', 'diastolic', 'pulse'), 1):
+            values = [r[i] for r in group]
+            assert period[name]['mean'] == round(statistics.mean(values), 1)
+            assert period[name]['std'] == round(statistics.stdev(values), 1)
+        shares = period['categories']
+        assert set(shares) == {c['level'] for c in CATEGORIES}
+        assert sum(shares.values()) == pytest.approx(1.0, abs=0.01)
+
+
+def test_summarize_std_matches_stats_engine():
+    rows = readings(days=1, per_day=20)
+    window = RollingWindow(DAY)
+    for ts, systolic, diastolic, pulse in rows:
+        window.add(ts, (systolic, diastolic, pulse))
+    expected = window.snapshot()
+    [period] = summarize(*zip(*rows))
+    for name in ('systolic', 'diastolic', 'pulse'):
+        assert period[name] == expected[name]
+
+
+def test_summarize_std_keeps_small_variance():
+    # E[x²] - E[x]² cancels to nothing here; the true std is 0.5
+    ts = [3600.0 * i for i in range(4)]
+    values = [1e8, 1e8 + 1, 1e8, 1e8 + 1]
+    [period] = summarize(ts, values, values, values)
+    assert period['systolic']['std'] == round(statistics.stdev(values), 1)
+
+
+def test_summarize_single_reading_has_zero_std():
+    [period] = summarize([0.0], [120], [80], [70])
+    assert period['count'] == 1
+    assert period['systolic'] == {'mean': 120.0, 'std': 0.0}
+
+
+def test_summarize_empty():
+    assert summarize([], [], [], []) == []
@@ -0,0 +1,108 @@
+from datetime import datetime
+import struct
+
+from decoder import (
+    BPM_FLAG_KPA, BPM_FLAG_PULSE, BPM_FLAG_STATUS, BPM_FLAG_TIMESTAMP, BPM_FLAG_USER_ID,
+    decode, decode_many, encode_ihealth_frame, sfloat
+)
+from gatt_uuids import STANDARD_CHAR_UUID
+
+
+def sfloat_raw(mantissa, exponent=0):
+    return ((exponent & 0xF) << 12) | (mantissa & 0x0FFF)
+
+
+def bpm(flags, systolic, diastolic, mean, *extra):
+    return struct.pack('<BHHH', flags, systolic, diastolic, mean) + b''.join(extra)
+
+
+def test_sfloat():
+    assert sfloat(sfloat_raw(120)) == 120
+    assert sfloat(sfloat_raw(1200, -1)) == 120
+    assert sfloat(sfloat_raw(-5)) == -5
+    assert sfloat(sfloat_raw(12, 1)) == 120
+
+
+def test_sfloat_special_values():
+    for raw in (0x07FF, 0x0800, 0x07FE, 0x0802, 0x0801):
+        assert sfloat(raw) is None
+
+
+def test_bpm_mmhg():
+    result = decode(bpm(0, sfloat_raw(120), sfloat_raw(80), sfloat_raw(93)))
+    assert result == {
+        'frame': 'bpm', 'systolic': 120, 'diastolic': 80, 'pulse': 0, 'map': 93
+    }
+
+
+def test_bpm_kpa_is_converted():
+    raw = bpm(BPM_FLAG_KPA, sfloat_raw(160, -1), sfloat_raw(107, -1), sfloat_raw(124, -1))
+    result = decode(raw)
+    assert (result['systolic'], result['diastolic']) == (120, 80)
+
+
+def test_bpm_optional_fields():
+    flags = BPM_FLAG_TIMESTAMP | BPM_FLAG_PULSE | BPM_FLAG_USER_ID | BPM_FLAG_STATUS
+    raw = bpm(
+        flags, sfloat_raw(128), sfloat_raw(84), sfloat_raw(99),
+        struct.pack('<HBBBBB', 2024, 3, 5, 10, 20, 30),
+        struct.pack('<H', sfloat_raw(72)),
+        bytes([2]),
+        struct.pack('<H', 0x0004),
+    )
+    result = decode(raw, STANDARD_CHAR_UUID)
+    assert result['measured_at'] == '2024-03-05T10:20:30'
+    assert result['pulse'] == 72
+    assert result['user_id'] == 2
+    assert result['status'] == 0x0004
+
+
+def test_bpm_unknown_timestamp_is_left_out():
+    raw = bpm(BPM_FLAG_TIMESTAMP, sfloat_raw(120), sfloat_raw(80), sfloat_raw(93),
+              bytes(7))
+    assert 'measured_at' not in decode(raw)
+
+
+def test_bpm_rejects_truncated_and_nan():
+    # Timestamp flagged but missing
+    assert decode(bpm(BPM_FLAG_TIMESTAMP, sfloat_raw(120), sfloat_raw(80), sfloat_raw(93))) is None
+    assert decode(bpm(0, 0x07FF, sfloat_raw(80), sfloat_raw(93))) is None
+    assert decode(b'\x00\x78\x00') is None
+
+
+def test_ihealth_frame_round_trip():
+    measured_at = datetime(2025, 6, 1, 7, 45)
+    result = decode(encode_ihealth_frame(135, 88, 76, measured_at, marker=0xFE))
+    assert result == {
+        'frame': 'ihealth', 'systolic': 135, 'diastolic': 88, 'pulse': 76,
+        'measured_at': measured_at.isoformat(),
+    }
+
+
+def test_ihealth_zeroed_time_is_left_out():
+    result = decode(encode_ihealth_frame(120, 80, 70))
+    assert result['systolic'] == 120
+    assert 'measured_at' not in result
+
+
+def test_ihealth_short_frame():
+    # The 6-byte example from IHEALTH_BLUETOOTH_PROTOCOL.md
+    result = decode(bytes.fromhex('fd7800500048'))
+    assert (result['systolic'], result['diastolic'], result['pulse']) == (120, 80, 72)
+    assert decode(bytes.fromhex('fd78005000')) is None
+
+
+def test_ihealth_rejects_implausible_values():
+    assert decode(encode_ihealth_frame(400, 80, 70)) is None
+
+
+def test_unknown_and_empty_payloads():
+    assert decode(b'') is None
+    assert decode(b'\x42' * 12) is None
+
+
+def test_memoryview_and_batch():
+    frame = encode_ihealth_frame(120, 80, 70)
+    assert decode(memoryview(bytearray(frame)))['pulse'] == 70
+    results = decode_many([frame, b'', b'\x42', frame])
+    assert [r and r['systolic'] for r in results] == [120, None, None, 120]
@@ -0,0 +1,36 @@
+import asyncio
+
+import simulator
+import transport
+from devices import DeviceSession
+
+ADDRESS = 'SI:MU:LA:TE:00:AA'
+
+
+def test_failed_setup_closes_the_link(monkeypatch):
+    transport.use('sim')
+    peripheral = simulator.add_device(simulator.SimulatedPeripheral(ADDRESS, rate=0))
+    original = DeviceSession._discover_and_subscribe
+    failures = []
+
+    async def flaky(self):
+        if not failures:
+            failures.append(self.address)
+            raise OSError("GATT discovery failed")
+        await original(self)
+
+    monkeypatch.setattr(DeviceSession, '_discover_and_subscribe', flaky)
+
+    async def run():
+        session = DeviceSession(ADDRESS, lambda *args: None)
+        assert not await session.connect()
+        assert peripheral.client is None
+        # The retry is not refused as "connected to another client"
+        assert await session.connect()
+        await session.disconnect()
+
+    try:
+        asyncio.run(run())
+    finally:
+        simulator.DEVICES.pop(ADDRESS, None)
+    assert failures == [ADDRESS]
@@ -0,0 +1,142 @@
+from datetime import datetime
+
+import pytest
+
+from decoder import encode_ihealth_frame
+from reassembler import FrameReassembler
+
+FRAME = encode_ihealth_frame(120, 80, 70, datetime(2025, 1, 2, 3, 4))
+OTHER = encode_ihealth_frame(131, 85, 66, datetime(2025, 1, 2, 3, 9), marker=0xFE)
+
+
+def feed_all(reassembler, chunks):
+    frames = []
+    for chunk in chunks:
+        frames.extend(reassembler.feed(chunk))
+    return frames
+
+
+def test_whole_frame():
+    reassembler = FrameReassembler()
+    assert reassembler.feed(FRAME) == [FRAME]
+    assert reassembler.pending == 0
+
+
+def framed():
+    """A reassembler that has seen a checksummed frame"""
+    reassembler = FrameReassembler()
+    assert reassembler.feed(OTHER) == [OTHER]
+    assert reassembler.framed
+    return reassembler
+
+
+@pytest.mark.parametrize('split', range(1, len(FRAME)))
+def test_frame_split_across_notifications(split):
+    reassembler = framed()
+    assert reassembler.feed(FRAME[:split]) == []
+    assert reassembler.pending == split
+    assert reassembler.feed(FRAME[split:]) == [FRAME]
+
+
+def test_byte_at_a_time():
+    reassembler = FrameReassembler()
+    stream = FRAME + OTHER
+    assert feed_all(reassembler, [stream[i:i + 1] for i in range(len(stream))]) == [FRAME, OTHER]
+
+
+def test_merged_frames_in_one_notification():
+    reassembler = FrameReassembler()
+    assert reassembler.feed(FRAME + OTHER + FRAME[:5]) == [FRAME, OTHER]
+    assert reassembler.feed(FRAME[5:]) == [FRAME]
+    assert reassembler.frames == 3
+
+
+def test_junk_between_frames_is_skipped():
+    reassembler = FrameReassembler()
+    assert reassembler.feed(b'\x00\x11\x22' + FRAME + b'\x33' + OTHER) == [FRAME, OTHER]
+    assert reassembler.skipped_bytes == 4
+
+
+def test_bad_checksum_resyncs_on_next_frame():
+    corrupt = bytearray(FRAME)
+    corrupt[-1] ^= 0xFF
+    reassembler = FrameReassembler()
+    assert reassembler.feed(bytes(corrupt) + OTHER) == [OTHER]
+    assert reassembler.bad_checksums >= 1
+    assert reassembler.pending == 0
+
+
+def test_marker_inside_junk_does_not_swallow_frame():
+    reassembler = FrameReassembler()
+    # A stray marker 3 bytes before a real frame overlaps it
+    assert reassembler.feed(b'\x00\xfd\x01\x02' + FRAME) == [FRAME]
+
+
+def test_short_unframed_reading_passes_through():
+    short = bytes.fromhex('fd7800500048')
+    reassembler = FrameReassembler()
+    assert reassembler.feed(short) == [short]
+    assert reassembler.feed(short) == [short]
+    assert reassembler.unframed == 2
+    assert reassembler.pending == 0
+    assert not reassembler.framed
+
+
+@pytest.mark.parametrize('split', range(6, len(FRAME)))
+def test_split_first_frame_is_learned(split):
+    # Before any checksummed frame, the head of a split frame is
+    # indistinguishable from a short reading and goes out as one
+    reassembler = FrameReassembler()
+    assert reassembler.feed(FRAME[:split]) == [FRAME[:split]]
+    assert reassembler.feed(FRAME[split:]) == []
+    assert reassembler.framed
+    assert reassembler.skipped_bytes == 0
+    # From then on a split frame waits for its rest
+    assert reassembler.feed(OTHER[:split]) == []
+    assert reassembler.feed(OTHER[split:]) == [OTHER]
+
+
+def test_split_first_frame_with_zeroed_time_is_learned():
+    live = encode_ihealth_frame(118, 76, 64)
+    reassembler = FrameReassembler()
+    assert reassembler.feed(live[:6]) == [live[:6]]
+    assert reassembler.feed(live[6:]) == []
+    assert reassembler.framed
+
+
+def test_framed_stream_buffers_short_head():
+    reassembler = framed()
+    assert reassembler.feed(bytes.fromhex('fd7800500048')) == []
+    assert reassembler.pending == 6
+
+
+def test_short_fragment_waits_for_rest():
+    reassembler = FrameReassembler()
+    # Too short to decode on its own: buffered as the start of a frame
+    assert reassembler.feed(FRAME[:4]) == []
+    assert reassembler.unframed == 0
+    assert reassembler.feed(FRAME[4:]) == [FRAME]
+
+
+def test_reset_drops_partial_frame():
+    reassembler = framed()
+    reassembler.feed(FRAME[:7])
+    reassembler.reset()
+    assert reassembler.pending == 0
+    assert reassembler.framed
+    assert reassembler.feed(OTHER) == [OTHER]
+
+
+def test_ring_wraps_around():
+    reassembler = FrameReassembler(capacity=32)
+    assert reassembler.feed(OTHER) == [OTHER]
+    stream = (FRAME + OTHER) * 20
+    chunks = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+    assert feed_all(reassembler, chunks) == [FRAME, OTHER] * 20
+
+
+def test_capacity_must_be_power_of_two():
+    with pytest.raises(ValueError):
+        FrameReassembler(capacity=48)
+    with pytest.raises(ValueError):
+        FrameReassembler(capacity=16)
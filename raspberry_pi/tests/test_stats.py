@@ -0,0 +1,95 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from stats import StatsEngine
+from store import MeasurementStore
+
+DAY = 86400.0
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MeasurementStore(str(tmp_path / 'measurements.db'))
+    yield store
+    store.close()
+
+
+def readings(count=60, seed=7):
+    """Live readings over 40 days, with a history download of older ones mixed in"""
+    rng = random.Random(seed)
+    now = time.time()
+    live = [now - 40 * DAY + i * (40 * DAY / count) for i in range(count)]
+    history = [rng.uniform(now - 35 * DAY, now) for _ in range(count // 2)]
+    # History records arrive late: after the live readings measured after them
+    order = live[:count // 2] + history + live[count // 2:]
+    return [
+        ('AA', ts, rng.randint(100, 160), rng.randint(60, 100), rng.randint(50, 100))
+        for ts in order
+    ]
+
+
+def live_engine(tmp_path, rows):
+    engine = StatsEngine(str(tmp_path / 'live.json'))
+    for row in rows:
+        engine.update(*row)
+    return engine
+
+
+def test_out_of_order_readings_count_in_windows(tmp_path):
+    now = time.time()
+    engine = StatsEngine(str(tmp_path / 'stats.json'))
+    engine.update('AA', now - 60, 120, 80, 70)
+    engine.update('AA', now - 3600, 140, 90, 80)  # late
+    engine.update('AA', now - 10 * DAY, 130, 85, 75)  # late, 30d only
+    snapshot = engine.snapshot('AA')
+    assert snapshot['count'] == 3
+    assert snapshot['7d']['count'] == 2
+    assert snapshot['7d']['systolic']['mean'] == 130.0
+    assert snapshot['30d']['count'] == 3
+    # The trend only follows the newest reading
+    assert snapshot['trend'] == {'systolic': 120, 'diastolic': 80, 'pulse': 70}
+
+
+def test_late_readings_match_catch_up(tmp_path, store):
+    rows = readings()
+    live = live_engine(tmp_path, rows)
+    store.append_many([
+        {'address': a, 'ts': ts, 'timestamp': ts, 'systolic': s, 'diastolic': d, 'pulse': p}
+        for a, ts, s, d, p in rows
+    ])
+    store.flush()
+
+    restarted = StatsEngine(str(tmp_path / 'restarted.json'), store=store)
+    asyncio.run(restarted.catch_up())
+    expected, actual = live.snapshot('AA'), restarted.snapshot('AA')
+    assert actual == expected
+    assert expected['7d']['count'] > 0
+    assert expected['30d']['count'] > expected['7d']['count']
+
+
+def test_checkpoint_then_catch_up_matches(tmp_path, store):
+    rows = readings(seed=11)
+    half = len(rows) // 2
+
+    async def run():
+        first = StatsEngine(str(tmp_path / 'stats.json'), store=store)
+        await first.catch_up()
+        for address, ts, s, d, p in rows[:half]:
+            store.append({'address': address, 'ts': ts, 'timestamp': ts,
+                          'systolic': s, 'diastolic': d, 'pulse': p})
+            first.update(address, ts, s, d, p)
+        await first.checkpoint()
+        # Stored after the checkpoint, then a crash
+        for address, ts, s, d, p in rows[half:]:
+            store.append({'address': address, 'ts': ts, 'timestamp': ts,
+                          'systolic': s, 'diastolic': d, 'pulse': p})
+        store.flush()
+        second = StatsEngine(str(tmp_path / 'stats.json'), store=store)
+        assert second.loaded
+        await second.catch_up()
+        return second.snapshot('AA')
+
+    assert asyncio.run(run()) == live_engine(tmp_path, rows).snapshot('AA')
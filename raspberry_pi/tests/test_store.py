@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pytest
+
+from store import MeasurementStore
+
+# 2025-03-01 00:00 local time, and one reading per hour after it
+BASE = datetime(2025, 3, 1).timestamp()
+HOUR = 3600.0
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MeasurementStore(str(tmp_path / 'measurements.db'))
+    yield store
+    store.close()
+
+
+def reading(address, ts, systolic, diastolic=80, pulse=70, **extra):
+    return dict(address=address, ts=ts, systolic=systolic, diastolic=diastolic,
+                pulse=pulse, timestamp=ts, **extra)
+
+
+def fill(store, address='AA', count=10, start=BASE):
+    store.append_many([reading(address, start + i * HOUR, 110 + i) for i in range(count)])
+    store.flush()
+
+
+def test_page_walks_every_row_once(store):
+    fill(store, count=10)
+    seen, after = [], None
+    while True:
+        rows, after = store.page(limit=3, after=after)
+        seen.extend(r['systolic'] for r in rows)
+        if after is None:
+            break
+    assert seen == list(range(110, 120))
+
+
+def test_page_orders_equal_timestamps_by_id(store):
+    store.append_many([reading('AA', BASE, 120 + i) for i in range(5)])
+    store.flush()
+    first, after = store.page(limit=2)
+    rest, end = store.page(limit=10, after=after)
+    assert [r['systolic'] for r in first + rest] == [120, 121, 122, 123, 124]
+    assert end is None
+
+
+def test_page_filters_by_address_and_range(store):
+    fill(store, 'AA', count=10)
+    fill(store, 'BB', count=10)
+    rows, after = store.page(address='BB', start=BASE + 2 * HOUR, end=BASE + 5 * HOUR)
+    assert [r['systolic'] for r in rows] == [112, 113, 114]
+    assert {r['address'] for r in rows} == {'BB'}
+    assert after is None
+
+
+def test_page_of_exact_limit_returns_cursor(store):
+    fill(store, count=4)
+    rows, after = store.page(limit=4)
+    assert len(rows) == 4 and after is not None
+    assert store.page(limit=4, after=after) == ([], None)
+
+
+def test_aggregate_hourly_buckets(store):
+    fill(store, count=3)
+    buckets = store.aggregate(HOUR)
+    assert [b['count'] for b in buckets] == [1, 1, 1]
+    assert [b['systolic']['max'] for b in buckets] == [110, 111, 112]
+
+
+def test_aggregate_min_max_mean(store):
+    store.append_many([
+        reading('AA', BASE + 60, 120, 70, 60),
+        reading('AA', BASE + 120, 130, 90, 80),
+        reading('AA', BASE + 180, 141, 86, 71),
+    ])
+    store.flush()
+    (bucket,) = store.aggregate(HOUR, address='AA')
+    assert bucket['count'] == 3
+    assert bucket['systolic'] == {'min': 120, 'max': 141, 'mean': 130.3}
+    assert bucket['diastolic'] == {'min': 70, 'max': 90, 'mean': 82.0}
+    assert bucket['pulse'] == {'min': 60, 'max': 80, 'mean': 70.3}
+
+
+def test_aggregate_daily_buckets_follow_utc_offset(store):
+    fill(store, count=48)
+    offset = datetime.fromtimestamp(BASE).astimezone().utcoffset().total_seconds()
+    buckets = store.aggregate(86400, utc_offset=offset)
+    assert [b['count'] for b in buckets] == [24, 24]
+    assert buckets[0]['start'] == datetime.fromtimestamp(BASE).isoformat()
+
+
+def test_aggregate_range_and_empty(store):
+    fill(store, count=10)
+    buckets = store.aggregate(HOUR, start=BASE + 8 * HOUR)
+    assert sum(b['count'] for b in buckets) == 2
+    assert store.aggregate(HOUR, address='nobody') == []
+
+
+def test_history_copy_of_a_reading_is_stored_once(store):
+    measured_at = datetime(2025, 3, 1, 8, 30).isoformat()
+    store.append(reading('AA', BASE, 125, measured_at=measured_at))
+    store.append(reading('AA', BASE + 50, 125, measured_at=measured_at, source='history'))
+    store.flush()
+    assert store.count() == 1
@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import backend as backend_module
+import wire
+from broadcaster import Broadcaster
+
+
+def note(n):
+    return {'type': 'note', 'n': n}
+
+
+def test_log_numbers_messages_from_one():
+    log = wire.MessageLog(capacity=4)
+    assert log.last_seq == 0
+    assert [log.append(note(n)).seq for n in range(3)] == [1, 2, 3]
+    assert log.last_seq == 3
+    # Control messages are per connection and never take a number
+    assert wire.control({'type': 'resync'}).seq == 0
+    assert log.last_seq == 3
+
+
+def test_payload_carries_seq():
+    entry = wire.MessageLog().append(note(1))
+    assert json.loads(entry.payload('json')) == {'type': 'note', 'n': 1, 'seq': 1}
+    assert wire.decode_binary(entry.payload('binary'))['seq'] == 1
+
+
+def test_since_within_ring():
+    log = wire.MessageLog(capacity=4)
+    for n in range(3):
+        log.append(note(n))
+    assert [e.seq for e in log.since(0)] == [1, 2, 3]
+    assert [e.seq for e in log.since(1)] == [2, 3]
+    assert log.since(3) == []
+
+
+def test_since_refuses_gaps():
+    log = wire.MessageLog(capacity=4)
+    for n in range(10):
+        log.append(note(n))
+    # 7..10 remain: resuming from 6 is still exact, from 5 it is not
+    assert [e.seq for e in log.since(6)] == [7, 8, 9, 10]
+    assert log.since(5) is None
+    assert log.since(0) is None
+    # A position from before a server restart
+    assert log.since(11) is None
+
+
+def test_restart_at_forgets_ring():
+    log = wire.MessageLog(capacity=4)
+    for n in range(3):
+        log.append(note(n))
+    log.restart_at(100)
+    assert log.since(2) is None
+    assert log.append(note(0)).seq == 101
+    assert [e.seq for e in log.since(100)] == [101]
+
+
+async def _session(broadcaster, query, before, after):
+    """
+    Publish ``before`` messages, connect to /ws with ``query``, publish
+    ``after`` more, and return everything the client receives
+    """
+    app = web.Application()
+    app.router.add_get('/ws', backend_module.websocket_handler)
+    async with TestClient(TestServer(app)) as client:
+        for n in range(before):
+            broadcaster.publish(note(n))
+        ws = await client.ws_connect('/ws', params=query)
+        received = [json.loads((await ws.receive()).data) for _ in range(2)]
+        for n in range(after):
+            broadcaster.publish(note(before + n))
+        while True:
+            received.append(json.loads((await ws.receive(timeout=5)).data))
+            if received[-1].get('seq') == broadcaster.log.last_seq:
+                break
+        await ws.close()
+        await broadcaster.close()
+    return received
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    broadcaster = Broadcaster(replay_size=4)
+    monkeypatch.setattr(backend_module.backend, 'broadcaster', broadcaster)
+    return broadcaster
+
+
+def test_resume_replays_missed_messages(broadcaster):
+    received = asyncio.run(_session(broadcaster, {'resume': '3'}, before=6, after=2))
+    hello, status, *stream = received
+    assert hello['type'] == 'hello' and hello['last_seq'] == 6
+    assert status['type'] == 'status'
+    # Everything after 3, once each and in order, then the live messages
+    assert [m['seq'] for m in stream] == [4, 5, 6, 7, 8]
+    assert [m['n'] for m in stream] == [3, 4, 5, 6, 7]
+
+
+def test_resume_from_evicted_seq_resyncs(broadcaster):
+    received = asyncio.run(_session(broadcaster, {'resume': '1'}, before=10, after=2))
+    _, _, resync, *stream = received
+    # 2..6 have left the ring: no partial replay, the client must reload
+    assert resync == {'type': 'resync', 'last_seq': 10, 'seq': 0}
+    assert [m['seq'] for m in stream] == [11, 12]
+
+
+def test_connect_without_resume_gets_only_new_messages(broadcaster):
+    received = asyncio.run(_session(broadcaster, {}, before=3, after=2))
+    assert [m['seq'] for m in received[2:]] == [4, 5]
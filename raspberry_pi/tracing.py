@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Health Pad - Reading Traces
+Where each reading spent its time between the BLE callback and the screen
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON-lines export; unset disables it
+DEFAULT_EXPORT_PATH = os.environ.get('HEALTHPAD_TRACE_EXPORT')
+
+
+class Trace:
+    """
+    Spans for one measurement, relative to its ingest time
+
+    All times are time.monotonic() seconds. ``ingest`` is when the
+    notification that completed the frame reached measurement_callback.
+    Client sends are added by the broadcaster after the trace is
+    finished, so a trace keeps growing for as long as sends are pending.
+    """
+
+    __slots__ = ('trace_id', 'address', 'ingest', 'received_at', 'spans', 'sends')
+
+    def __init__(self, trace_id, address, ingest):
+        self.trace_id = trace_id
+        self.address = address
+        self.ingest = ingest
+        self.received_at = time.time() - (time.monotonic() - ingest)
+        self.spans = []
+        self.sends = []
+
+    def span(self, name, start, end):
+        self.spans.append((name, start, end))
+
+    def send(self, client, queued, sent):
+        self.sends.append((client, queued, sent))
+
+    @property
+    def end(self):
+        last = max((end for _, _, end in self.spans), default=self.ingest)
+        return max(last, max((sent for _, _, sent in self.sends), default=last))
+
+    def to_dict(self):
+        def ms(t):
+            return round((t - self.ingest) * 1000, 3)
+
+        return {
+            'trace_id': self.trace_id,
+            'address': self.address,
+            'received_at': self.received_at,
+            'total_ms': ms(self.end),
+            'spans': [
+                {'name': name, 'start_ms': ms(start), 'duration_ms': round((end - start) * 1000, 3)}
+                for name, start, end in self.spans
+            ],
+            'sends': [
+                {'client': client, 'queued_ms': ms(queued), 'sent_ms': ms(sent)}
+                for client, queued, sent in self.sends
+            ],
+        }
+
+
+class Tracer:
+    """
+    Keeps the last ``capacity`` traces and optionally exports them
+
+    Exported traces are written once they are ``export_delay`` seconds
+    old, by which time every client send has completed or timed out.
+    """
+
+    def __init__(self, capacity=1024, export_path=DEFAULT_EXPORT_PATH, export_delay=6.0):
+        self.traces = deque(maxlen=capacity)
+        self.export_path = export_path
+        self.export_delay = export_delay
+        self._pending = deque()
+        self._ids = itertools.count(1)
+        self._task = None
+
+    def begin(self, address, ingest):
+        """A new trace with the next trace ID"""
+        return Trace(next(self._ids), address, ingest)
+
+    def finish(self, trace):
+        self.traces.append(trace)
+        if self.export_path:
+            self._pending.append(trace)
+
+    def query(self, address=None, min_ms=None, limit=100):
+        """Newest-first trace dicts, optionally only the slow ones"""
+        result = []
+        for trace in reversed(self.traces):
+            if address is not None and trace.address != address:
+                continue
+            if min_ms is not None and (trace.end - trace.ingest) * 1000 < min_ms:
+                continue
+            result.append(trace.to_dict())
+            if len(result) >= limit:
+                break
+        return result
+
+    def export(self, everything=False):
+        """Append traces that are old enough to the export file"""
+        if not self._pending:
+            return
+        cutoff = time.monotonic() - self.export_delay
+        lines = []
+        while self._pending and (everything or self._pending[0].ingest <= cutoff):
+            lines.append(json.dumps(self._pending.popleft().to_dict()))
+        if not lines:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.export_path)), exist_ok=True)
+            with open(self.export_path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+        except OSError as e:
+            logger.warning("Could not export traces: %s", e)
+
+    async def _export_loop(self):
+        while True:
+            await asyncio.sleep(1.0)
+            self.export()
+
+    def start(self):
+        if self.export_path and self._task is None:
+            self._task = asyncio.create_task(self._export_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.export_path:
+            self.export(everything=True)
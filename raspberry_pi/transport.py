@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Health Pad - BLE Transport
+Selects the scanner/client classes: real bleak or the simulator
+"""
+
+import os
+
+# Set by use(); modules call transport.Scanner(...) / transport.Client(...)
+# at connect time, so switching transports also affects code that is
+# already imported.
+Scanner = None
+Client = None
+name = None
+
+TRANSPORTS = ('bleak', 'sim')
+DEFAULT = os.environ.get('HEALTHPAD_TRANSPORT', 'bleak')
+
+
+def use(transport):
+    """Switch to ``'bleak'`` or ``'sim'`` (simulated KN-550BT cuffs)"""
+    global Scanner, Client, name
+    if transport == 'bleak':
+        from bleak import BleakScanner, BleakClient
+        Scanner, Client = BleakScanner, BleakClient
+    elif transport == 'sim':
+        from simulator import SimulatedScanner, SimulatedClient
+        Scanner, Client = SimulatedScanner, SimulatedClient
+    else:
+        raise ValueError(f"Unknown transport {transport!r}; use one of {TRANSPORTS}")
+    name = transport
+
+
+# In fast-start mode bleak is imported later, in the background, once the
+# web server is up (backend.start_ble); until then Scanner/Client are None
+if os.environ.get('HEALTHPAD_FAST_START') != '1':
+    use(DEFAULT)
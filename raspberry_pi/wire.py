@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Health Pad - WebSocket Wire Format
+Sequence-numbered messages, a replay ring, and the compact binary encoding
+
+Every broadcast gets the next sequence number. JSON clients see it as a
+top-level "seq" field; binary clients get it in the frame header.
+Per-connection control messages (hello, resync) carry seq 0.
+
+    header       <B Q      kind, seq
+    measurement  <H H B B d d B  systolic, diastolic, pulse, category code,
+                                 timestamp, measured_at (NaN if unknown),
+                                 address length, then the UTF-8 address
+    json         the UTF-8 JSON message follows the header
+
+All integers are little-endian. Category codes index the "categories"
+list sent in the hello message (see classification.CATEGORIES), so the
+name and colour strings are never repeated per reading.
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import struct
+from collections import deque
+
+from classification import CATEGORIES, LEVEL_CODES
+from store import epoch_seconds
+
+FORMATS = ('json', 'binary')
+
+KIND_MEASUREMENT = 0x01
+KIND_JSON = 0x7F
+
+_HEADER = struct.Struct('<BQ')
+_MEASUREMENT = struct.Struct('<HHBBddB')
+
+
+def encode_binary(seq, message):
+    """One message as a binary frame"""
+    if message.get('type') == 'measurement':
+        data = message['data']
+        address = data['address'].encode()
+        measured_at = data.get('measured_at')
+        return b''.join((
+            _HEADER.pack(KIND_MEASUREMENT, seq),
+            _MEASUREMENT.pack(
+                data['systolic'], data['diastolic'], data['pulse'],
+                LEVEL_CODES[data['classification']['level']],
+                epoch_seconds(data['timestamp']),
+                math.nan if measured_at is None else epoch_seconds(measured_at),
+                len(address)
+            ),
+            address,
+        ))
+    return _HEADER.pack(KIND_JSON, seq) + json.dumps(message).encode()
+
+
+def decode_binary(frame):
+    """Inverse of encode_binary (for clients, tools and tests)"""
+    kind, seq = _HEADER.unpack_from(frame)
+    if kind == KIND_JSON:
+        message = json.loads(bytes(frame[_HEADER.size:]))
+        message['seq'] = seq
+        return message
+    if kind != KIND_MEASUREMENT:
+        raise ValueError(f"Unknown frame kind {kind:#x}")
+    systolic, diastolic, pulse, code, ts, measured_at, length = (
+        _MEASUREMENT.unpack_from(frame, _HEADER.size)
+    )
+    start = _HEADER.size + _MEASUREMENT.size
+    address = bytes(frame[start:start + length]).decode()
+    return {
+        'type': 'measurement',
+        'seq': seq,
+        'address': address,
+        'data': {
+            'address': address,
+            'systolic': systolic,
+            'diastolic': diastolic,
+            'pulse': pulse,
+            'classification': CATEGORIES[code],
+            'timestamp': ts,
+            'measured_at': None if math.isnan(measured_at) else measured_at,
+        },
+    }
+
+
+class Entry:
+    """A published message, encoded lazily and at most once per format"""
+
+    __slots__ = ('seq', 'message', '_json', '_binary', '_sse')
+
+    def __init__(self, seq, message):
+        self.seq = seq
+        self.message = message
+        self._json = None
+        self._binary = None
+        self._sse = None
+
+    def payload(self, fmt):
+        """'json' (str), 'binary' (bytes) or 'sse' (one event, as bytes)"""
+        if fmt == 'binary':
+            if self._binary is None:
+                self._binary = encode_binary(self.seq, self.message)
+            return self._binary
+        if self._json is None:
+            self._json = json.dumps(dict(self.message, seq=self.seq))
+        if fmt == 'sse':
+            if self._sse is None:
+                # Built from the JSON payload, so SSE never re-serializes
+                event = self.message.get('type', 'message')
+                event_id = f"id: {self.seq}\n" if self.seq else ''
+                self._sse = f"{event_id}event: {event}\ndata: {self._json}\n\n".encode()
+            return self._sse
+        return self._json
+
+
+def control(message):
+    """
+    An unnumbered entry (seq 0) for per-connection messages
+
+    Control messages such as hello and resync are not part of the
+    replayable stream; they report the stream position as "last_seq".
+    """
+    return Entry(0, message)
+
+
+def hello(fmt, last_seq):
+    """First message on every connection: format, position and category table"""
+    return control({
+        'type': 'hello',
+        'format': fmt,
+        'last_seq': last_seq,
+        'categories': CATEGORIES,
+    })
+
+
+class MessageLog:
+    """
+    Numbers published messages and keeps the last ``capacity`` of them
+
+    A client that reconnects with the last sequence number it saw gets
+    exactly the messages it missed, as long as they are still in the ring.
+    """
+
+    def __init__(self, capacity=1024):
+        self.entries = deque(maxlen=capacity)
+        self.last_seq = 0
+        self.closed = False
+        # One future shared by every waiter, resolved on the next append
+        self._changed = None
+
+    def append(self, message):
+        self.last_seq += 1
+        entry = Entry(self.last_seq, message)
+        self.entries.append(entry)
+        self._wake()
+        return entry
+
+    def _wake(self):
+        if self._changed is not None:
+            if not self._changed.done():
+                self._changed.set_result(None)
+            self._changed = None
+
+    async def wait(self, seq, timeout):
+        """
+        Like since(), but waits up to ``timeout`` seconds for something new
+
+        Returns [] on timeout or once the log is closed. Idle waiters share
+        a single future, so each costs one suspended coroutine.
+        """
+        missed = self.since(seq)
+        if missed != [] or self.closed:
+            return missed
+        if self._changed is None:
+            self._changed = asyncio.get_running_loop().create_future()
+        try:
+            # shield: one waiter timing out must not cancel the shared future
+            await asyncio.wait_for(asyncio.shield(self._changed), timeout)
+        except asyncio.TimeoutError:
+            return []
+        return self.since(seq)
+
+    def restart_at(self, seq):
+        """
+        Number the next message ``seq + 1`` and forget the replay ring
+
+        Web workers use this to follow the shared reading ring's numbering
+        (see multiproc.py); clients from before the jump get a resync.
+        """
+        self.entries.clear()
+        self.last_seq = seq
+
+    def close(self):
+        """Release every waiter (server shutdown)"""
+        self.closed = True
+        self._wake()
+
+    def since(self, seq):
+        """
+        Entries after ``seq``, oldest first
+
+        None when the gap can no longer be filled: the missed messages
+        have left the ring, or ``seq`` is from before a server restart.
+        """
+        if seq > self.last_seq:
+            return None
+        if seq == self.last_seq:
+            return []
+        oldest = self.entries[0].seq if self.entries else self.last_seq + 1
+        if seq < oldest - 1:
+            return None
+        # Sequence numbers are contiguous, so the position is arithmetic
+        return list(itertools.islice(self.entries, seq - oldest + 1, None))